@@ -1,4 +1,5 @@
 import os
+import socket
 
 from dotenv import load_dotenv
 
@@ -10,3 +11,98 @@ ALGORITHM = os.getenv("ALGORITHM")
 DATABASE_URL = os.getenv("DATABASE_URL")
 DATABASE_NAME = os.getenv("DATABASE_NAME")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
+
+# Password hashing
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+BCRYPT_MAX_WORKERS = int(os.getenv("BCRYPT_MAX_WORKERS", os.cpu_count() or 1))
+LOGIN_MAX_CONCURRENCY = int(os.getenv("LOGIN_MAX_CONCURRENCY", 32))
+
+# Metrics in the Prometheus text format at METRICS_PATH
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")
+
+# Rate limits as token buckets: a sustained rate and a burst; a rate of 0 disables the limit.
+# "memory" limits each worker separately, "mongo" shares the buckets between workers
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", 100000))
+RATE_LIMIT_SOCKET_MESSAGES_PER_SECOND = float(os.getenv("RATE_LIMIT_SOCKET_MESSAGES_PER_SECOND", 5))
+RATE_LIMIT_SOCKET_MESSAGES_BURST = int(os.getenv("RATE_LIMIT_SOCKET_MESSAGES_BURST", 20))
+RATE_LIMIT_USER_MESSAGES_PER_SECOND = float(os.getenv("RATE_LIMIT_USER_MESSAGES_PER_SECOND", 10))
+RATE_LIMIT_USER_MESSAGES_BURST = int(os.getenv("RATE_LIMIT_USER_MESSAGES_BURST", 40))
+RATE_LIMIT_LOGIN_PER_MINUTE = float(os.getenv("RATE_LIMIT_LOGIN_PER_MINUTE", 10))
+RATE_LIMIT_LOGIN_BURST = int(os.getenv("RATE_LIMIT_LOGIN_BURST", 10))
+RATE_LIMIT_LOGIN_IP_PER_MINUTE = float(os.getenv("RATE_LIMIT_LOGIN_IP_PER_MINUTE", 60))
+RATE_LIMIT_LOGIN_IP_BURST = int(os.getenv("RATE_LIMIT_LOGIN_IP_BURST", 60))
+
+# Cache of authenticated users, keyed by access token
+AUTH_CACHE_MAX_SIZE = int(os.getenv("AUTH_CACHE_MAX_SIZE", 10000))
+AUTH_CACHE_TTL_SECONDS = int(os.getenv("AUTH_CACHE_TTL_SECONDS", 300))
+
+# MongoDB connection pool, shared by the whole process
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 100))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 10))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", 300000))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 5000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", 20000))
+MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "")  # e.g. "zstd,zlib"; empty disables compression
+
+# Message history pagination
+MESSAGE_PAGE_SIZE = int(os.getenv("MESSAGE_PAGE_SIZE", 50))
+MESSAGE_PAGE_SIZE_MAX = int(os.getenv("MESSAGE_PAGE_SIZE_MAX", 200))
+ROOM_PREVIEW_MESSAGES = int(os.getenv("ROOM_PREVIEW_MESSAGES", 20))
+
+# Conversation list
+INBOX_PAGE_SIZE = int(os.getenv("INBOX_PAGE_SIZE", 50))
+INBOX_PREVIEW_LENGTH = int(os.getenv("INBOX_PREVIEW_LENGTH", 100))
+# Read receipts are written at most once per interval per user and room
+READ_RECEIPT_FLUSH_INTERVAL_MS = int(os.getenv("READ_RECEIPT_FLUSH_INTERVAL_MS", 1000))
+
+# Message search
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", 20))
+# Newest postings read per query term; bounds the cost of a search however long the history is
+SEARCH_MAX_CANDIDATES = int(os.getenv("SEARCH_MAX_CANDIDATES", 1000))
+SEARCH_MAX_QUERY_TERMS = int(os.getenv("SEARCH_MAX_QUERY_TERMS", 8))
+
+# Room membership cache; other workers see membership changes once their entry expires
+ROOM_MEMBERS_CACHE_MAX_SIZE = int(os.getenv("ROOM_MEMBERS_CACHE_MAX_SIZE", 10000))
+ROOM_MEMBERS_CACHE_TTL_SECONDS = int(os.getenv("ROOM_MEMBERS_CACHE_TTL_SECONDS", 60))
+
+# Media uploads
+MEDIA_DIRECTORY = os.getenv("MEDIA_DIRECTORY", "media")
+MEDIA_MAX_UPLOAD_BYTES = int(os.getenv("MEDIA_MAX_UPLOAD_BYTES", 25 * 1024 * 1024))
+MEDIA_CHUNK_SIZE = int(os.getenv("MEDIA_CHUNK_SIZE", 1024 * 1024))
+MEDIA_PROCESS_WORKERS = int(os.getenv("MEDIA_PROCESS_WORKERS", 2))
+MEDIA_PROCESS_QUEUE_SIZE = int(os.getenv("MEDIA_PROCESS_QUEUE_SIZE", 100))
+MEDIA_THUMBNAIL_SIZE = int(os.getenv("MEDIA_THUMBNAIL_SIZE", 320))
+
+# Identifies this worker process in shared stores
+WORKER_ID = os.getenv("WORKER_ID", f"{socket.gethostname()}:{os.getpid()}")
+
+# Socket.IO fan-out between workers: "memory" (single worker), "inprocess" or "mongo"
+SOCKETIO_MESSAGE_QUEUE = os.getenv("SOCKETIO_MESSAGE_QUEUE", "memory")
+SOCKETIO_CHANNEL = os.getenv("SOCKETIO_CHANNEL", "socketio")
+SOCKETIO_PUBSUB_SIZE_BYTES = int(os.getenv("SOCKETIO_PUBSUB_SIZE_BYTES", 16 * 1024 * 1024))
+# Frames waiting per Socket.IO connection (0 sends inline) and what happens when a slow client's queue is full:
+# "drop_oldest", "coalesce" (drop the oldest frame of the same event) or "disconnect"
+SOCKETIO_OUTBOUND_QUEUE_SIZE = int(os.getenv("SOCKETIO_OUTBOUND_QUEUE_SIZE", 256))
+SOCKETIO_SLOW_CONSUMER_POLICY = os.getenv("SOCKETIO_SLOW_CONSUMER_POLICY", "drop_oldest")
+# Path of the MessagePack Socket.IO endpoint for binary clients, next to the JSON one at socket.io; empty disables it
+SOCKETIO_MSGPACK_PATH = os.getenv("SOCKETIO_MSGPACK_PATH", "msgpack/socket.io")
+# Also send REST messages to the room as chat_response events, for clients that predate broadcast_message
+SOCKETIO_LEGACY_CHAT_RESPONSE = os.getenv("SOCKETIO_LEGACY_CHAT_RESPONSE", "false").lower() == "true"
+
+# Online presence: "memory" (single worker), "inprocess" or "mongo" (shared between workers)
+PRESENCE_BACKEND = os.getenv("PRESENCE_BACKEND", "memory")
+PRESENCE_HEARTBEAT_SECONDS = int(os.getenv("PRESENCE_HEARTBEAT_SECONDS", 10))
+PRESENCE_TTL_SECONDS = int(os.getenv("PRESENCE_TTL_SECONDS", 30))
+# Presence changes sent to subscribed rooms are coalesced over this window, so a quick reconnect sends nothing
+PRESENCE_DELTA_INTERVAL_MS = int(os.getenv("PRESENCE_DELTA_INTERVAL_MS", 500))
+PRESENCE_SUBSCRIBE_MAX_ROOMS = int(os.getenv("PRESENCE_SUBSCRIBE_MAX_ROOMS", 100))
+
+# Write-behind message persistence
+MESSAGE_BATCH_SIZE = int(os.getenv("MESSAGE_BATCH_SIZE", 100))
+MESSAGE_FLUSH_INTERVAL_MS = int(os.getenv("MESSAGE_FLUSH_INTERVAL_MS", 5))
+MESSAGE_QUEUE_SIZE = int(os.getenv("MESSAGE_QUEUE_SIZE", 10000))
+MESSAGE_ENQUEUE_TIMEOUT_MS = int(os.getenv("MESSAGE_ENQUEUE_TIMEOUT_MS", 1000))
+MESSAGE_WRITE_JOURNAL = os.getenv("MESSAGE_WRITE_JOURNAL", "false").lower() == "true"
@@ -1,17 +1,21 @@
+import asyncio
+import re
 from datetime import datetime, timezone
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple, Set
 
 from bson import ObjectId
-from fastapi import HTTPException, status
 from fastapi.encoders import jsonable_encoder
 from motor.motor_asyncio import AsyncIOMotorCollection
 from passlib.context import CryptContext
+from pymongo import ASCENDING, DESCENDING, UpdateOne, UpdateMany
+from pymongo.errors import BulkWriteError
 
+from app.config import BCRYPT_ROUNDS, INBOX_PREVIEW_LENGTH
 from app.models import UserInDB, MessageInDB, ChatRoomInDB
 from app.schemas import UserCreateSchema, MessageCreateSchema, ChatRoomCreateSchema, UserResponseSchema
 
 # Setup password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 
 
 def hash_password(password: str) -> str:
@@ -24,6 +28,11 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verifies a password and returns a new hash if the stored one uses outdated settings."""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
 # Helper functions to convert MongoDB documents to Pydantic models
 def document_to_dict(document: dict) -> Dict[str, Any]:
     """Converts MongoDB document to a dictionary."""
@@ -58,11 +67,12 @@ def chat_room_from_doc(doc) -> ChatRoomInDB:
 
 
 # User CRUD operations
-async def create_user(db: AsyncIOMotorCollection, user: UserCreateSchema) -> UserResponseSchema:
-    """Create a new user in the database."""
+async def create_user(db: AsyncIOMotorCollection, user: UserCreateSchema,
+                      hashed_password: str) -> UserResponseSchema:
+    """Create a new user in the database with an already hashed password."""
     user_dict = jsonable_encoder(user)
     user_dict = dict(user_dict)
-    user_dict['hashed_password'] = hash_password(user.password)  # Hash the password
+    user_dict['hashed_password'] = hashed_password
     del user_dict['password']  # Remove the plain password
     result = await db.insert_one(user_dict)
     return UserResponseSchema(**document_to_dict(await db.find_one({"_id": result.inserted_id})))
@@ -86,36 +96,114 @@ async def get_user_by_username(db: AsyncIOMotorCollection, username: str) -> Opt
     return None
 
 
-async def verify_user_password(db: AsyncIOMotorCollection, email: str, password: str) -> bool:
-    """Verify a user's password."""
-    user = await get_user_by_email(db, email)
-    if user and verify_password(password, user.hashed_password):
-        return True
-    return False
+async def update_user_password_hash(db: AsyncIOMotorCollection, email: str, hashed_password: str) -> None:
+    """Replace a user's stored password hash."""
+    await db.update_one({"email": email}, {"$set": {"hashed_password": hashed_password}})
 
 
 # Message CRUD operations
-async def create_message(db: AsyncIOMotorCollection, room_id: str, message: MessageCreateSchema) -> MessageInDB:
-    """Create a new message in a specific chat room."""
+def message_document(room_id: str, message: MessageCreateSchema) -> Dict[str, Any]:
+    """Build the MongoDB document for a new message in a specific chat room."""
     message_dict = jsonable_encoder(message)
     message_dict = dict(message_dict)
     message_dict['timestamp'] = datetime.now(timezone.utc)
     message_dict['_id'] = ObjectId()  # Generate a unique ObjectId for the message
-    update_result = await db.update_one(
-        {"_id": ObjectId(room_id)},
-        {"$push": {"messages": message_dict}}
-    )
-    if update_result.modified_count == 0:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat room not found")
+    message_dict['room_id'] = ObjectId(room_id)
+    return message_dict
+
+
+async def create_message(db: AsyncIOMotorCollection, room_id: str, message: MessageCreateSchema) -> MessageInDB:
+    """Create a new message in a specific chat room.
+
+    Messages are stored as their own documents in the messages collection, so
+    the chat room document keeps a constant size no matter how much history it has.
+    """
+    message_dict = message_document(room_id, message)
+    await db.insert_one(message_dict)
     return message_from_doc(message_dict)
 
 
-async def get_messages(db: AsyncIOMotorCollection, room_id: str) -> List[MessageInDB]:
-    """Get all messages in a specific chat room."""
-    room = await db.find_one({"_id": ObjectId(room_id)})
-    if room and "messages" in room:
-        return [message_from_doc(msg) for msg in room["messages"]]
-    return []
+async def increment_message_count(db: AsyncIOMotorCollection, room_id: str, count: int = 1) -> None:
+    """Keep the chat room's message counter in step with the messages collection."""
+    await db.update_one({"_id": ObjectId(room_id)}, {"$inc": {"message_count": count}})
+
+
+async def insert_message_batch(db_messages: AsyncIOMotorCollection, db_chat_rooms: AsyncIOMotorCollection,
+                               documents: List[Dict[str, Any]],
+                               db_inbox: Optional[AsyncIOMotorCollection] = None,
+                               db_message_terms: Optional[AsyncIOMotorCollection] = None) -> Set[int]:
+    """Insert a batch of message documents and bump each room's counter once.
+
+    With ``db_inbox`` the members' inbox entries are brought up to date in the same pass, and with
+    ``db_message_terms`` the messages are added to the search index.
+    Returns the positions of the documents that could not be written.
+    """
+    failed = await insert_message_documents(db_messages, documents)
+    written = [document for index, document in enumerate(documents) if index not in failed]
+    await apply_message_batch_updates(db_chat_rooms, written, db_inbox, db_message_terms)
+    return failed
+
+
+async def insert_message_documents(db_messages: AsyncIOMotorCollection, documents: List[Dict[str, Any]]) -> Set[int]:
+    """Insert message documents; returns the positions of the documents that could not be written."""
+    try:
+        await db_messages.insert_many(documents, ordered=False)
+    except BulkWriteError as e:
+        return {error["index"] for error in e.details.get("writeErrors", [])}
+    return set()
+
+
+async def apply_message_batch_updates(db_chat_rooms: AsyncIOMotorCollection, documents: List[Dict[str, Any]],
+                                      db_inbox: Optional[AsyncIOMotorCollection] = None,
+                                      db_message_terms: Optional[AsyncIOMotorCollection] = None):
+    """Bring room counters, inbox entries and the search index up to date with written messages."""
+    counts: Dict[ObjectId, int] = {}
+    for document in documents:
+        counts[document["room_id"]] = counts.get(document["room_id"], 0) + 1
+    if not counts:
+        return
+    await db_chat_rooms.bulk_write(
+        [UpdateOne({"_id": room_id}, {"$inc": {"message_count": count}}) for room_id, count in counts.items()],
+        ordered=False
+    )
+    if db_inbox is not None:
+        await db_inbox.bulk_write(inbox_last_message_updates(documents) + inbox_unread_updates(documents),
+                                  ordered=False)
+    if db_message_terms is not None:
+        await index_message_terms(db_message_terms, documents)
+
+
+async def get_message_documents(db: AsyncIOMotorCollection, room_id: str, before: Optional[ObjectId] = None,
+                                after: Optional[ObjectId] = None, limit: Optional[int] = None) -> List[dict]:
+    """Get the raw message documents in a specific chat room, oldest first.
+
+    ``before`` and ``after`` are exclusive message id bounds. With a ``limit`` and no ``after``
+    the newest matching messages are returned, otherwise the oldest ones.
+    """
+    query: Dict[str, Any] = {"room_id": ObjectId(room_id)}
+    id_range = {}
+    if before is not None:
+        id_range["$lt"] = before
+    if after is not None:
+        id_range["$gt"] = after
+    if id_range:
+        query["_id"] = id_range
+
+    newest_first = limit is not None and after is None
+    cursor = db.find(query).sort("_id", DESCENDING if newest_first else ASCENDING)
+    if limit is not None:
+        cursor = cursor.limit(limit)
+    documents = [document async for document in cursor]
+    if newest_first:
+        documents.reverse()
+    return documents
+
+
+async def get_messages(db: AsyncIOMotorCollection, room_id: str, before: Optional[ObjectId] = None,
+                       after: Optional[ObjectId] = None, limit: Optional[int] = None) -> List[MessageInDB]:
+    """Get messages in a specific chat room, oldest first; see ``get_message_documents``."""
+    documents = await get_message_documents(db, room_id, before=before, after=after, limit=limit)
+    return [message_from_doc(document) for document in documents]
 
 
 # Chat Room CRUD operations
@@ -123,22 +211,203 @@ async def create_chat_room(db: AsyncIOMotorCollection, chat_room: ChatRoomCreate
     """Create a new chat room."""
     chat_room_dict = jsonable_encoder(chat_room)
     chat_room_dict = dict(chat_room_dict)
-    chat_room_dict['messages'] = []  # Ensure messages field is initialized
+    chat_room_dict['message_count'] = 0
     result = await db.insert_one(chat_room_dict)
     return chat_room_from_doc(await db.find_one({"_id": result.inserted_id}))
 
 
 async def get_chat_room_by_id(db: AsyncIOMotorCollection, room_id: str) -> Optional[ChatRoomInDB]:
-    """Get a chat room by its ID."""
-    room = await db.find_one({"_id": ObjectId(room_id)})
+    """Get a chat room by its ID.
+
+    Any legacy embedded ``messages`` array is projected out; messages live in the messages collection.
+    """
+    room = await db.find_one({"_id": ObjectId(room_id)}, {"messages": 0})
     if room:
         return chat_room_from_doc(room)
     return None
 
 
-async def get_private_chats_from_db(db_chat_rooms: AsyncIOMotorCollection, user_id: str) -> List[dict]:
-    cursor = db_chat_rooms.find({"members": user_id, "is_group_chat": False})
-    private_chats = []
-    async for chat in cursor:
-        private_chats.append(chat)
-    return private_chats
+async def get_chat_room_members(db: AsyncIOMotorCollection, room_id: str) -> Optional[List[str]]:
+    """Get only the member list of a chat room, or None if the room does not exist."""
+    room = await db.find_one({"_id": ObjectId(room_id)}, {"members": 1, "_id": 0})
+    if room:
+        return room.get("members", [])
+    return None
+
+
+# Inbox CRUD operations
+def inbox_entry(room_id: ObjectId, member: str, chat_room: ChatRoomInDB) -> Dict[str, Any]:
+    """Build a member's inbox entry for a chat room that has no messages yet."""
+    peers = [other for other in chat_room.members if other != member]
+    return {
+        "user": member,
+        "room_id": room_id,
+        "name": chat_room.name,
+        "is_group_chat": chat_room.is_group_chat,
+        "peer": None if chat_room.is_group_chat or not peers else peers[0],
+        "last_message": None,
+        "last_activity_id": room_id,  # Sort key: the latest message id, or the room id until the first message
+        "last_read_id": room_id,  # Read cursor: the latest message id the member has read
+        "unread_count": 0,
+    }
+
+
+async def create_inbox_entries(db: AsyncIOMotorCollection, chat_room: ChatRoomInDB) -> None:
+    """Add a chat room to the inbox of each of its members, keeping entries that already exist."""
+    room_id = ObjectId(chat_room.id)
+    await db.bulk_write([
+        UpdateOne({"user": member, "room_id": room_id}, {"$setOnInsert": inbox_entry(room_id, member, chat_room)},
+                  upsert=True)
+        for member in set(chat_room.members)
+    ], ordered=False)
+
+
+def inbox_last_message_updates(documents: List[Dict[str, Any]]) -> List[UpdateMany]:
+    """Inbox updates that make each room's latest message in a batch its preview."""
+    latest: Dict[ObjectId, Dict[str, Any]] = {}
+    for document in documents:
+        if document["room_id"] not in latest or document["_id"] > latest[document["room_id"]]["_id"]:
+            latest[document["room_id"]] = document
+
+    updates = []
+    for room_id, document in latest.items():
+        last_message = {
+            "id": document["_id"],
+            "sender": document["sender"],
+            "preview": document["content"][:INBOX_PREVIEW_LENGTH],
+            "timestamp": document["timestamp"],
+        }
+        # Guarded by the id, so a batch that lost a race with a newer one cannot move the entry back
+        updates.append(UpdateMany({"room_id": room_id, "last_activity_id": {"$lt": document["_id"]}},
+                                  {"$set": {"last_message": last_message, "last_activity_id": document["_id"]}}))
+    return updates
+
+
+def inbox_unread_updates(documents: List[Dict[str, Any]]) -> List[UpdateMany]:
+    """Inbox updates that count a batch of messages as unread for every member except their sender."""
+    unread: Dict[Tuple[ObjectId, str], int] = {}
+    for document in documents:
+        key = (document["room_id"], document["sender"])
+        unread[key] = unread.get(key, 0) + 1
+    return [UpdateMany({"room_id": room_id, "user": {"$ne": sender}}, {"$inc": {"unread_count": count}})
+            for (room_id, sender), count in unread.items()]
+
+
+async def count_unread_messages(db_messages: AsyncIOMotorCollection, room_id: ObjectId, email: str,
+                                last_read_id: Optional[ObjectId], up_to: Optional[ObjectId] = None) -> int:
+    """Count the messages after a read cursor that were sent by someone else, up to and including ``up_to``."""
+    query: Dict[str, Any] = {"room_id": room_id, "sender": {"$ne": email}}
+    id_range = {}
+    if last_read_id is not None:
+        id_range["$gt"] = last_read_id
+    if up_to is not None:
+        id_range["$lte"] = up_to
+    if id_range:
+        query["_id"] = id_range
+    return await db_messages.count_documents(query)
+
+
+def read_cursor_update(email: str, room_id: ObjectId, previous_read_id: Optional[ObjectId], last_read_id: ObjectId,
+                       read_count: int) -> UpdateOne:
+    """Move a member's read cursor from ``previous_read_id`` forward and take the messages read off the unread count.
+
+    The update only applies while the stored cursor is still ``previous_read_id``. The count is only ever
+    adjusted with $inc, like new messages do, so a message stored meanwhile still counts as unread.
+    """
+    return UpdateOne({"user": email, "room_id": room_id, "last_read_id": previous_read_id},
+                     {"$set": {"last_read_id": last_read_id}, "$inc": {"unread_count": -read_count}})
+
+
+async def message_in_room(db: AsyncIOMotorCollection, room_id: ObjectId, message_id: ObjectId) -> bool:
+    """Whether a message exists and belongs to a chat room."""
+    return await db.find_one({"_id": message_id, "room_id": room_id}, {"_id": 1}) is not None
+
+
+async def get_latest_message_id(db: AsyncIOMotorCollection, room_id: ObjectId,
+                                up_to: ObjectId) -> Optional[ObjectId]:
+    """Get the id of a chat room's latest message up to and including ``up_to``."""
+    document = await db.find_one({"room_id": room_id, "_id": {"$lte": up_to}}, {"_id": 1},
+                                 sort=[("_id", DESCENDING)])
+    return document["_id"] if document else None
+
+
+async def get_inbox_entries(db: AsyncIOMotorCollection, email: str, is_group_chat: Optional[bool] = None,
+                            before: Optional[ObjectId] = None, limit: Optional[int] = None) -> List[dict]:
+    """Get a user's inbox entries, most recently active first.
+
+    ``before`` is the ``last_activity_id`` of the last entry of the previous page.
+    """
+    query: Dict[str, Any] = {"user": email}
+    if is_group_chat is not None:
+        query["is_group_chat"] = is_group_chat
+    if before is not None:
+        query["last_activity_id"] = {"$lt": before}
+    cursor = db.find(query).sort("last_activity_id", DESCENDING)
+    if limit is not None:
+        cursor = cursor.limit(limit)
+    return [entry async for entry in cursor]
+
+
+# Search CRUD operations
+SEARCH_TERM_PATTERN = re.compile(r"\w+")
+SEARCH_TERM_MIN_LENGTH = 2
+SEARCH_TERM_MAX_LENGTH = 64
+SEARCH_MAX_TERMS_PER_MESSAGE = 256
+
+
+def search_terms(text: str, max_terms: Optional[int] = None) -> List[str]:
+    """Split text into its distinct case-folded words, in order of first appearance."""
+    terms = dict.fromkeys(term[:SEARCH_TERM_MAX_LENGTH] for term in SEARCH_TERM_PATTERN.findall(text.casefold())
+                          if len(term) >= SEARCH_TERM_MIN_LENGTH)
+    return list(terms)[:max_terms]
+
+
+def message_term_documents(documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Postings of the search index: one per distinct word of each message."""
+    return [
+        {"term": term, "room_id": document["room_id"], "message_id": document["_id"]}
+        for document in documents
+        for term in search_terms(document["content"], SEARCH_MAX_TERMS_PER_MESSAGE)
+    ]
+
+
+async def index_message_terms(db: AsyncIOMotorCollection, documents: List[Dict[str, Any]]) -> None:
+    """Add messages to the search index; messages that are already indexed are skipped."""
+    postings = message_term_documents(documents)
+    if not postings:
+        return
+    try:
+        await db.insert_many(postings, ordered=False)
+    except BulkWriteError as e:
+        if any(error["code"] != 11000 for error in e.details.get("writeErrors", [])):
+            raise
+
+
+async def rank_message_ids(db: AsyncIOMotorCollection, terms: List[str], room_ids: List[ObjectId],
+                           max_candidates: int) -> List[Tuple[ObjectId, int]]:
+    """Rank the messages in some rooms that contain any of the terms.
+
+    Only the newest ``max_candidates`` postings of each term are read, so the cost does not grow with
+    the history. Returns (message id, number of terms matched), most terms first, then newest first.
+    """
+    async def postings(term: str) -> List[ObjectId]:
+        cursor = db.find({"term": term, "room_id": {"$in": room_ids}}, {"message_id": 1, "_id": 0})
+        cursor = cursor.sort("message_id", DESCENDING).limit(max_candidates)
+        return [posting["message_id"] async for posting in cursor]
+
+    scores: Dict[ObjectId, int] = {}
+    for message_ids in await asyncio.gather(*(postings(term) for term in terms)):
+        for message_id in message_ids:
+            scores[message_id] = scores.get(message_id, 0) + 1
+    return sorted(scores.items(), key=lambda item: (item[1], item[0]), reverse=True)
+
+
+async def get_messages_by_ids(db: AsyncIOMotorCollection, message_ids: List[ObjectId]) -> List[dict]:
+    """Get message documents in the order of their ids; ids of missing messages are skipped."""
+    documents = {document["_id"]: document async for document in db.find({"_id": {"$in": message_ids}})}
+    return [documents[message_id] for message_id in message_ids if message_id in documents]
+
+
+async def get_inbox_room_ids(db: AsyncIOMotorCollection, email: str) -> List[ObjectId]:
+    """Get the ids of every chat room a user belongs to, from their inbox."""
+    return [entry["room_id"] async for entry in db.find({"user": email}, {"room_id": 1, "_id": 0})]
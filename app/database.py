@@ -1,12 +1,76 @@
-from motor.motor_asyncio import AsyncIOMotorClient
+import asyncio
+from typing import Optional
 
-from app.config import DATABASE_URL, DATABASE_NAME
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
 
-# Initialize the MongoDB client and database
-client = AsyncIOMotorClient(DATABASE_URL)
-db = client[DATABASE_NAME]
+from app.config import DATABASE_URL, DATABASE_NAME, MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, \
+    MONGO_MAX_IDLE_TIME_MS, MONGO_CONNECT_TIMEOUT_MS, MONGO_SERVER_SELECTION_TIMEOUT_MS, MONGO_SOCKET_TIMEOUT_MS, \
+    MONGO_COMPRESSORS, METRICS_ENABLED
+from app.services.metrics import MongoCommandMetrics
+
+# The single MongoDB client shared by HTTP requests and Socket.IO handlers
+client: Optional[AsyncIOMotorClient] = None
+# Event loop the client is bound to; Motor clients cannot be used from another loop
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def create_client() -> AsyncIOMotorClient:
+    """Create a MongoDB client using the pool settings from the configuration."""
+    options = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS,
+    }
+    if MONGO_COMPRESSORS:
+        options["compressors"] = MONGO_COMPRESSORS
+    if METRICS_ENABLED:
+        options["event_listeners"] = [MongoCommandMetrics()]
+    return AsyncIOMotorClient(DATABASE_URL, **options)
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def get_client() -> AsyncIOMotorClient:
+    """Return the shared client, creating it on first use.
+
+    A server worker runs a single event loop, so it gets exactly one client. A new client is
+    only created if the running loop changes, as happens when each test request gets its own loop.
+    """
+    global client, _client_loop
+    loop = _running_loop()
+    if client is not None and loop is not None and _client_loop not in (None, loop):
+        close_mongo_connection()
+    if client is None:
+        client = create_client()
+    if _client_loop is None:
+        _client_loop = loop
+    return client
 
 
 # Function to get the database instance
-def get_database():
-    return db
+def get_database() -> AsyncIOMotorDatabase:
+    return get_client()[DATABASE_NAME]
+
+
+async def connect_to_mongo() -> None:
+    """Create the shared client and open the minimum number of pooled connections."""
+    db = get_database()
+    # Concurrent pings check out separate connections, so the pool is warm before traffic arrives
+    await asyncio.gather(*(db.command("ping") for _ in range(max(MONGO_MIN_POOL_SIZE, 1))))
+
+
+def close_mongo_connection() -> None:
+    """Close the shared client and release its pooled connections."""
+    global client, _client_loop
+    if client is not None:
+        client.close()
+        client = None
+    _client_loop = None
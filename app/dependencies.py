@@ -1,10 +1,13 @@
-from fastapi import Depends, HTTPException
-from fastapi.security import OAuth2PasswordBearer
+from fastapi import Depends, HTTPException, Request
+from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
-from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase, AsyncIOMotorCollection
+from motor.motor_asyncio import AsyncIOMotorDatabase, AsyncIOMotorCollection
 
-from app.config import SECRET_KEY, ALGORITHM, DATABASE_URL, DATABASE_NAME
+from app.config import SECRET_KEY, ALGORITHM
 from app.crud import get_user_by_email
+from app.database import get_database
+from app.services.auth_cache import principal_cache
+from app.services.rate_limiter import rate_limiter
 from app.schemas import TokenDataSchema, UserResponseSchema, UserInDB
 
 # Setup OAuth2 password bearer
@@ -18,15 +21,14 @@ def verify_token(token: str, credentials_exception: HTTPException) -> TokenDataS
         email: str = payload.get("sub")
         if email is None:
             raise credentials_exception
-        return TokenDataSchema(email=email)
+        return TokenDataSchema(email=email, exp=payload.get("exp"))
     except JWTError:
         raise credentials_exception
 
 
 async def get_db() -> AsyncIOMotorDatabase:
-    """Get the database instance."""
-    client = AsyncIOMotorClient(DATABASE_URL)
-    return client[DATABASE_NAME]
+    """Get the database instance from the shared, pooled client."""
+    return get_database()
 
 
 async def get_user_collection(db: AsyncIOMotorDatabase = Depends(get_db)) -> AsyncIOMotorCollection:
@@ -38,7 +40,14 @@ async def get_current_user(
         token: str = Depends(oauth2_scheme),
         db: AsyncIOMotorCollection = Depends(get_user_collection)
 ) -> UserResponseSchema:
-    """Get the current user from the database using the provided token."""
+    """Get the current user from the database using the provided token.
+
+    Users are cached by token, so hot users are authenticated without decoding the token or querying the database.
+    """
+    cached_user = principal_cache.get(token)
+    if cached_user is not None:
+        return cached_user
+
     credentials_exception = HTTPException(
         status_code=401,
         detail="Could not validate credentials",
@@ -48,5 +57,17 @@ async def get_current_user(
     user: UserInDB = await get_user_by_email(db, token_data.email)
     if user is None:
         raise credentials_exception
-    return UserResponseSchema(
-        **user.model_dump())
+    current_user = UserResponseSchema(**user.model_dump())
+    principal_cache.set(token, current_user, token_data.exp)
+    return current_user
+
+
+async def limit_message_rate(current_user: UserResponseSchema = Depends(get_current_user)):
+    """Reject a user sending messages faster than the message rate limit with 429."""
+    await rate_limiter.check([("message", current_user.email)])
+
+
+async def limit_login_rate(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
+    """Reject login attempts beyond the per-address and per-account limits with 429, before any password is hashed."""
+    client_host = request.client.host if request.client else "unknown"
+    await rate_limiter.check([("login_ip", client_host), ("login", form_data.username.lower())])
@@ -0,0 +1,129 @@
+"""Declarative registry of the MongoDB indexes the service relies on.
+
+Indexes are applied at startup. Run ``python -m app.indexes`` to report declared indexes that are
+missing, indexes that have never been used, and known queries that still scan a whole collection.
+"""
+import asyncio
+from typing import Any, Dict, List
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from app.database import get_database
+
+# Indexes per collection
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("email", ASCENDING)], unique=True, name="email_unique"),
+        IndexModel([("username", ASCENDING)], unique=True, name="username_unique"),
+    ],
+    "chat_rooms": [
+        # Multikey index: serves membership lookups and the private chat listing
+        IndexModel([("members", ASCENDING), ("is_group_chat", ASCENDING)], name="members_is_group_chat"),
+    ],
+    "messages": [
+        IndexModel([("room_id", ASCENDING), ("_id", ASCENDING)], name="room_id_id"),
+    ],
+    "inbox": [
+        IndexModel([("user", ASCENDING), ("room_id", ASCENDING)], unique=True, name="user_room_unique"),
+        # Conversation list, most recent first, optionally only private or group chats
+        IndexModel([("user", ASCENDING), ("last_activity_id", DESCENDING)], name="user_last_activity"),
+        IndexModel([("user", ASCENDING), ("is_group_chat", ASCENDING), ("last_activity_id", DESCENDING)],
+                   name="user_is_group_chat_last_activity"),
+        # New messages update every member's entry for the room
+        IndexModel([("room_id", ASCENDING)], name="room_id"),
+    ],
+    "message_terms": [
+        # Search index postings, read newest first per term across the caller's rooms
+        IndexModel([("term", ASCENDING), ("room_id", ASCENDING), ("message_id", DESCENDING)], unique=True,
+                   name="term_room_id_message_id"),
+    ],
+    "presence": [
+        # Connections of crashed workers are removed once their heartbeat lapses
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl"),
+        IndexModel([("worker", ASCENDING)], name="worker"),
+    ],
+    "rate_limits": [
+        # Buckets are dropped once they are full again; they are only ever read by _id
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl"),
+    ],
+}
+
+# Filters of the queries the service runs, checked with explain() for collection scans
+QUERY_SHAPES: Dict[str, List[Dict[str, Any]]] = {
+    "users": [
+        {"email": "user@example.com"},
+        {"username": "user"},
+    ],
+    "chat_rooms": [
+        {"members": "user@example.com"},
+        {"members": "user@example.com", "is_group_chat": False},
+    ],
+    "messages": [
+        {"room_id": ObjectId()},
+    ],
+    "inbox": [
+        {"user": "user@example.com"},
+        {"user": "user@example.com", "is_group_chat": False},
+        {"room_id": ObjectId()},
+    ],
+    "message_terms": [
+        {"term": "hello", "room_id": {"$in": [ObjectId(), ObjectId()]}},
+    ],
+}
+
+
+async def apply_indexes(db: AsyncIOMotorDatabase) -> None:
+    """Create every declared index; existing indexes are left untouched."""
+    for collection_name, indexes in INDEXES.items():
+        try:
+            await db[collection_name].create_indexes(indexes)
+        except OperationFailure as e:
+            # e.g. existing duplicate emails prevent building a unique index
+            print(f"[LOG] Could not create indexes on {collection_name}: {e}")
+
+
+def _plan_stages(plan: Dict[str, Any]) -> List[str]:
+    stages = [plan.get("stage")]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages.extend(_plan_stages(plan[key]))
+    for child in plan.get("inputStages", []):
+        stages.extend(_plan_stages(child))
+    return stages
+
+
+async def report_indexes(db: AsyncIOMotorDatabase) -> Dict[str, Dict[str, List[Any]]]:
+    """Report missing and unused indexes, and query shapes that fall back to a collection scan."""
+    report = {}
+    for collection_name, indexes in INDEXES.items():
+        collection = db[collection_name]
+        existing = await collection.index_information()
+        missing = [index.document["name"] for index in indexes if index.document["name"] not in existing]
+
+        unused = []
+        async for stats in collection.aggregate([{"$indexStats": {}}]):
+            if stats["name"] != "_id_" and stats["accesses"]["ops"] == 0:
+                unused.append(stats["name"])
+
+        collection_scans = []
+        for query in QUERY_SHAPES.get(collection_name, []):
+            explain = await collection.find(query).explain()
+            if "COLLSCAN" in _plan_stages(explain["queryPlanner"]["winningPlan"]):
+                collection_scans.append(query)
+
+        report[collection_name] = {"missing": missing, "unused": unused, "collection_scans": collection_scans}
+    return report
+
+
+async def main():
+    db = get_database()
+    for collection_name, result in (await report_indexes(db)).items():
+        print(f"[LOG] {collection_name}: missing={result['missing']} unused={result['unused']} "
+              f"collection_scans={result['collection_scans']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
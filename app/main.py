@@ -1,18 +1,56 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from socketio import ASGIApp
 
-from app.routers import auth, chat, socketio_routes
-from app.services.connection_manager import sio
+from app.config import SOCKETIO_MSGPACK_PATH, METRICS_ENABLED, METRICS_PATH
+from app.database import get_database, connect_to_mongo, close_mongo_connection
+from app.indexes import apply_indexes
+from app.routers import auth, chat, metrics, socketio_routes
+from app.services.connection_manager import sio, msgpack_sio
+from app.services.media_processor import media_processor
+from app.services.media_storage import MediaUploadLimitMiddleware
+from app.services.message_writer import message_writer
+from app.services.metrics import MetricsMiddleware
+from app.services.password_hasher import password_hasher
+from app.services.presence_subscriptions import presence_subscription_service
+from app.services.read_receipts import read_receipt_service
+from app.services.user_status_service import user_status_service
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open the shared MongoDB connection pool before serving requests
+    await connect_to_mongo()
+    # Make sure every collection is indexed before serving requests
+    await apply_indexes(get_database())
+    user_status_service.start_heartbeat()
+    yield
+    await message_writer.close()
+    await read_receipt_service.close()
+    await presence_subscription_service.close()
+    await user_status_service.stop_heartbeat()
+    close_mongo_connection()
+    password_hasher.shutdown()
+    media_processor.shutdown()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Include the routers
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
 app.include_router(chat.router, prefix="/chat", tags=["chat"])
 app.include_router(socketio_routes.router, prefix="/ws", tags=["socketio"])
+app.add_middleware(MediaUploadLimitMiddleware, path="/chat/upload_media/")
+if METRICS_ENABLED:
+    app.include_router(metrics.router, prefix=METRICS_PATH)
+    app.add_middleware(MetricsMiddleware)
 
 # Attach SocketIO to FastAPI app
 sio_app = ASGIApp(sio, other_asgi_app=app)
+if msgpack_sio is not None:
+    # MessagePack clients connect with path=SOCKETIO_MSGPACK_PATH; everything else goes to the JSON server
+    sio_app = ASGIApp(msgpack_sio, other_asgi_app=sio_app, socketio_path=SOCKETIO_MSGPACK_PATH)
 
 
 @app.get("/")
@@ -0,0 +1,40 @@
+"""Build the inbox entries of chat rooms created before the inbox existed.
+
+Also sets ``is_group_chat`` on rooms that lack it, from their number of members. Unread counts start
+at zero. Run with ``python -m app.migrations.build_inbox`` after ``split_embedded_messages``; entries
+that already exist are left alone, so it can be re-run safely.
+"""
+import asyncio
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import DESCENDING
+
+from app.crud import chat_room_from_doc, create_inbox_entries, inbox_last_message_updates
+from app.database import get_database
+from app.indexes import apply_indexes
+
+
+async def migrate(db: AsyncIOMotorDatabase) -> int:
+    """Create missing inbox entries and return the number of chat rooms processed."""
+    db_chat_rooms = db["chat_rooms"]
+    db_messages = db["messages"]
+    db_inbox = db["inbox"]
+    await apply_indexes(db)
+
+    rooms = 0
+    async for room in db_chat_rooms.find({}, {"messages": 0}):
+        if "is_group_chat" not in room:
+            room["is_group_chat"] = len(set(room.get("members", []))) != 2
+            await db_chat_rooms.update_one({"_id": room["_id"]}, {"$set": {"is_group_chat": room["is_group_chat"]}})
+        await create_inbox_entries(db_inbox, chat_room_from_doc(room))
+
+        latest = await db_messages.find_one({"room_id": room["_id"]}, sort=[("_id", DESCENDING)])
+        if latest is not None:
+            await db_inbox.bulk_write(inbox_last_message_updates([latest]), ordered=False)
+        rooms += 1
+    return rooms
+
+
+if __name__ == "__main__":
+    total = asyncio.run(migrate(get_database()))
+    print(f"[LOG] Built inbox entries for {total} chat rooms")
@@ -0,0 +1,37 @@
+"""Add messages written before message search existed to the search index.
+
+Run with ``python -m app.migrations.build_search_index`` after ``split_embedded_messages``. Messages are
+indexed in batches and postings that already exist are skipped, so it can be re-run safely.
+"""
+import asyncio
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.crud import index_message_terms
+from app.database import get_database
+from app.indexes import apply_indexes
+
+BATCH_SIZE = 1000
+
+
+async def migrate(db: AsyncIOMotorDatabase, batch_size: int = BATCH_SIZE) -> int:
+    """Index every message and return the number of messages processed."""
+    await apply_indexes(db)
+
+    messages = 0
+    batch = []
+    async for message in db["messages"].find({}, {"room_id": 1, "content": 1}):
+        batch.append(message)
+        if len(batch) >= batch_size:
+            await index_message_terms(db["message_terms"], batch)
+            messages += len(batch)
+            batch = []
+    if batch:
+        await index_message_terms(db["message_terms"], batch)
+        messages += len(batch)
+    return messages
+
+
+if __name__ == "__main__":
+    total = asyncio.run(migrate(get_database()))
+    print(f"[LOG] Indexed {total} messages for search")
@@ -0,0 +1,68 @@
+"""Move messages embedded in chat_rooms documents into the messages collection.
+
+Also backfills each chat room's ``message_count``.
+
+Run with ``python -m app.migrations.split_embedded_messages``. The migration keeps
+each message's ``_id``, so it can be re-run safely after an interruption.
+"""
+import asyncio
+from typing import List
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import BulkWriteError
+
+from app.database import get_database
+from app.indexes import apply_indexes
+
+BATCH_SIZE = 1000
+DUPLICATE_KEY_ERROR = 11000
+
+
+async def _insert_batch(db_messages, batch: List[dict]) -> int:
+    """Insert a batch of messages, ignoring ones copied by a previous run."""
+    try:
+        result = await db_messages.insert_many(batch, ordered=False)
+        return len(result.inserted_ids)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(error.get("code") != DUPLICATE_KEY_ERROR for error in errors):
+            raise
+        return e.details.get("nInserted", 0)
+
+
+async def migrate(db: AsyncIOMotorDatabase, batch_size: int = BATCH_SIZE) -> int:
+    """Split every embedded messages array into the messages collection and return the number moved."""
+    db_chat_rooms = db["chat_rooms"]
+    db_messages = db["messages"]
+    await apply_indexes(db)
+
+    moved = 0
+    async for room in db_chat_rooms.find({"messages": {"$exists": True}}, {"messages": 1}):
+        batch = []
+        for message in room.get("messages") or []:
+            message = dict(message)
+            message.setdefault("_id", ObjectId())
+            message["room_id"] = room["_id"]
+            batch.append(message)
+            if len(batch) >= batch_size:
+                moved += await _insert_batch(db_messages, batch)
+                batch = []
+        if batch:
+            moved += await _insert_batch(db_messages, batch)
+
+        # Only drop the embedded array once every message is safely copied
+        await db_chat_rooms.update_one({"_id": room["_id"]}, {"$unset": {"messages": ""}})
+        print(f"[LOG] Migrated messages of chat room {room['_id']}")
+
+    # Backfill the message counter for rooms created before it existed
+    async for room in db_chat_rooms.find({"message_count": {"$exists": False}}, {"_id": 1}):
+        count = await db_messages.count_documents({"room_id": room["_id"]})
+        await db_chat_rooms.update_one({"_id": room["_id"]}, {"$set": {"message_count": count}})
+
+    return moved
+
+
+if __name__ == "__main__":
+    total = asyncio.run(migrate(get_database()))
+    print(f"[LOG] Moved {total} messages into the messages collection")
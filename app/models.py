@@ -40,3 +40,5 @@ class ChatRoomBase(BaseModel):
 class ChatRoomInDB(ChatRoomBase):
     id: str  # MongoDB document ID
     messages: List[MessageInDB] = []  # Messages associated with the chat room
+    message_count: int = 0  # Total number of messages stored for the chat room
+    is_group_chat: bool = True
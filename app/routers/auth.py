@@ -5,11 +5,14 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from jose import jwt
 from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo.errors import DuplicateKeyError
 
 from app.config import SECRET_KEY, ALGORITHM
-from app.crud import create_user, verify_user_password, get_user_by_email, get_user_by_username
-from app.dependencies import get_user_collection, get_current_user
+from app.crud import create_user, get_user_by_email, update_user_password_hash
+from app.dependencies import get_user_collection, get_current_user, limit_login_rate
 from app.schemas import UserCreateSchema, UserResponseSchema, TokenSchema
+from app.services.auth_cache import principal_cache
+from app.services.password_hasher import password_hasher
 
 # Initialize the router
 router = APIRouter()
@@ -28,20 +31,21 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 
-@router.post("/token", response_model=TokenSchema)
-@router.post("/login", response_model=TokenSchema)
+@router.post("/token", response_model=TokenSchema, dependencies=[Depends(limit_login_rate)])
+@router.post("/login", response_model=TokenSchema, dependencies=[Depends(limit_login_rate)])
 async def login_for_access_token(
         form_data: OAuth2PasswordRequestForm = Depends(),
         db: AsyncIOMotorCollection = Depends(get_user_collection)
 ) -> Any:
     user = await get_user_by_email(db, form_data.username)
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Incorrect email or password",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    if not await verify_user_password(db, user.email, form_data.password):
+    password_valid = False
+    if user:
+        password_valid, new_hash = await password_hasher.verify_and_update(form_data.password, user.hashed_password)
+        if password_valid and new_hash:
+            # The stored hash uses outdated settings, e.g. a lower BCRYPT_ROUNDS
+            await update_user_password_hash(db, user.email, new_hash)
+            principal_cache.invalidate_user(user.email)
+    if not password_valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -59,21 +63,17 @@ async def register_user(
         user: UserCreateSchema,
         db: AsyncIOMotorCollection = Depends(get_user_collection)
 ) -> UserResponseSchema:
-    db_user_email = await get_user_by_email(db, user.email)
-    if db_user_email:
+    hashed_password = await password_hasher.hash(user.password)
+    try:
+        # The unique email and username indexes reject duplicates atomically
+        new_user = await create_user(db, user, hashed_password)
+    except DuplicateKeyError as e:
+        key_pattern = (e.details or {}).get("keyPattern", {})
+        field = "username" if "username" in key_pattern or "username_unique" in str(e) else "email"
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email already registered",
+            detail=f"{field.capitalize()} already registered",
         )
-
-    db_user_username = await get_user_by_username(db, user.username)
-    if db_user_username:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Username already registered",
-        )
-
-    new_user = await create_user(db, user)
     return new_user
 
 
@@ -1,33 +1,39 @@
-import datetime
-from typing import List
+import mimetypes
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, status, UploadFile, File
-from fastapi.encoders import jsonable_encoder
+from fastapi import APIRouter, Depends, status, UploadFile, File, Query, Header
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
-from app.dependencies import get_db, get_current_user
+from app.config import MESSAGE_PAGE_SIZE, MESSAGE_PAGE_SIZE_MAX, SOCKETIO_LEGACY_CHAT_RESPONSE, INBOX_PAGE_SIZE, \
+    SEARCH_PAGE_SIZE
+from app.dependencies import get_db, get_current_user, limit_message_rate
 from app.models import UserInDB
 from app.schemas import ChatRoomCreateSchema, ChatRoomResponseSchema, MessageCreateSchema, MessageResponseSchema, \
-    PrivateChatResponseSchema
+    MessagePageResponseSchema, PrivateChatResponseSchema, MediaResponseSchema, InboxPageResponseSchema, \
+    ReadReceiptSchema, ReadReceiptResponseSchema, SearchPageResponseSchema
 from app.services.chat_service import ChatService
-from app.services.connection_manager import connection_manager, sio
-from app.services.user_status_service import UserStatusService
+from app.services.connection_manager import connection_manager
+from app.services.media_processor import media_processor
+from app.services.media_storage import media_storage
+from app.services.membership_service import membership_service
+from app.services.read_receipts import read_receipt_service
+from app.services.message_writer import message_writer
+from app.services.user_status_service import user_status_service
 
 router = APIRouter()
 
 
-def custom_jsonable_encoder(obj):
-    if isinstance(obj, datetime.datetime):
-        return obj.isoformat()  # Converts datetime to ISO 8601 format with +00:00
-    if isinstance(obj, datetime.date):
-        return obj.isoformat()  # Converts date to ISO 8601 format
-    return jsonable_encoder(obj)
-
-
-def get_chat_service(db: AsyncIOMotorDatabase = Depends(get_db), user_status_service: UserStatusService = Depends()):
+def get_chat_service(db: AsyncIOMotorDatabase = Depends(get_db)):
     db_chat_rooms = db["chat_rooms"]
-    return ChatService(db_chat_rooms=db_chat_rooms, connection_manager=connection_manager,
-                       user_status_service=user_status_service)
+    db_messages = db["messages"]
+    db_inbox = db["inbox"]
+    db_message_terms = db["message_terms"]
+    return ChatService(db_chat_rooms=db_chat_rooms, db_messages=db_messages, db_inbox=db_inbox,
+                       db_message_terms=db_message_terms, connection_manager=connection_manager,
+                       user_status_service=user_status_service, message_writer=message_writer,
+                       membership_service=membership_service, media_storage=media_storage,
+                       media_processor=media_processor, read_receipt_service=read_receipt_service)
 
 
 @router.get("/private_chats/", response_model=List[PrivateChatResponseSchema])
@@ -40,6 +46,20 @@ async def get_private_chats(
     return private_chats
 
 
+@router.get("/inbox/", response_model=InboxPageResponseSchema)
+async def get_inbox(
+        type: Optional[str] = Query(None, pattern="^(private|group)$", description="Only private or group chats"),
+        before: Optional[str] = Query(None, description="next_cursor of the previous page"),
+        limit: int = Query(INBOX_PAGE_SIZE, ge=1, le=MESSAGE_PAGE_SIZE_MAX),
+        current_user: UserInDB = Depends(get_current_user),
+        chat_service: ChatService = Depends(get_chat_service)
+):
+    """Get the user's conversations with their latest message, most recently active first."""
+    is_group_chat = None if type is None else type == "group"
+    inbox = await chat_service.get_inbox(current_user, is_group_chat=is_group_chat, before=before, limit=limit)
+    return inbox
+
+
 @router.post("/chat_rooms/", response_model=ChatRoomResponseSchema, status_code=status.HTTP_201_CREATED)
 async def create_new_chat_room(
         chat_room: ChatRoomCreateSchema,
@@ -55,16 +75,20 @@ async def create_new_chat_room(
 @router.get("/chat_rooms/{room_id}", response_model=ChatRoomResponseSchema)
 async def get_chat_room(
         room_id: str,
+        include: Optional[str] = Query(None, description="Set to 'messages' to return the full message history"),
+        limit: Optional[int] = Query(None, ge=1, description="Maximum number of latest messages to return"),
         chat_service: ChatService = Depends(get_chat_service),
         current_user: UserInDB = Depends(get_current_user)
 ):
-    """Get a specific chat room by its ID."""
-    chat_room = await chat_service.get_chat_room(room_id, current_user)
+    """Get a specific chat room by its ID with its latest messages."""
+    include_messages = include is not None and "messages" in include.split(",")
+    chat_room = await chat_service.get_chat_room(room_id, current_user, include_messages=include_messages,
+                                                 limit=limit)
     return chat_room
 
 
 @router.post("/chat_rooms/{room_id}/messages", response_model=MessageResponseSchema,
-             status_code=status.HTTP_201_CREATED)
+             status_code=status.HTTP_201_CREATED, dependencies=[Depends(limit_message_rate)])
 async def create_new_message(
         room_id: str,
         message: MessageCreateSchema,
@@ -72,30 +96,99 @@ async def create_new_message(
         current_user: UserInDB = Depends(get_current_user)
 ):
     """Create a new message in a specific chat room."""
-    new_message = await chat_service.create_new_message(room_id, message, current_user)
-
-    # Emit the message to the chat room via Socket.IO
-    await sio.emit('chat_response', {'room_id': room_id, 'message': custom_jsonable_encoder(message)}, room=room_id)
-
+    # The chat service also broadcasts the message to the room
+    new_message = await chat_service.create_new_message(room_id, message, current_user,
+                                                        legacy_chat_response=SOCKETIO_LEGACY_CHAT_RESPONSE)
     return new_message
 
 
-@router.get("/chat_rooms/{room_id}/messages", response_model=List[MessageResponseSchema])
+# Returned as ORJSONResponse, so the page is encoded once and the response_model only documents it
+@router.get("/chat_rooms/{room_id}/messages", response_model=MessagePageResponseSchema,
+            response_class=ORJSONResponse)
 async def get_all_messages(
         room_id: str,
+        before: Optional[str] = Query(None, description="Message ID or ISO 8601 timestamp to page back from"),
+        after: Optional[str] = Query(None, description="Message ID or ISO 8601 timestamp to page forward from"),
+        limit: int = Query(MESSAGE_PAGE_SIZE, ge=1, le=MESSAGE_PAGE_SIZE_MAX),
+        chat_service: ChatService = Depends(get_chat_service),
+        current_user: UserInDB = Depends(get_current_user)
+):
+    """Get one page of messages in a specific chat room."""
+    page = await chat_service.get_all_messages(room_id, current_user, before=before, after=after, limit=limit)
+    return ORJSONResponse(page)
+
+
+@router.post("/chat_rooms/{room_id}/read", response_model=ReadReceiptResponseSchema,
+             status_code=status.HTTP_202_ACCEPTED)
+async def mark_read(
+        room_id: str,
+        receipt: ReadReceiptSchema,
         chat_service: ChatService = Depends(get_chat_service),
         current_user: UserInDB = Depends(get_current_user)
 ):
-    """Get all messages in a specific chat room."""
-    messages = await chat_service.get_all_messages(room_id, current_user)
-    return messages
+    """Mark a chat room as read up to a message."""
+    read_receipt = await chat_service.mark_read(room_id, receipt.message_id, current_user)
+    return read_receipt
 
 
-@router.post("/upload_media/")
+@router.get("/search", response_model=SearchPageResponseSchema, response_class=ORJSONResponse)
+async def search_messages(
+        q: str = Query(..., min_length=1, max_length=256, description="Words to search for"),
+        room_id: Optional[str] = Query(None, description="Only search this chat room"),
+        cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+        limit: int = Query(SEARCH_PAGE_SIZE, ge=1, le=MESSAGE_PAGE_SIZE_MAX),
+        current_user: UserInDB = Depends(get_current_user),
+        chat_service: ChatService = Depends(get_chat_service)
+):
+    """Search the messages of the chat rooms the user belongs to, best matches first."""
+    page = await chat_service.search_messages(current_user, q, room_id=room_id, cursor=cursor, limit=limit)
+    return ORJSONResponse(page)
+
+
+@router.post("/upload_media/", response_model=MediaResponseSchema)
 async def upload_media(
         file: UploadFile = File(...),
         chat_service: ChatService = Depends(get_chat_service)  # Injecting ChatService dependency
 ):
-    """Upload a media file."""
-    file_url = await chat_service.save_media(file)
-    return {"file_url": file_url}
+    """Upload a media file; previews are generated in the background."""
+    media = await chat_service.save_media(file)
+    return media
+
+
+@router.get("/media/{media_id}/status", response_model=MediaResponseSchema)
+async def get_media_status(
+        media_id: str,
+        chat_service: ChatService = Depends(get_chat_service),
+        current_user: UserInDB = Depends(get_current_user)
+):
+    """Get the preview processing status of a media file."""
+    media = await chat_service.get_media_status(media_id)
+    return media
+
+
+@router.get("/media/{media_id}")
+async def download_media(
+        media_id: str,
+        range_header: Optional[str] = Header(None, alias="Range"),
+        current_user: UserInDB = Depends(get_current_user)
+):
+    """Download a media file, or part of it when a Range header is sent."""
+    path, size = media_storage.stat(media_id)
+    byte_range = media_storage.parse_range(range_header, size)
+    headers = {
+        "Accept-Ranges": "bytes",
+        # Media ids are content hashes, so a file never changes and resumed downloads need no If-Range check
+        "ETag": f'"{media_id}"',
+        "Cache-Control": "private, max-age=31536000, immutable",
+    }
+    if byte_range is None:
+        start, end, status_code = 0, size - 1, status.HTTP_200_OK
+    else:
+        start, end = byte_range
+        status_code = status.HTTP_206_PARTIAL_CONTENT
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    # Previews are named with their type; uploads are stored under their hash alone
+    media_type = mimetypes.guess_type(media_id)[0] or await media_processor.mime_type(media_id, path)
+    return StreamingResponse(media_storage.iter_file(path, start, end), status_code=status_code, headers=headers,
+                             media_type=media_type)
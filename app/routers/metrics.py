@@ -0,0 +1,74 @@
+from typing import Callable, Dict
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.services.auth_cache import principal_cache
+from app.services.connection_manager import connection_manager
+from app.services.media_processor import media_processor
+from app.services.membership_service import membership_service
+from app.services.message_writer import message_writer
+from app.services.metrics import REGISTRY, CallbackMetric
+from app.services.presence_subscriptions import presence_subscription_service
+from app.services.rate_limiter import rate_limiter
+from app.services.user_status_service import user_status_service
+
+router = APIRouter()
+
+CACHES = {"principal": principal_cache, "room_members": membership_service}
+
+
+def server_name(server) -> str:
+    return "msgpack" if server is connection_manager.msgpack_sio else "json"
+
+
+def per_cache(stat: str) -> Callable[[], Dict[tuple, float]]:
+    return lambda: {(name,): cache.stats()[stat] for name, cache in CACHES.items()}
+
+
+def outbound(stat: str) -> Callable[[], float]:
+    return lambda: connection_manager.outbound_stats().get(stat, 0)
+
+
+# Values the services count already, read when scraped
+CallbackMetric("chat_socketio_connections", "Socket.IO connections held by this worker.",
+               lambda: len(user_status_service.sid_to_user))
+CallbackMetric("chat_online_users", "Users with a Socket.IO connection to this worker.",
+               lambda: len(user_status_service.active_connections))
+CallbackMetric("chat_socketio_rooms", "Socket.IO rooms on this worker by server.",
+               lambda: {(server_name(server),): len(server.manager.rooms.get('/', {}))
+                        for server in connection_manager.servers}, ("server",))
+CallbackMetric("chat_socketio_outbound_queued_frames", "Frames waiting in outbound queues.", outbound("queued"))
+CallbackMetric("chat_socketio_outbound_max_depth", "Frames in the deepest outbound queue.", outbound("max_depth"))
+for stat in ("sent", "dropped", "coalesced", "disconnected"):
+    CallbackMetric(f"chat_socketio_outbound_{stat}_total", f"Outbound queue frames {stat}." if stat != "disconnected"
+                   else "Slow Socket.IO clients disconnected.", outbound(stat), type="counter")
+CallbackMetric("chat_cache_hits_total", "Cache hits by cache.", per_cache("hits"), ("cache",), type="counter")
+CallbackMetric("chat_cache_misses_total", "Cache misses by cache.", per_cache("misses"), ("cache",), type="counter")
+CallbackMetric("chat_cache_hit_ratio", "Share of cache lookups that hit, by cache.", per_cache("hit_ratio"), ("cache",))
+CallbackMetric("chat_cache_size", "Entries by cache.", per_cache("size"), ("cache",))
+CallbackMetric("chat_rate_limit_allowed_total", "Calls allowed by rate limit.",
+               lambda: {(name,): stats["allowed"] for name, stats in rate_limiter.stats().items()}, ("limit",),
+               type="counter")
+CallbackMetric("chat_rate_limit_rejected_total", "Calls rejected by rate limit.",
+               lambda: {(name,): stats["rejected"] for name, stats in rate_limiter.stats().items()}, ("limit",),
+               type="counter")
+CallbackMetric("chat_messages_written_total", "Messages written by the message writer.",
+               lambda: message_writer.messages_written, type="counter")
+CallbackMetric("chat_message_batches_written_total", "Message batches written by the message writer.",
+               lambda: message_writer.batches_written, type="counter")
+CallbackMetric("chat_message_batch_update_failures_total",
+               "Written message batches whose room, inbox or search index updates failed.",
+               lambda: message_writer.update_failures, type="counter")
+CallbackMetric("chat_presence_events_total", "Presence events sent to subscribed rooms.",
+               lambda: presence_subscription_service.events, type="counter")
+CallbackMetric("chat_presence_changes_coalesced_total", "Presence changes merged into a pending one.",
+               lambda: presence_subscription_service.coalesced, type="counter")
+CallbackMetric("chat_media_jobs_pending", "Media processing jobs waiting or running.",
+               lambda: media_processor.stats()["pending"])
+
+
+@router.get("", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    """Metrics in the Prometheus text format."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
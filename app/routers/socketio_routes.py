@@ -1,33 +1,51 @@
 from datetime import datetime, timezone
+from functools import partial
+from typing import List, Optional
 
+import socketio
+from bson import ObjectId
 from fastapi import APIRouter, HTTPException
 
-from app.database import db
+from app.crud import get_inbox_room_ids
+from app.database import get_database
 from app.dependencies import get_current_user
+from app.routers.chat import get_chat_service
+from app.schemas import MessageCreateSchema
 from app.services.connection_manager import SocketIOMessage
-from app.services.connection_manager import connection_manager, sio
-from app.services.user_status_service import UserStatusService
+from app.services.connection_manager import connection_manager
+from app.services.presence_subscriptions import presence_subscription_service
+from app.services.rate_limiter import rate_limiter
+from app.services.user_status_service import user_status_service
 
 router = APIRouter()
 
-user_status_service = UserStatusService()
 
+def on_every_server(handler):
+    """Register an event handler on the JSON and the MessagePack server; it gets the server first."""
+    for server in connection_manager.servers:
+        server.on(handler.__name__, partial(handler, server))
+    return handler
 
-@sio.event
-async def connect(sid, environ):
+
+@on_every_server
+async def connect(sio: socketio.AsyncServer, sid, environ):
     token = environ.get('HTTP_AUTHORIZATION', None)
     if token is None:
         return False  # Reject the connection if no token is provided
 
     token = token.replace('Bearer ', '')
     try:
-        users_collection = db['users']
+        users_collection = get_database()['users']
         user = await get_current_user(token, users_collection)
     except HTTPException:
         return False  # Reject the connection if token validation fails
 
     # Store user information with the connection
-    await connection_manager.connect(user.email, sid)
+    await sio.save_session(sid, {'user': user})
+    await connection_manager.connect(user.email, sid, server=sio)
+    # Join the user's chat rooms, so the connection receives their broadcasts
+    for room_id in await get_inbox_room_ids(get_database()['inbox'], user.email):
+        await sio.enter_room(sid, str(room_id))
 
     # Mark the user as online
     user_status_service.set_user_online(user.email, sid)
@@ -35,38 +53,115 @@ async def connect(sid, environ):
     print(f"[LOG] User {user.email} connected. SID: {sid}")
 
 
-@sio.event
-async def disconnect(sid):
-    user_email = None
-    for email, sids in user_status_service.active_connections.items():
-        if sid in sids:
-            user_email = email
-            break
+@on_every_server
+async def disconnect(sio: socketio.AsyncServer, sid):
+    user_email = user_status_service.set_sid_offline(sid)
 
     if user_email:
-        # Logic to determine the room_id should be added here
-        room_id = "room_id_example"
-        await connection_manager.disconnect(room_id, sid)
-
-        user_status_service.set_user_offline(user_email, sid)
+        # Each connection joins the room named after its user on connect
+        await connection_manager.disconnect(user_email, sid, server=sio)
 
         print(f"[LOG] User {user_email} disconnected. SID: {sid}")
 
 
-@sio.event
-async def chat_message(sid, data):
+@on_every_server
+async def chat_message(sio: socketio.AsyncServer, sid, data):
+    session = await sio.get_session(sid)
+    # Per connection and per user, shared with messages sent over REST
+    retry_after = await rate_limiter.hit_all([("socket_message", sid), ("message", session['user'].email)])
+    if retry_after > 0:
+        await sio.emit('error', {'message': 'Rate limit exceeded', 'retry_after': round(retry_after, 3)}, room=sid)
+        return
+
     room = data.get('room')
     message_content = data.get('message')
-    if room and message_content:
+    if not (room and message_content):
+        await sio.emit('error', {'message': 'Invalid data'}, room=sid)
+        return
+
+    if not ObjectId.is_valid(room):
+        # Not a chat room ID, so the message is only relayed and not stored
         message = SocketIOMessage(sender=sid, content=message_content, timestamp=datetime.now(timezone.utc))
         await connection_manager.broadcast(room, message)
         await sio.emit('chat_response', {'status': 'received', 'message': message_content}, room=sid)
-    else:
+        return
+
+    message = MessageCreateSchema(sender=session['user'].email, content=message_content,
+                                  timestamp=datetime.now(timezone.utc).isoformat())
+    try:
+        # Goes through the same write-behind pipeline and broadcast as REST messages
+        new_message = await get_chat_service(get_database()).create_new_message(room, message, session['user'])
+    except HTTPException as e:
+        await sio.emit('error', {'message': e.detail}, room=sid)
+        return
+    # Acknowledge once the message is stored
+    await sio.emit('chat_response', {'status': 'received', 'message': message_content, 'id': new_message.id},
+                   room=sid)
+
+
+@on_every_server
+async def mark_read(sio: socketio.AsyncServer, sid, data):
+    room = data.get('room') if isinstance(data, dict) else None
+    message_id = data.get('message_id') if isinstance(data, dict) else None
+    if not (room and message_id and isinstance(room, str) and isinstance(message_id, str)):
         await sio.emit('error', {'message': 'Invalid data'}, room=sid)
+        return
+
+    session = await sio.get_session(sid)
+    try:
+        # Acknowledgements are coalesced, so marking every message while scrolling is cheap
+        await get_chat_service(get_database()).mark_read(room, message_id, session['user'])
+    except HTTPException as e:
+        await sio.emit('error', {'message': e.detail}, room=sid)
 
 
-@sio.event
-async def get_online_users(sid):
-    online_users = user_status_service.online_users  # Accessing the property directly
-    await sio.emit('online_users', list(online_users), room=sid)
+def requested_room_ids(data) -> Optional[List[str]]:
+    """The ``rooms`` of a presence request, or None unless they are a list of room ids."""
+    room_ids = data.get('rooms') if isinstance(data, dict) else None
+    if not isinstance(room_ids, list) or not all(isinstance(room_id, str) for room_id in room_ids):
+        return None
+    return room_ids
 
+
+@on_every_server
+async def subscribe_presence(sio: socketio.AsyncServer, sid, data):
+    room_ids = requested_room_ids(data)
+    if room_ids is None:
+        await sio.emit('error', {'message': 'Invalid data'}, room=sid)
+        return
+
+    session = await sio.get_session(sid)
+    try:
+        snapshots = await presence_subscription_service.subscribe(sio, sid, session['user'].email, room_ids)
+    except HTTPException as e:
+        await sio.emit('error', {'message': e.detail}, room=sid)
+        return
+    # Followed by presence events with only the users who came online or went offline
+    for snapshot in snapshots:
+        await sio.emit('presence_snapshot', snapshot, room=sid)
+
+
+@on_every_server
+async def unsubscribe_presence(sio: socketio.AsyncServer, sid, data):
+    room_ids = requested_room_ids(data)
+    if room_ids is None:
+        await sio.emit('error', {'message': 'Invalid data'}, room=sid)
+        return
+    await presence_subscription_service.unsubscribe(sio, sid, room_ids)
+
+
+@on_every_server
+async def get_online_users(sio: socketio.AsyncServer, sid, data=None):
+    session = await sio.get_session(sid)
+    room_id = data.get('room') if isinstance(data, dict) else None
+    try:
+        if room_id:
+            snapshot = await presence_subscription_service.snapshot(session['user'].email, room_id)
+            online_users = snapshot['online']
+        else:
+            # Only users who share a room with the caller
+            online_users = await presence_subscription_service.get_online_users(session['user'].email)
+    except HTTPException as e:
+        await sio.emit('error', {'message': e.detail}, room=sid)
+        return
+    await sio.emit('online_users', sorted(online_users), room=sid)
@@ -1,4 +1,4 @@
-from typing import Optional, List
+from typing import Optional, List, Dict
 
 from pydantic import BaseModel, EmailStr
 
@@ -46,6 +46,11 @@ class MessageResponseSchema(MessageBaseSchema):
         orm_mode = True
 
 
+class MessagePageResponseSchema(BaseModel):
+    messages: List[MessageResponseSchema]  # One page of messages, oldest first
+    next_cursor: Optional[str] = None  # Pass back as before/after to load the next page
+
+
 # Chat room schemas
 class ChatRoomBaseSchema(BaseModel):
     name: str
@@ -54,11 +59,14 @@ class ChatRoomBaseSchema(BaseModel):
 
 class ChatRoomCreateSchema(ChatRoomBaseSchema):
     members: List[str] = []
+    is_group_chat: Optional[bool] = None  # Inferred from the number of members when not given
 
 
 class ChatRoomResponseSchema(ChatRoomBaseSchema):
     id: str  # MongoDB document ID
-    messages: List[MessageResponseSchema] = []  # List of messages in the chat room
+    messages: List[MessageResponseSchema] = []  # Latest messages in the chat room, oldest first
+    message_count: int = 0  # Total number of messages in the chat room
+    is_group_chat: bool = True
 
     class Config:
         orm_mode = True
@@ -73,6 +81,61 @@ class PrivateChatResponseSchema(BaseModel):
         orm_mode = True
 
 
+class InboxLastMessageSchema(BaseModel):
+    id: str
+    sender: str
+    preview: str  # The start of the message content
+    timestamp: str
+
+
+class InboxEntrySchema(BaseModel):
+    room_id: str
+    name: str
+    is_group_chat: bool
+    peer_email: Optional[str] = None  # The other member of a private chat
+    is_online: Optional[bool] = None  # Whether the peer of a private chat is online
+    last_message: Optional[InboxLastMessageSchema] = None
+    last_read_id: Optional[str] = None  # The latest message the user has read
+    unread_count: int = 0
+
+
+class InboxPageResponseSchema(BaseModel):
+    entries: List[InboxEntrySchema]  # Most recently active conversations first
+    next_cursor: Optional[str] = None  # Pass back as before to load the next page
+
+
+class ReadReceiptSchema(BaseModel):
+    message_id: str  # Message ID or ISO 8601 timestamp the user has read up to
+
+
+class ReadReceiptResponseSchema(BaseModel):
+    room_id: str
+    message_id: str
+
+
+class SearchResultSchema(MessageResponseSchema):
+    room_id: str
+    score: int  # Number of query words the message contains
+
+
+class SearchPageResponseSchema(BaseModel):
+    results: List[SearchResultSchema]  # Best matches first
+    next_cursor: Optional[str] = None  # Pass back as cursor to load the next page
+
+
+# Media schemas
+class MediaResponseSchema(BaseModel):
+    file_url: str
+    media_id: str
+    status: str  # Preview processing: pending, done, failed or skipped
+    status_url: str
+    mime_type: str
+    previews: Dict[str, str] = {}  # Preview variant name -> URL, e.g. "thumbnail"
+    size: Optional[int] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+
+
 # Authentication schemas
 class TokenSchema(BaseModel):
     access_token: str
@@ -81,3 +144,4 @@ class TokenSchema(BaseModel):
 
 class TokenDataSchema(BaseModel):
     email: str
+    exp: Optional[int] = None  # Token expiry as a UNIX timestamp
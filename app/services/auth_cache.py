@@ -0,0 +1,81 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+
+from app.config import AUTH_CACHE_MAX_SIZE, AUTH_CACHE_TTL_SECONDS
+from app.schemas import UserResponseSchema
+
+
+class PrincipalCache:
+    """LRU cache of authenticated users keyed by access token.
+
+    Entries expire after ``ttl_seconds`` or when the token itself expires, whichever comes first.
+    """
+
+    def __init__(self, max_size: int = AUTH_CACHE_MAX_SIZE, ttl_seconds: int = AUTH_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, Tuple[float, UserResponseSchema]] = OrderedDict()
+        self._tokens_by_email: Dict[str, Set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[UserResponseSchema]:
+        entry = self._entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, user = entry
+        if expires_at <= time.monotonic():
+            self._remove(token)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return user
+
+    def set(self, token: str, user: UserResponseSchema, exp: Optional[int] = None):
+        ttl = self.ttl_seconds
+        if exp is not None:
+            ttl = min(ttl, exp - time.time())
+        if ttl <= 0 or self.max_size <= 0:
+            return
+        if token in self._entries:
+            self._remove(token)
+        self._entries[token] = (time.monotonic() + ttl, user)
+        self._tokens_by_email.setdefault(user.email, set()).add(token)
+        while len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, email: str):
+        """Drop every cached token of a user, e.g. after the user is changed or deleted."""
+        for token in self._tokens_by_email.pop(email, set()):
+            self._entries.pop(token, None)
+
+    def clear(self):
+        self._entries.clear()
+        self._tokens_by_email.clear()
+
+    def _remove(self, token: str):
+        _, user = self._entries.pop(token)
+        tokens = self._tokens_by_email.get(user.email)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_email[user.email]
+
+    @property
+    def size(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        return {"size": self.size, "hits": self.hits, "misses": self.misses, "hit_ratio": self.hit_ratio}
+
+
+# Initialize the principal cache
+principal_cache = PrincipalCache()
@@ -1,70 +1,117 @@
-import os
-from typing import List
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
 
-import aiofiles
+from bson import ObjectId
 from fastapi import HTTPException, status, UploadFile
 from motor.motor_asyncio import AsyncIOMotorCollection
 
-from app.crud import create_chat_room, get_chat_room_by_id, create_message, get_messages, get_private_chats_from_db
+from app.config import MESSAGE_PAGE_SIZE, MESSAGE_PAGE_SIZE_MAX, ROOM_PREVIEW_MESSAGES, INBOX_PAGE_SIZE, \
+    SEARCH_PAGE_SIZE, SEARCH_MAX_CANDIDATES, SEARCH_MAX_QUERY_TERMS
+from app.crud import create_chat_room, get_chat_room_by_id, get_messages, get_message_documents, message_document, \
+    message_from_doc, create_inbox_entries, get_inbox_entries, get_inbox_room_ids, search_terms, rank_message_ids, \
+    get_messages_by_ids, message_in_room, get_latest_message_id
 from app.models import UserInDB
-from app.schemas import ChatRoomCreateSchema, ChatRoomResponseSchema, MessageCreateSchema, MessageResponseSchema
+from app.schemas import ChatRoomCreateSchema, ChatRoomResponseSchema, MessageCreateSchema, MessageResponseSchema, \
+    MediaResponseSchema, PrivateChatResponseSchema, InboxEntrySchema, InboxLastMessageSchema, \
+    InboxPageResponseSchema, ReadReceiptResponseSchema
 from app.services.connection_manager import ConnectionManager, SocketIOMessage
+from app.services.media_processor import MediaProcessor
+from app.services.media_storage import MediaStorage
+from app.services.membership_service import MembershipService
+from app.services.message_writer import MessageWriter
+from app.services.read_receipts import ReadReceiptService
 from app.services.user_status_service import UserStatusService
 
 
 class ChatService:
-    def __init__(self, db_chat_rooms: AsyncIOMotorCollection, connection_manager: ConnectionManager,
-                 user_status_service: UserStatusService):
+    def __init__(self, db_chat_rooms: AsyncIOMotorCollection, db_messages: AsyncIOMotorCollection,
+                 db_inbox: AsyncIOMotorCollection, db_message_terms: AsyncIOMotorCollection,
+                 connection_manager: ConnectionManager,
+                 user_status_service: UserStatusService, message_writer: MessageWriter,
+                 membership_service: MembershipService, media_storage: MediaStorage, media_processor: MediaProcessor,
+                 read_receipt_service: ReadReceiptService):
         self.db_chat_rooms = db_chat_rooms
+        self.db_messages = db_messages
+        self.db_inbox = db_inbox
+        self.db_message_terms = db_message_terms
         self.connection_manager = connection_manager
         self.user_status_service = user_status_service
+        self.message_writer = message_writer
+        self.membership_service = membership_service
+        self.media_storage = media_storage
+        self.media_processor = media_processor
+        self.read_receipt_service = read_receipt_service
 
     async def create_new_chat_room(self, chat_room: ChatRoomCreateSchema,
                                    current_user: UserInDB) -> ChatRoomResponseSchema:
         """Create a new chat room and add the current user as a member."""
         if current_user.email not in chat_room.members:
             chat_room.members.append(current_user.email)
+        if chat_room.is_group_chat is None:
+            chat_room.is_group_chat = len(set(chat_room.members)) != 2
         new_chat_room = await create_chat_room(self.db_chat_rooms, chat_room)
 
         chat_room_id = str(new_chat_room.id)
+        self.membership_service.set_members(chat_room_id, new_chat_room.members)
+        await create_inbox_entries(self.db_inbox, new_chat_room)
+        # Members already connected receive the room's broadcasts without reconnecting
+        await self.connection_manager.join_members(chat_room_id, new_chat_room.members)
 
         new_chat_room_dict = new_chat_room.model_dump()
         new_chat_room_dict["id"] = chat_room_id
 
         return ChatRoomResponseSchema(**new_chat_room_dict)
 
-    async def get_chat_room(self, room_id: str, current_user: UserInDB) -> ChatRoomResponseSchema:
-        """Get a specific chat room by its ID."""
+    async def get_chat_room(self, room_id: str, current_user: UserInDB, include_messages: bool = False,
+                            limit: Optional[int] = None) -> ChatRoomResponseSchema:
+        """Get a specific chat room by its ID.
+
+        By default only the latest ``limit`` messages (``ROOM_PREVIEW_MESSAGES`` if not given) are
+        included. With ``include_messages`` the full history is returned, capped at ``limit`` if set.
+        """
         chat_room = await get_chat_room_by_id(self.db_chat_rooms, room_id)
 
         # Check if the chat room exists and the user is a member
         if chat_room is None or current_user.email not in chat_room.members:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat room not found or access denied")
+        # The whole room was read anyway, so refresh its cached members
+        self.membership_service.set_members(room_id, chat_room.members)
+
+        if not include_messages:
+            limit = min(limit or ROOM_PREVIEW_MESSAGES, MESSAGE_PAGE_SIZE_MAX)
+        messages = await get_messages(self.db_messages, room_id, limit=limit)
 
         # Convert ChatRoomInDB to dictionary
         chat_room_dict = {
             "id": str(chat_room.id),
             "name": chat_room.name,
             "members": chat_room.members,
-            "messages": chat_room.messages or []
+            "message_count": chat_room.message_count,
+            "is_group_chat": chat_room.is_group_chat,
+            "messages": [
+                {
+                    "id": str(message.id),
+                    "sender": message.sender,
+                    "content": message.content,
+                    "timestamp": message.timestamp.isoformat()
+                }
+                for message in messages
+            ]
         }
 
         return ChatRoomResponseSchema(**chat_room_dict)
 
-    async def create_new_message(self, room_id: str, message: MessageCreateSchema,
-                                 current_user: UserInDB) -> MessageResponseSchema:
+    async def create_new_message(self, room_id: str, message: MessageCreateSchema, current_user: UserInDB,
+                                 legacy_chat_response: bool = False) -> MessageResponseSchema:
         """Create a new message in a specific chat room."""
-        chat_room = await get_chat_room_by_id(self.db_chat_rooms, room_id)
-
-        # Ensure chat_room is an instance of ChatRoomInDB
-        if chat_room is None or current_user.email not in chat_room.members:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat room not found or access denied")
+        # Served from the membership cache for rooms in use, without reading the room
+        await self.membership_service.ensure_member(room_id, current_user.email)
 
         # Set the sender of the message to the current user
         message.sender = current_user.email
 
-        # Save the new message
-        new_message = await create_message(self.db_chat_rooms, room_id, message)
+        # Save the new message; the writer batches it with concurrent messages and returns once it is stored
+        new_message = message_from_doc(await self.message_writer.submit(message_document(room_id, message)))
 
         # Convert the new message to a dictionary
         new_message_dict = {
@@ -78,53 +125,186 @@ class ChatService:
         socket_message = SocketIOMessage(
             sender=new_message.sender,
             content=new_message.content,
-            timestamp=new_message.timestamp.isoformat()  # Convert timestamp to ISO format
+            timestamp=new_message.timestamp
         )
-        await self.connection_manager.broadcast(room_id, socket_message)
+        await self.connection_manager.broadcast(room_id, socket_message, legacy_chat_response=legacy_chat_response)
 
         return MessageResponseSchema(**new_message_dict)
 
-    async def get_all_messages(self, room_id: str, current_user: UserInDB) -> List[MessageResponseSchema]:
-        """Get all messages in a specific chat room."""
-        chat_room = await get_chat_room_by_id(self.db_chat_rooms, room_id)
+    @staticmethod
+    def parse_cursor(cursor: Optional[str]) -> Optional[ObjectId]:
+        """Parse a pagination cursor given as a message ID or an ISO 8601 timestamp."""
+        if cursor is None:
+            return None
+        if ObjectId.is_valid(cursor):
+            return ObjectId(cursor)
+        try:
+            timestamp = datetime.fromisoformat(cursor)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail="Cursor must be a message ID or an ISO 8601 timestamp")
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        return ObjectId.from_datetime(timestamp)
 
-        # Ensure chat_room is an instance of ChatRoomInDB
-        if chat_room is None or current_user.email not in chat_room.members:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat room not found or access denied")
+    @staticmethod
+    def message_payload(document: dict) -> Dict[str, str]:
+        """A message as it appears in responses, built straight from its MongoDB document."""
+        return {
+            "id": str(document["_id"]),
+            "sender": document["sender"],
+            "content": document["content"],
+            "timestamp": document["timestamp"].isoformat()
+        }
 
-        # Retrieve all messages in the chat room
-        messages = await get_messages(self.db_chat_rooms, room_id)
-
-        # Convert list of MessageInDB to list of MessageResponseSchema
-        message_schemas = [
-            MessageResponseSchema(
-                id=str(message.id),  # Use dot notation for attributes
-                sender=message.sender,
-                content=message.content,
-                timestamp=message.timestamp.isoformat()  # Ensure timestamp is in ISO format if it's a datetime object
-            )
-            for message in messages
-        ]
+    async def get_all_messages(self, room_id: str, current_user: UserInDB, before: Optional[str] = None,
+                               after: Optional[str] = None, limit: int = MESSAGE_PAGE_SIZE) -> Dict[str, Any]:
+        """Get one page of messages in a specific chat room, shaped like ``MessagePageResponseSchema``.
+
+        Without cursors the newest page is returned. ``next_cursor`` continues in the same
+        direction: pass it as ``before`` to scroll back, or as ``after`` when reading forward.
+        The page is built from the raw documents in one pass, without intermediate models.
+        """
+        # Served from the membership cache for rooms in use, without reading the room
+        await self.membership_service.ensure_member(room_id, current_user.email)
+
+        before_id = self.parse_cursor(before)
+        after_id = self.parse_cursor(after)
 
-        return message_schemas
+        # Retrieve a single page of messages in the chat room
+        documents = await get_message_documents(self.db_messages, room_id, before=before_id, after=after_id,
+                                                limit=limit)
 
-    async def get_private_chats(self, current_user: UserInDB) -> List[dict]:
+        next_cursor = None
+        if len(documents) == limit:
+            next_cursor = str(documents[-1]["_id"] if after_id is not None else documents[0]["_id"])
+
+        return {"messages": [self.message_payload(document) for document in documents], "next_cursor": next_cursor}
+
+    async def mark_read(self, room_id: str, message_id: str, current_user: UserInDB) -> ReadReceiptResponseSchema:
+        """Record that the user has read a room up to a message; the write is batched with later marks.
+
+        A message ID must be a message of the room. A timestamp reads up to the room's latest message at that time.
+        """
+        await self.membership_service.ensure_member(room_id, current_user.email)
+        cursor = self.parse_cursor(message_id)
+        if ObjectId.is_valid(message_id):
+            read_id = cursor if await message_in_room(self.db_messages, ObjectId(room_id), cursor) else None
+        else:
+            # Ids only hold whole seconds, so the messages of the timestamp's second count as read too
+            up_to = ObjectId(cursor.binary[:4] + b"\xff" * 8)
+            read_id = await get_latest_message_id(self.db_messages, ObjectId(room_id), up_to)
+        if read_id is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Message not found in this chat room")
+        self.read_receipt_service.mark_read(current_user.email, room_id, read_id)
+        return ReadReceiptResponseSchema(room_id=room_id, message_id=str(read_id))
+
+    async def get_private_chats(self, current_user: UserInDB) -> List[PrivateChatResponseSchema]:
         """Retrieve a list of private chats and include online status for each member."""
-        # Assume we fetch the private chats from the database
-        private_chats = await get_private_chats_from_db(self.db_chat_rooms, current_user.id)
+        entries = await get_inbox_entries(self.db_inbox, current_user.email, is_group_chat=False)
+        online = self.user_status_service.online_statuses(entry["peer"] for entry in entries)
+        return [
+            PrivateChatResponseSchema(id=str(entry["room_id"]), other_user_email=entry["peer"],
+                                      is_online=online[entry["peer"]])
+            for entry in entries if entry.get("peer")
+        ]
+
+    async def get_inbox(self, current_user: UserInDB, is_group_chat: Optional[bool] = None,
+                        before: Optional[str] = None, limit: int = INBOX_PAGE_SIZE) -> InboxPageResponseSchema:
+        """Get one page of the user's conversations, most recently active first."""
+        before_id = self.parse_cursor(before)
+        entries = await get_inbox_entries(self.db_inbox, current_user.email, is_group_chat=is_group_chat,
+                                          before=before_id, limit=limit)
+        # Presence of every peer on the page in one pass
+        online = self.user_status_service.online_statuses(entry["peer"] for entry in entries if entry.get("peer"))
+
+        page = []
+        for entry in entries:
+            last_message = entry.get("last_message")
+            page.append(InboxEntrySchema(
+                room_id=str(entry["room_id"]),
+                name=entry["name"],
+                is_group_chat=entry["is_group_chat"],
+                peer_email=entry.get("peer"),
+                is_online=online.get(entry["peer"]) if entry.get("peer") else None,
+                last_message=InboxLastMessageSchema(
+                    id=str(last_message["id"]),
+                    sender=last_message["sender"],
+                    preview=last_message["preview"],
+                    timestamp=last_message["timestamp"].isoformat()
+                ) if last_message else None,
+                last_read_id=str(entry["last_read_id"]) if entry.get("last_read_id") else None,
+                # Briefly negative while a read message's own increment is still being written
+                unread_count=max(entry.get("unread_count", 0), 0)
+            ))
 
-        for chat in private_chats:
-            chat["is_online"] = self.user_status_service.is_user_online(chat["other_user_email"])
+        next_cursor = str(entries[-1]["last_activity_id"]) if len(entries) == limit else None
+        return InboxPageResponseSchema(entries=page, next_cursor=next_cursor)
 
-        return private_chats
+    async def search_messages(self, current_user: UserInDB, query: str, room_id: Optional[str] = None,
+                              cursor: Optional[str] = None, limit: int = SEARCH_PAGE_SIZE) -> Dict[str, Any]:
+        """Search the messages of one room, or of every room the user belongs to.
+
+        Results are ranked by how many of the query's words they contain, then newest first. The cursor
+        is the number of results already returned. The page is shaped like ``SearchPageResponseSchema``.
+        """
+        if room_id is not None:
+            await self.membership_service.ensure_member(room_id, current_user.email)
+            room_ids = [ObjectId(room_id)]
+        else:
+            room_ids = await get_inbox_room_ids(self.db_inbox, current_user.email)
+        try:
+            offset = int(cursor) if cursor is not None else 0
+        except ValueError:
+            offset = -1
+        if offset < 0:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+        terms = search_terms(query, SEARCH_MAX_QUERY_TERMS)
+        if not terms or not room_ids:
+            return {"results": [], "next_cursor": None}
+        ranked = await rank_message_ids(self.db_message_terms, terms, room_ids, SEARCH_MAX_CANDIDATES)
+        page = ranked[offset:offset + limit]
+        scores = dict(page)
+        documents = await get_messages_by_ids(self.db_messages, [message_id for message_id, _ in page])
+
+        results = [
+            {**self.message_payload(document), "room_id": str(document["room_id"]), "score": scores[document["_id"]]}
+            for document in documents
+        ]
+        next_cursor = str(offset + limit) if offset + limit < len(ranked) else None
+        return {"results": results, "next_cursor": next_cursor}
+
+    async def save_media(self, file: UploadFile) -> MediaResponseSchema:
+        """Save the uploaded media file and queue it for preview generation."""
+        media_id = await self.media_storage.save(file)
+        job = await self.media_processor.submit(media_id, self.media_storage.path(media_id))
+        response = self.media_response(media_id, job)
+        if job["status"] == "pending":
+            # Tell the client up front which previews will appear once processing is done
+            planned = self.media_processor.planned_variants(media_id, job["mime_type"])
+            response.previews = {variant: f"/chat/media/{name}" for variant, name in planned.items()}
+        return response
+
+    async def get_media_status(self, media_id: str) -> MediaResponseSchema:
+        """Get the preview processing status of a media file."""
+        path, _ = self.media_storage.stat(media_id)
+        job = await self.media_processor.status(media_id, path)
+        if job is None:
+            # Uploaded through another worker that is still processing it
+            job = {"status": "pending", "mime_type": "application/octet-stream"}
+        return self.media_response(media_id, job)
 
     @staticmethod
-    async def save_media(file: UploadFile) -> str:
-        """Save the uploaded media file and return its file path."""
-        media_directory = "media"
-        os.makedirs(media_directory, exist_ok=True)  # Create directory if it doesn't exist
-        file_location = os.path.join(media_directory, file.filename)
-        async with aiofiles.open(file_location, 'wb') as out_file:
-            content = await file.read()
-            await out_file.write(content)
-        return file_location
+    def media_response(media_id: str, job: dict) -> MediaResponseSchema:
+        return MediaResponseSchema(
+            file_url=f"/chat/media/{media_id}",
+            media_id=media_id,
+            status=job["status"],
+            status_url=f"/chat/media/{media_id}/status",
+            mime_type=job["mime_type"],
+            previews={variant: f"/chat/media/{name}" for variant, name in job.get("variants", {}).items()},
+            size=job.get("size"),
+            width=job.get("width"),
+            height=job.get("height")
+        )
@@ -1,9 +1,16 @@
+import time
 from datetime import datetime
-from typing import List, Dict
+from typing import Iterable, List, Dict, Optional
 
 import socketio
 from pydantic import BaseModel
 
+from app.config import SOCKETIO_MSGPACK_PATH, SOCKETIO_CHANNEL
+from app.services import socketio_json, socketio_msgpack
+from app.services.metrics import SOCKETIO_EMIT_DURATION
+from app.services.outbound_queues import QueuedAsyncManager
+from app.services.pubsub_managers import build_client_manager
+
 
 class SocketIOMessage(BaseModel):
     sender: str
@@ -18,32 +25,114 @@ class SocketIOMessage(BaseModel):
 
 
 class ConnectionManager:
-    def __init__(self):
-        self.sio = socketio.AsyncServer(async_mode='asgi')
+    def __init__(self, client_manager: Optional[socketio.AsyncManager] = None, msgpack: bool = False,
+                 msgpack_client_manager: Optional[socketio.AsyncManager] = None):
+        # With a pub/sub client manager, emits and room changes reach sockets held by other workers.
+        # Every manager queues frames per connection, so a slow client does not hold up the others.
+        self.sio = socketio.AsyncServer(async_mode='asgi', client_manager=client_manager or QueuedAsyncManager(),
+                                        json=socketio_json)
+        # Binary clients connect to a second server that speaks MessagePack; rooms are kept per server
+        self.msgpack_sio: Optional[socketio.AsyncServer] = None
+        if msgpack:
+            self.msgpack_sio = socketio.AsyncServer(async_mode='asgi',
+                                                    client_manager=msgpack_client_manager or QueuedAsyncManager(),
+                                                    serializer=socketio_msgpack.CompactMsgPackPacket)
         self.active_connections: Dict[str, List[str]] = {}
 
-    async def connect(self, room_id: str, sid: str):
+    @property
+    def servers(self) -> List[socketio.AsyncServer]:
+        return [self.sio] if self.msgpack_sio is None else [self.sio, self.msgpack_sio]
+
+    async def connect(self, room_id: str, sid: str, server: Optional[socketio.AsyncServer] = None):
         if room_id not in self.active_connections:
             self.active_connections[room_id] = []
         self.active_connections[room_id].append(sid)
-        await self.sio.enter_room(sid, room_id)
+        await (server or self.sio).enter_room(sid, room_id)
 
-    async def disconnect(self, room_id: str, sid: str):
+    async def disconnect(self, room_id: str, sid: str, server: Optional[socketio.AsyncServer] = None):
         if room_id in self.active_connections:
             self.active_connections[room_id].remove(sid)
             if not self.active_connections[room_id]:
                 del self.active_connections[room_id]
-        await self.sio.leave_room(sid, room_id)
+        await (server or self.sio).leave_room(sid, room_id)
 
-    async def broadcast(self, room_id: str, message: SocketIOMessage):
-        if room_id in self.active_connections:
-            message_json = message.model_dump()
-            await self.sio.emit('broadcast_message', message_json, room=room_id)
+    async def join_members(self, room_id: str, members: Iterable[str]):
+        """Enter the connections of ``members`` held by this worker into a room, e.g. one just created.
+
+        Every connection is in the room named after its user, so its sids are found without a lookup.
+        Connections held by other workers join the room when they next connect.
+        """
+        for server in self.servers:
+            for member in members:
+                for sid, _ in list(server.manager.get_participants('/', member)):
+                    await server.enter_room(sid, room_id)
+
+    async def broadcast(self, room_id: str, message: SocketIOMessage, legacy_chat_response: bool = False):
+        # Encoded once: every recipient, worker and event reuses the same JSON bytes
+        payload = socketio_json.encode_payload(message)
+        # Room members may be connected to other workers, so always emit through the client manager
+        await self.emit(self.sio, 'broadcast_message', payload, room_id)
+        if legacy_chat_response:
+            # Older clients listen for the same message as a chat_response event
+            await self.emit(self.sio, 'chat_response', {'room_id': room_id, 'message': payload}, room_id)
+
+        if self.msgpack_sio is not None:
+            # The packet class shortens the keys and sends the timestamp as a MessagePack timestamp
+            data = message.model_dump()
+            await self.emit(self.msgpack_sio, 'broadcast_message', data, room_id)
+            if legacy_chat_response:
+                await self.emit(self.msgpack_sio, 'chat_response', {'room_id': room_id, 'message': data}, room_id)
+
+    @staticmethod
+    async def emit(server: socketio.AsyncServer, event: str, data, room):
+        """Emit an event on one server and record how long it took."""
+        start = time.perf_counter()
+        await server.emit(event, data, room=room)
+        SOCKETIO_EMIT_DURATION.labels(event).observe(time.perf_counter() - start)
+
+    async def broadcast_event(self, room_id: str, event: str, data: dict):
+        for server in self.servers:
+            await self.emit(server, event, data, room_id)
 
     async def send(self, sid: str, message: str):
-        await self.sio.emit('chat_message', {'message': message}, room=sid)
+        await self.send_many([sid], message)
+
+    async def send_many(self, sids: List[str], message: str):
+        """Send a chat_message to several connections, encoded once."""
+        if not sids:
+            return
+        # Only the server holding a socket delivers to it
+        for server in self.servers:
+            await self.emit(server, 'chat_message', {'message': message}, sids)
+
+    async def flush(self):
+        """Wait until every queued frame has been handed to its transport."""
+        for server in self.servers:
+            if isinstance(server.manager, QueuedAsyncManager):
+                await server.manager.flush()
+
+    def outbound_stats(self) -> Dict[str, int]:
+        """Outbound queue metrics summed over the servers; max_depth is the deepest single queue."""
+        totals: Dict[str, int] = {}
+        for server in self.servers:
+            if isinstance(server.manager, QueuedAsyncManager):
+                for name, value in server.manager.stats().items():
+                    if name == "max_depth":
+                        totals[name] = max(totals.get(name, 0), value)
+                    else:
+                        totals[name] = totals.get(name, 0) + value
+        return totals
+
+
+def build_msgpack_client_manager() -> Optional[socketio.AsyncManager]:
+    """Client manager of the MessagePack server, on its own channel so JSON emits are not relayed to it."""
+    return build_client_manager(channel=f"{SOCKETIO_CHANNEL}_msgpack", json=socketio_msgpack)
 
 
 # Initialize the connection manager
-connection_manager = ConnectionManager()
+connection_manager = ConnectionManager(
+    client_manager=build_client_manager(), msgpack=bool(SOCKETIO_MSGPACK_PATH),
+    msgpack_client_manager=build_msgpack_client_manager() if SOCKETIO_MSGPACK_PATH else None
+)
 sio = connection_manager.sio
+msgpack_sio = connection_manager.msgpack_sio
@@ -0,0 +1,240 @@
+import asyncio
+import importlib.util
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional, Set
+
+import aiofiles
+
+from app.config import MEDIA_PROCESS_WORKERS, MEDIA_PROCESS_QUEUE_SIZE, MEDIA_THUMBNAIL_SIZE
+
+# Leading bytes of common upload formats, checked in order
+MAGIC_NUMBERS = [
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+    (b"%PDF-", "application/pdf"),
+    (b"\x1a\x45\xdf\xa3", "video/webm"),
+    (b"OggS", "audio/ogg"),
+    (b"ID3", "audio/mpeg"),
+    (b"fLaC", "audio/flac"),
+    (b"PK\x03\x04", "application/zip"),
+]
+SNIFF_BYTES = 512
+# Preview variant -> suffix of its file name
+VARIANT_SUFFIXES = {"thumbnail": "thumb", "poster": "poster"}
+
+
+def sniff_mime_type(head: bytes) -> str:
+    """Guess a file's MIME type from its first bytes instead of trusting the client."""
+    for magic, mime_type in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return mime_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "audio/wav"
+    if head[4:8] == b"ftyp":
+        return "video/quicktime" if head[8:10] == b"qt" else "video/mp4"
+    try:
+        head.decode("utf-8")
+        return "text/plain"
+    except UnicodeDecodeError:
+        return "application/octet-stream"
+
+
+def pillow_available() -> bool:
+    return importlib.util.find_spec("PIL") is not None
+
+
+def ffmpeg_available() -> bool:
+    return shutil.which("ffmpeg") is not None
+
+
+def variant_id(media_id: str, variant: str) -> str:
+    """Derivatives are named after the content hash, so identical uploads share them."""
+    return f"{media_id[:64]}-{VARIANT_SUFFIXES[variant]}.jpg"
+
+
+def variant_path(path: str, variant: str) -> str:
+    return os.path.join(os.path.dirname(path), variant_id(os.path.basename(path), variant))
+
+
+def metadata_path(path: str) -> str:
+    return f"{path}.meta.json"
+
+
+def make_thumbnail(path: str, thumbnail_size: int) -> Dict[str, Any]:
+    from PIL import Image  # Optional dependency, only needed for previews
+
+    with Image.open(path) as image:
+        info = {"width": image.width, "height": image.height}
+        image.thumbnail((thumbnail_size, thumbnail_size))
+        output = variant_path(path, "thumbnail")
+        tmp_output = f"{output}.{os.getpid()}.tmp"
+        image.convert("RGB").save(tmp_output, "JPEG", quality=85)
+    os.replace(tmp_output, output)
+    info["variants"] = {"thumbnail": os.path.basename(output)}
+    return info
+
+
+def make_poster(path: str, thumbnail_size: int) -> Dict[str, Any]:
+    output = variant_path(path, "poster")
+    tmp_output = f"{output}.{os.getpid()}.tmp"
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-y", "-i", path, "-frames:v", "1",
+         "-vf", f"scale='min({thumbnail_size},iw)':-2", "-f", "image2", tmp_output],
+        check=True, timeout=60, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    os.replace(tmp_output, output)
+    return {"variants": {"poster": os.path.basename(output)}}
+
+
+def process_media(path: str, mime_type: str, thumbnail_size: int) -> Dict[str, Any]:
+    """Describe a stored file and write its preview variants. Runs in a worker process."""
+    result: Dict[str, Any] = {"mime_type": mime_type, "size": os.path.getsize(path), "variants": {}}
+    if mime_type.startswith("image/") and pillow_available():
+        result.update(make_thumbnail(path, thumbnail_size))
+    elif mime_type.startswith("video/") and ffmpeg_available():
+        result.update(make_poster(path, thumbnail_size))
+
+    # Kept on disk so every worker can report the result, not just the one that processed the file
+    tmp_metadata = f"{metadata_path(path)}.{os.getpid()}.tmp"
+    with open(tmp_metadata, "w") as metadata_file:
+        json.dump(result, metadata_file)
+    os.replace(tmp_metadata, metadata_path(path))
+    return result
+
+
+class MediaProcessor:
+    """Generates media metadata and previews in a bounded process pool.
+
+    Image decoding and video frame extraction are CPU bound, so they run in worker processes instead of
+    the event loop. At most ``max_pending`` files wait for or are in processing; uploads beyond that are
+    still stored but get no previews.
+    """
+
+    def __init__(self, max_workers: int = MEDIA_PROCESS_WORKERS, max_pending: int = MEDIA_PROCESS_QUEUE_SIZE,
+                 thumbnail_size: int = MEDIA_THUMBNAIL_SIZE, max_jobs: int = 10000):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.thumbnail_size = thumbnail_size
+        self.max_jobs = max_jobs
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.jobs: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.processing_seconds = 0.0
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Forking would copy the event loop, its sockets and the MongoDB client into the workers
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=multiprocessing.get_context(start_method))
+        return self._executor
+
+    @staticmethod
+    def planned_variants(media_id: str, mime_type: str) -> Dict[str, str]:
+        """The preview variants, by media id, that processing will produce for a file of this type."""
+        if mime_type.startswith("image/") and pillow_available():
+            return {"thumbnail": variant_id(media_id, "thumbnail")}
+        if mime_type.startswith("video/") and ffmpeg_available():
+            return {"poster": variant_id(media_id, "poster")}
+        return {}
+
+    async def submit(self, media_id: str, path: str) -> Dict[str, Any]:
+        """Queue a stored file for processing and return its job."""
+        job = await self.status(media_id, path)
+        if job is not None and job["status"] in ("pending", "done"):
+            return job  # The same content was uploaded before
+
+        async with aiofiles.open(path, 'rb') as media_file:
+            mime_type = sniff_mime_type(await media_file.read(SNIFF_BYTES))
+        job = {"status": "pending", "mime_type": mime_type, "variants": {}}
+        if self.pending >= self.max_pending:
+            job["status"] = "skipped"
+            self.skipped += 1
+        else:
+            self.pending += 1
+            task = asyncio.create_task(self._process(job, path))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        self._remember(media_id, job)
+        return job
+
+    async def _process(self, job: Dict[str, Any], path: str):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            result = await loop.run_in_executor(self.executor, process_media, path, job["mime_type"],
+                                                self.thumbnail_size)
+            job.update(result, status="done")
+            self.completed += 1
+            print(f"[LOG] Processed media {path} in {(time.perf_counter() - start) * 1000:.1f} ms. "
+                  f"Pending: {self.pending - 1}")
+        except Exception as e:
+            job.update(status="failed", error=str(e))
+            self.failed += 1
+            print(f"[LOG] Media processing failed for {path}: {e}")
+        finally:
+            self.processing_seconds += time.perf_counter() - start
+            self.pending -= 1
+
+    def _remember(self, media_id: str, job: Dict[str, Any]):
+        self.jobs.pop(media_id, None)
+        self.jobs[media_id] = job
+        while len(self.jobs) > self.max_jobs:
+            self.jobs.popitem(last=False)
+
+    async def status(self, media_id: str, path: str) -> Optional[Dict[str, Any]]:
+        """Return the processing job of a file, or None if this worker does not know of one."""
+        job = self.jobs.get(media_id)
+        if job is not None:
+            return job
+        try:
+            async with aiofiles.open(metadata_path(path)) as metadata_file:
+                job = {**json.loads(await metadata_file.read()), "status": "done"}
+        except (OSError, ValueError):
+            return None
+        self._remember(media_id, job)
+        return job
+
+    async def mime_type(self, media_id: str, path: str) -> str:
+        """The sniffed MIME type of a stored file, from its job if there is one."""
+        job = await self.status(media_id, path)
+        if job is not None:
+            return job["mime_type"]
+        async with aiofiles.open(path, 'rb') as media_file:
+            return sniff_mime_type(await media_file.read(SNIFF_BYTES))
+
+    def stats(self) -> Dict[str, float]:
+        processed = self.completed + self.failed
+        return {
+            "pending": self.pending,
+            "completed": self.completed,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "average_seconds": self.processing_seconds / processed if processed else 0.0,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# Initialize the media processor
+media_processor = MediaProcessor()
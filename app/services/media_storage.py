@@ -0,0 +1,154 @@
+import hashlib
+import os
+import re
+import uuid
+from typing import AsyncIterator, Optional, Tuple
+
+import aiofiles
+from fastapi import HTTPException, status, UploadFile
+from fastapi.responses import JSONResponse
+
+from app.config import MEDIA_DIRECTORY, MEDIA_MAX_UPLOAD_BYTES, MEDIA_CHUNK_SIZE
+
+# A content hash, optionally followed by a preview variant such as "-thumb.jpg"
+MEDIA_ID_PATTERN = re.compile(r"^[0-9a-f]{64}(-[a-z]+\.jpg)?$")
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+# Room for the multipart boundaries and part headers around the uploaded file
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+class MediaStorage:
+    """Content-addressed media files on local disk.
+
+    Uploads are streamed to a temporary file in chunks while their SHA-256 is computed, then renamed
+    atomically to ``<directory>/<sha[:2]>/<sha>``. Identical files are therefore stored once, whatever
+    they were called, and a file is never visible half-written. The MIME type is sniffed from the content
+    by the media processor and kept in the file's ``.meta.json``.
+    """
+
+    def __init__(self, directory: str = MEDIA_DIRECTORY, max_upload_bytes: int = MEDIA_MAX_UPLOAD_BYTES,
+                 chunk_size: int = MEDIA_CHUNK_SIZE):
+        self.directory = directory
+        self.max_upload_bytes = max_upload_bytes
+        self.chunk_size = chunk_size
+
+    def too_large(self) -> HTTPException:
+        return HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                             detail=f"File is larger than {self.max_upload_bytes} bytes")
+
+    def path(self, media_id: str) -> str:
+        if not MEDIA_ID_PATTERN.match(media_id):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Media not found")
+        return os.path.join(self.directory, media_id[:2], media_id)
+
+    async def save(self, file: UploadFile) -> str:
+        """Store an upload and return its media id.
+
+        Requests with a larger ``Content-Length`` are rejected by ``MediaUploadLimitMiddleware`` before the
+        form is parsed; this check catches bodies sent without one.
+        """
+        if file.size is not None and file.size > self.max_upload_bytes:
+            raise self.too_large()
+
+        tmp_directory = os.path.join(self.directory, "tmp")
+        os.makedirs(tmp_directory, exist_ok=True)
+        tmp_path = os.path.join(tmp_directory, uuid.uuid4().hex)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            async with aiofiles.open(tmp_path, 'wb') as out_file:
+                while chunk := await file.read(self.chunk_size):
+                    size += len(chunk)
+                    if size > self.max_upload_bytes:
+                        raise self.too_large()
+                    digest.update(chunk)
+                    await out_file.write(chunk)
+
+            media_id = digest.hexdigest()
+            final_path = self.path(media_id)
+            if os.path.exists(final_path):
+                os.remove(tmp_path)  # Same content is already stored
+            else:
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                os.replace(tmp_path, final_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return media_id
+
+    def stat(self, media_id: str) -> Tuple[str, int]:
+        """Return the path and size of a stored file."""
+        path = self.path(media_id)
+        try:
+            return path, os.path.getsize(path)
+        except OSError:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Media not found")
+
+    @staticmethod
+    def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+        """Parse a single ``bytes=`` range into inclusive offsets; None means the whole file.
+
+        Ranges this parser does not understand, such as multipart ranges, are ignored as RFC 9110 allows.
+        """
+        if not header:
+            return None
+        match = RANGE_PATTERN.match(header.strip())
+        if not match or match.groups() == ("", ""):
+            return None
+        first, last = match.groups()
+        if first == "":
+            # Suffix range: the last N bytes
+            if int(last) == 0:
+                start = size
+            else:
+                start, end = max(size - int(last), 0), size - 1
+        else:
+            start = int(first)
+            if last and int(last) < start:
+                return None  # Invalid, so it is ignored
+            end = min(int(last), size - 1) if last else size - 1
+        if start >= size:
+            raise HTTPException(status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                                detail="Requested range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+        return start, end
+
+    async def iter_file(self, path: str, start: int, end: int) -> AsyncIterator[bytes]:
+        """Yield the bytes from ``start`` to ``end`` inclusive, one chunk at a time."""
+        remaining = end - start + 1
+        async with aiofiles.open(path, 'rb') as in_file:
+            await in_file.seek(start)
+            while remaining > 0:
+                chunk = await in_file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+
+class MediaUploadLimitMiddleware:
+    """ASGI middleware rejecting uploads to ``path`` with ``413`` by their ``Content-Length``.
+
+    FastAPI reads the whole multipart body into temporary files before the endpoint runs, so without it an
+    oversized upload is only rejected once it has been received and parsed.
+    """
+
+    def __init__(self, app, path: str, storage: Optional[MediaStorage] = None):
+        self.app = app
+        self.path = path
+        self.storage = storage or media_storage
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "POST" and scope["path"] == self.path:
+            content_length = dict(scope["headers"]).get(b"content-length", b"")
+            max_body_bytes = self.storage.max_upload_bytes + MULTIPART_OVERHEAD_BYTES
+            if content_length.isdigit() and int(content_length) > max_body_bytes:
+                error = self.storage.too_large()
+                response = JSONResponse({"detail": error.detail}, status_code=error.status_code,
+                                        headers={"Connection": "close"})
+                return await response(scope, receive, send)
+        await self.app(scope, receive, send)
+
+
+# Initialize the media storage
+media_storage = MediaStorage()
@@ -0,0 +1,92 @@
+import time
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Iterable, Optional, Tuple
+
+from bson import ObjectId
+from fastapi import HTTPException, status
+from motor.motor_asyncio import AsyncIOMotorCollection
+
+from app.config import ROOM_MEMBERS_CACHE_MAX_SIZE, ROOM_MEMBERS_CACHE_TTL_SECONDS
+from app.crud import get_chat_room_members
+from app.database import get_database
+
+
+class MembershipService:
+    """Room membership checks backed by an LRU cache of room -> member set.
+
+    A miss reads only the room's ``members`` field. Entries expire after ``ttl_seconds`` and are replaced
+    whenever this worker writes or reads the whole room, so membership changes show up right away here and
+    within the TTL on other workers.
+    """
+
+    def __init__(self, max_size: int = ROOM_MEMBERS_CACHE_MAX_SIZE, ttl_seconds: int = ROOM_MEMBERS_CACHE_TTL_SECONDS,
+                 db_chat_rooms: Optional[AsyncIOMotorCollection] = None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._db_chat_rooms = db_chat_rooms
+        self._entries: OrderedDict[str, Tuple[float, FrozenSet[str]]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def db_chat_rooms(self) -> AsyncIOMotorCollection:
+        return self._db_chat_rooms if self._db_chat_rooms is not None else get_database()["chat_rooms"]
+
+    async def get_members(self, room_id: str) -> Optional[FrozenSet[str]]:
+        """Return the members of a room, or None if it does not exist."""
+        entry = self._entries.get(room_id)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(room_id)
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        if not ObjectId.is_valid(room_id):
+            return None
+        members = await get_chat_room_members(self.db_chat_rooms, room_id)
+        if members is None:
+            # Unknown rooms are not cached, so a room created on another worker is found straight away
+            self._entries.pop(room_id, None)
+            return None
+        return self.set_members(room_id, members)
+
+    async def is_member(self, room_id: str, email: str) -> bool:
+        members = await self.get_members(room_id)
+        return members is not None and email in members
+
+    async def ensure_member(self, room_id: str, email: str):
+        if not await self.is_member(room_id, email):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat room not found or access denied")
+
+    def set_members(self, room_id: str, members: Iterable[str]) -> FrozenSet[str]:
+        """Cache the current members of a room, e.g. after creating it or changing its membership."""
+        members = frozenset(members)
+        if self.max_size <= 0 or self.ttl_seconds <= 0:
+            return members
+        self._entries.pop(room_id, None)
+        self._entries[room_id] = (time.monotonic() + self.ttl_seconds, members)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return members
+
+    def invalidate(self, room_id: str):
+        """Forget a room's members so the next check reads them from the database."""
+        self._entries.pop(room_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    @property
+    def size(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        return {"size": self.size, "hits": self.hits, "misses": self.misses, "hit_ratio": self.hit_ratio}
+
+
+# Initialize the membership service
+membership_service = MembershipService()
@@ -0,0 +1,154 @@
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import WriteConcern
+
+from app.config import MESSAGE_BATCH_SIZE, MESSAGE_FLUSH_INTERVAL_MS, MESSAGE_QUEUE_SIZE, \
+    MESSAGE_ENQUEUE_TIMEOUT_MS, MESSAGE_WRITE_JOURNAL
+from app.crud import insert_message_documents, apply_message_batch_updates
+from app.database import get_database
+
+
+class MessageWriter:
+    """Write-behind pipeline that persists messages in batches.
+
+    Senders queue a message document and wait until the batch holding it has been written. A batch is
+    committed with a single ``insert_many`` once ``batch_size`` messages are queued or ``flush_interval_ms``
+    has passed since the first of them arrived; room counters, inbox entries and the search index are
+    updated in one bulk write each. Senders only fail if their message was not stored: when these follow-up
+    updates fail, the batch is logged and counted in ``update_failures`` instead. The queue is bounded; when
+    it stays full for ``enqueue_timeout_ms`` the sender is rejected with 503 instead of buffering without limit.
+    """
+
+    def __init__(self, batch_size: int = MESSAGE_BATCH_SIZE, flush_interval_ms: int = MESSAGE_FLUSH_INTERVAL_MS,
+                 max_queue_size: int = MESSAGE_QUEUE_SIZE, enqueue_timeout_ms: int = MESSAGE_ENQUEUE_TIMEOUT_MS,
+                 db_messages: Optional[AsyncIOMotorCollection] = None,
+                 db_chat_rooms: Optional[AsyncIOMotorCollection] = None,
+                 db_inbox: Optional[AsyncIOMotorCollection] = None,
+                 db_message_terms: Optional[AsyncIOMotorCollection] = None):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_queue_size = max_queue_size
+        self.enqueue_timeout = enqueue_timeout_ms / 1000
+        self._db_messages = db_messages
+        self._db_chat_rooms = db_chat_rooms
+        self._db_inbox = db_inbox
+        self._db_message_terms = db_message_terms
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.batches_written = 0
+        self.messages_written = 0
+        self.update_failures = 0
+
+    @property
+    def db_messages(self) -> AsyncIOMotorCollection:
+        collection = self._db_messages if self._db_messages is not None else get_database()["messages"]
+        if MESSAGE_WRITE_JOURNAL:
+            # Acknowledge senders only once their batch is in the on-disk journal
+            return collection.with_options(write_concern=WriteConcern(w=1, j=True))
+        return collection
+
+    @property
+    def db_chat_rooms(self) -> AsyncIOMotorCollection:
+        return self._db_chat_rooms if self._db_chat_rooms is not None else get_database()["chat_rooms"]
+
+    @property
+    def db_inbox(self) -> AsyncIOMotorCollection:
+        return self._db_inbox if self._db_inbox is not None else get_database()["inbox"]
+
+    @property
+    def db_message_terms(self) -> AsyncIOMotorCollection:
+        return self._db_message_terms if self._db_message_terms is not None else get_database()["message_terms"]
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+            self._task = loop.create_task(self._run())
+
+    async def submit(self, document: Dict[str, Any]) -> Dict[str, Any]:
+        """Queue a message document and return it once it has been written."""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            await asyncio.wait_for(self._queue.put((document, future)), self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail="Too many messages in flight, please retry")
+        await future
+        return document
+
+    async def _next_batch(self) -> Tuple[List[Tuple[Dict[str, Any], asyncio.Future]], bool]:
+        """Collect the next batch; the flag is set once the close sentinel has been reached."""
+        loop = asyncio.get_running_loop()
+        item = await self._queue.get()
+        if item is None:
+            return [], True
+        batch = [item]
+        deadline = loop.time() + self.flush_interval
+        while True:
+            while len(batch) < self.batch_size and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    return batch, True
+                batch.append(item)
+            timeout = deadline - loop.time()
+            if len(batch) >= self.batch_size or timeout <= 0:
+                return batch, False
+            # Give other senders until the deadline to join this batch
+            await asyncio.sleep(timeout)
+
+    async def _write(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]):
+        documents = [document for document, _ in batch]
+        try:
+            failed = await insert_message_documents(self.db_messages, documents)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches_written += 1
+        self.messages_written += len(batch) - len(failed)
+        written = [document for index, document in enumerate(documents) if index not in failed]
+        try:
+            # Done before acknowledging, so a sender reading its inbox next sees its own message
+            await apply_message_batch_updates(self.db_chat_rooms, written, self.db_inbox, self.db_message_terms)
+        except Exception as e:
+            # The messages are stored; $inc updates are not retried, as they may have been partly applied
+            self.update_failures += 1
+            print(f"[LOG] Updating rooms, inbox and search index failed for {len(written)} stored messages: {e}")
+
+        for index, (_, future) in enumerate(batch):
+            if future.done():
+                continue  # The sender gave up waiting
+            if index in failed:
+                future.set_exception(HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                                                   detail="Message could not be saved"))
+            else:
+                future.set_result(None)
+
+    async def _run(self):
+        closing = False
+        while not closing:
+            batch, closing = await self._next_batch()
+            if batch:
+                await self._write(batch)
+
+    async def close(self):
+        """Write everything already queued and stop the pipeline."""
+        if self._task is None or self._task.done():
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+
+# Initialize the message writer
+message_writer = MessageWriter()
@@ -0,0 +1,250 @@
+"""Service metrics, exposed in the Prometheus text format at ``/metrics``.
+
+Counters and histograms keep their values in one shard per thread. Recording only touches the calling
+thread's shard, so it takes no lock even when pymongo reports commands from Motor's worker threads, and
+allocates nothing once the shard exists. A scrape adds the shards up. Values that services already
+count, such as cache hits, are read by callbacks at scrape time and cost nothing in between.
+"""
+import time
+from bisect import bisect_left
+from threading import get_ident
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple, Union
+
+from pymongo import monitoring
+
+# Methods recorded by name; any other method a client sends is labelled "other"
+HTTP_METHODS = frozenset({"GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS"})
+# Seconds; from a cached lookup to a slow bcrypt hash
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+class CounterValue:
+    """One labelled series of a counter."""
+    __slots__ = ("_shards",)
+
+    def __init__(self):
+        self._shards: Dict[int, List[float]] = {}
+
+    def inc(self, amount: float = 1.0):
+        shard = self._shards.get(get_ident())
+        if shard is None:
+            shard = self._shards[get_ident()] = [0.0]
+        shard[0] += amount
+
+    @property
+    def value(self) -> float:
+        return sum(shard[0] for shard in list(self._shards.values()))
+
+
+class HistogramValue:
+    """One labelled series of a histogram; each shard holds the count per bucket followed by the sum."""
+    __slots__ = ("_buckets", "_shards")
+
+    def __init__(self, buckets: Sequence[float]):
+        self._buckets = buckets
+        self._shards: Dict[int, List[float]] = {}
+
+    def observe(self, value: float):
+        shard = self._shards.get(get_ident())
+        if shard is None:
+            shard = self._shards[get_ident()] = [0] * (len(self._buckets) + 1) + [0.0]
+        shard[bisect_left(self._buckets, value)] += 1
+        shard[-1] += value
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        """Cumulative counts per bucket including +Inf, and the sum."""
+        counts = [0] * (len(self._buckets) + 1)
+        total = 0.0
+        for shard in list(self._shards.values()):
+            for index in range(len(counts)):
+                counts[index] += shard[index]
+            total += shard[-1]
+        for index in range(1, len(counts)):
+            counts[index] += counts[index - 1]
+        return counts, total
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, "Metric"] = {}
+
+    def register(self, metric: "Metric"):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+# Initialize the registry served at /metrics
+REGISTRY = Registry()
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry: Registry = REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *values: str):
+        """The series for the given label values, created on first use."""
+        series = self._values.get(values)
+        if series is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes the labels {self.labelnames}")
+            series = self._values.setdefault(values, self._new_series())
+        return series
+
+    def _new_series(self):
+        raise NotImplementedError
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def _new_series(self) -> CounterValue:
+        return CounterValue()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def samples(self) -> Iterable[str]:
+        for values, series in list(self._values.items()):
+            yield f"{self.name}{format_labels(self.labelnames, values)} {format_value(series.value)}"
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: Registry = REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_series(self) -> HistogramValue:
+        return HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def samples(self) -> Iterable[str]:
+        bucket_labels = self.labelnames + ("le",)
+        for values, series in list(self._values.items()):
+            counts, total = series.snapshot()
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                yield f"{self.name}_bucket{format_labels(bucket_labels, values + (format_value(bound),))} {count}"
+            labels = format_labels(self.labelnames, values)
+            yield f"{self.name}_sum{labels} {format_value(total)}"
+            yield f"{self.name}_count{labels} {counts[-1]}"
+
+
+class CallbackMetric(Metric):
+    """A gauge or counter read from ``callback`` at scrape time.
+
+    The callback returns a number, or with labels a dict of label value tuples to numbers.
+    """
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], Union[float, Dict[tuple, float]]],
+                 labelnames: Sequence[str] = (), type: str = "gauge", registry: Registry = REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.callback = callback
+        self.type = type
+
+    def samples(self) -> Iterable[str]:
+        values = self.callback()
+        if not self.labelnames:
+            values = {(): values}
+        for label_values, value in values.items():
+            yield f"{self.name}{format_labels(self.labelnames, label_values)} {format_value(value)}"
+
+
+HTTP_REQUEST_DURATION = Histogram("chat_http_request_duration_seconds", "HTTP request latency by route.",
+                                  ("method", "route"))
+HTTP_REQUESTS = Counter("chat_http_requests_total", "HTTP responses by route and status.",
+                        ("method", "route", "status"))
+SOCKETIO_EMIT_DURATION = Histogram("chat_socketio_emit_duration_seconds",
+                                   "Time to hand a Socket.IO event to the client managers, by event.", ("event",))
+MONGO_COMMAND_DURATION = Histogram("chat_mongo_command_duration_seconds", "MongoDB command latency by command.",
+                                   ("command",))
+MONGO_COMMAND_FAILURES = Counter("chat_mongo_command_failures_total", "Failed MongoDB commands by command.",
+                                 ("command",))
+PASSWORD_HASH_DURATION = Histogram("chat_password_hash_duration_seconds",
+                                   "Time spent in bcrypt by operation, excluding the wait for a worker.",
+                                   ("operation",))
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Records the latency of every MongoDB command; pymongo calls it from the thread running the command."""
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        pass
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        MONGO_COMMAND_DURATION.labels(event.command_name).observe(event.duration_micros / 1e6)
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        MONGO_COMMAND_DURATION.labels(event.command_name).observe(event.duration_micros / 1e6)
+        MONGO_COMMAND_FAILURES.labels(event.command_name).inc()
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording the latency and status of every HTTP request.
+
+    Requests are labelled with the route's path template, so ``/chat/chat_rooms/{room_id}`` is one series
+    however many rooms there are; requests that match no route, or none of its methods, share the
+    ``unmatched`` series. Methods outside ``HTTP_METHODS`` are labelled ``other``, so clients cannot add
+    series at will.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            method = scope["method"] if scope["method"] in HTTP_METHODS else "other"
+            # The router stores the matched route in the scope, also when only its path matched
+            route = scope.get("route")
+            methods = getattr(route, "methods", None)
+            path = "unmatched" if route is None or (methods and scope["method"] not in methods) else route.path
+            HTTP_REQUEST_DURATION.labels(method, path).observe(time.perf_counter() - start)
+            HTTP_REQUESTS.labels(method, path, str(status_code)).inc()
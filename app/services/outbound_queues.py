@@ -0,0 +1,152 @@
+import asyncio
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+import socketio
+from engineio import packet as eio_packet
+from socketio import packet
+
+from app.config import SOCKETIO_OUTBOUND_QUEUE_SIZE, SOCKETIO_SLOW_CONSUMER_POLICY
+
+SLOW_CONSUMER_POLICIES = ("drop_oldest", "coalesce", "disconnect")
+
+
+class OutboundQueue:
+    """Frames waiting to be sent to one connection, as (event, Engine.IO packets)."""
+
+    def __init__(self, sid: str, namespace: str):
+        self.sid = sid
+        self.namespace = namespace
+        self.frames: Deque[Tuple[str, List[eio_packet.Packet]]] = deque()
+        self.task: Optional[asyncio.Task] = None
+        self.closed = False
+
+
+class QueuedAsyncManager(socketio.AsyncManager):
+    """Client manager that sends every frame through a bounded queue per connection.
+
+    An emit encodes its frame once and appends it to each recipient's queue, so it never waits for a
+    client. A writer task per connection hands the queued frames to Engine.IO and waits until the
+    transport has taken them before sending more. A slow or stalled client therefore only fills its own
+    queue; once it holds ``max_queue_size`` frames the ``policy`` applies: ``drop_oldest`` drops the
+    oldest frame, ``coalesce`` drops the oldest queued frame of the same event (or the oldest frame if
+    there is none) and ``disconnect`` disconnects the client. Emits with callbacks are sent directly.
+
+    Pub/sub managers list it after ``AsyncPubSubManager`` in their bases, so frames relayed from other
+    workers are queued as well. ``AsyncPubSubManager`` does not pass arguments on, so they call
+    ``configure_queues`` themselves.
+    """
+
+    def __init__(self, *args, max_queue_size: int = SOCKETIO_OUTBOUND_QUEUE_SIZE,
+                 policy: str = SOCKETIO_SLOW_CONSUMER_POLICY, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.configure_queues(max_queue_size, policy)
+        self.queues: Dict[str, OutboundQueue] = {}  # By Engine.IO sid
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.disconnected = 0
+
+    def configure_queues(self, max_queue_size: int, policy: str):
+        """Set the queue size and slow consumer policy; a size of 0 sends frames directly."""
+        if policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"Unknown slow consumer policy: {policy}")
+        self.max_queue_size = max_queue_size
+        self.policy = policy
+
+    async def emit(self, event, data, namespace, room=None, skip_sid=None, callback=None, to=None, **kwargs):
+        if callback is not None or self.max_queue_size <= 0:
+            return await super().emit(event, data, namespace, room=room, skip_sid=skip_sid, callback=callback,
+                                      to=to, **kwargs)
+        room = to or room
+        if namespace not in self.rooms:
+            return
+        # Same argument handling as AsyncManager.emit
+        if isinstance(data, tuple):
+            data = list(data)
+        elif data is not None:
+            data = [data]
+        else:
+            data = []
+        if not isinstance(skip_sid, list):
+            skip_sid = [skip_sid]
+
+        encoded_packet = self.server.packet_class(packet.EVENT, namespace=namespace, data=[event] + data).encode()
+        if not isinstance(encoded_packet, list):
+            encoded_packet = [encoded_packet]
+        eio_packets = [eio_packet.Packet(eio_packet.MESSAGE, p) for p in encoded_packet]
+        for sid, eio_sid in self.get_participants(namespace, room):
+            if sid not in skip_sid:
+                self._enqueue(sid, eio_sid, namespace, event, eio_packets)
+
+    def _enqueue(self, sid: str, eio_sid: str, namespace: str, event: str, eio_packets: List[eio_packet.Packet]):
+        queue = self.queues.get(eio_sid)
+        if queue is None:
+            queue = self.queues[eio_sid] = OutboundQueue(sid, namespace)
+        if queue.closed:
+            return
+        if len(queue.frames) >= self.max_queue_size and not self._make_room(queue, event):
+            return
+        queue.frames.append((event, eio_packets))
+        if queue.task is None or queue.task.done():
+            queue.task = asyncio.get_running_loop().create_task(self._drain(eio_sid, queue))
+
+    def _make_room(self, queue: OutboundQueue, event: str) -> bool:
+        """Apply the slow consumer policy to a full queue; returns whether the new frame may be queued."""
+        if self.policy == "disconnect":
+            self.dropped += len(queue.frames) + 1
+            self.disconnected += 1
+            queue.frames.clear()
+            queue.closed = True
+            print(f"[LOG] Disconnecting slow Socket.IO client {queue.sid}")
+            asyncio.get_running_loop().create_task(self.server.disconnect(queue.sid, namespace=queue.namespace))
+            return False
+        if self.policy == "coalesce":
+            for index, (queued_event, _) in enumerate(queue.frames):
+                if queued_event == event:
+                    # The new frame supersedes the stalest one of the same event
+                    del queue.frames[index]
+                    self.coalesced += 1
+                    return True
+        queue.frames.popleft()
+        self.dropped += 1
+        return True
+
+    async def _drain(self, eio_sid: str, queue: OutboundQueue):
+        while queue.frames and not queue.closed:
+            batch = list(queue.frames)
+            queue.frames.clear()
+            for _, eio_packets in batch:
+                for eio_pkt in eio_packets:
+                    await self.server._send_eio_packet(eio_sid, eio_pkt)
+            self.sent += len(batch)
+            socket = self.server.eio.sockets.get(eio_sid)
+            if socket is not None:
+                # Wait until the transport has taken the batch; meanwhile new frames wait in the bounded queue
+                await socket.queue.join()
+
+    async def disconnect(self, sid, namespace, **kwargs):
+        eio_sid = self.eio_sid_from_sid(sid, namespace or '/')
+        result = await super().disconnect(sid, namespace, **kwargs)
+        queue = self.queues.pop(eio_sid, None) if eio_sid is not None else None
+        if queue is not None and queue.task is not None:
+            queue.task.cancel()
+        return result
+
+    async def flush(self):
+        """Wait until every queued frame has been handed to its transport."""
+        tasks = [queue.task for queue in self.queues.values() if queue.task is not None and not queue.task.done()]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, int]:
+        depths = [len(queue.frames) for queue in self.queues.values()]
+        return {
+            "connections": len(depths),
+            "queued": sum(depths),
+            "max_depth": max(depths, default=0),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "disconnected": self.disconnected,
+        }
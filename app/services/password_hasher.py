@@ -0,0 +1,63 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from app.config import BCRYPT_MAX_WORKERS, LOGIN_MAX_CONCURRENCY
+from app.crud import hash_password, verify_and_update_password
+from app.services.metrics import PASSWORD_HASH_DURATION
+
+
+def timed_hash_password(password: str) -> str:
+    start = time.perf_counter()
+    try:
+        return hash_password(password)
+    finally:
+        PASSWORD_HASH_DURATION.labels("hash").observe(time.perf_counter() - start)
+
+
+def timed_verify_and_update_password(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    start = time.perf_counter()
+    try:
+        return verify_and_update_password(password, hashed_password)
+    finally:
+        PASSWORD_HASH_DURATION.labels("verify").observe(time.perf_counter() - start)
+
+
+class PasswordHasher:
+    """Runs bcrypt in a bounded thread pool so hashing never blocks the event loop.
+
+    bcrypt releases the GIL while hashing, so the worker threads run in parallel. The number of
+    logins verifying at the same time is capped; further logins wait for a free slot.
+    """
+
+    def __init__(self, max_workers: int = BCRYPT_MAX_WORKERS, max_concurrent_logins: int = LOGIN_MAX_CONCURRENCY):
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._login_slots = asyncio.Semaphore(max_concurrent_logins)
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def hash(self, password: str) -> str:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, timed_hash_password, password)
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """Verify a password; also return a new hash when the stored one needs upgrading."""
+        async with self._login_slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, timed_verify_and_update_password, password,
+                                              hashed_password)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+# Initialize the password hasher
+password_hasher = PasswordHasher()
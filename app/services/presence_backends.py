@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import UpdateOne
+
+from app.config import PRESENCE_BACKEND
+from app.database import get_database
+
+
+class InMemoryPresenceBackend:
+    """Presence store local to the process; enough for a single worker and for tests."""
+
+    def __init__(self):
+        self.connections: Dict[str, Tuple[str, str, datetime]] = {}  # sid -> (email, worker, expires_at)
+
+    async def add(self, connections: Dict[str, str], worker: str, ttl_seconds: int):
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds)
+        for sid, email in connections.items():
+            self.connections[sid] = (email, worker, expires_at)
+
+    async def remove(self, sids: Iterable[str]):
+        for sid in sids:
+            self.connections.pop(sid, None)
+
+    async def touch(self, worker: str, ttl_seconds: int):
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds)
+        for sid, (email, owner, _) in list(self.connections.items()):
+            if owner == worker:
+                self.connections[sid] = (email, owner, expires_at)
+
+    async def online_users(self, exclude_worker: Optional[str] = None) -> Set[str]:
+        now = datetime.now(timezone.utc)
+        return {email for email, owner, expires_at in self.connections.values()
+                if expires_at > now and owner != exclude_worker}
+
+
+class MongoPresenceBackend:
+    """Presence store shared by every worker through the presence collection.
+
+    Each connection is a document keyed by sid with an ``expires_at`` that the owning worker keeps
+    extending. If a worker dies its connections stop being refreshed and drop out after the TTL.
+    """
+
+    def __init__(self, collection: Optional[AsyncIOMotorCollection] = None):
+        self._collection = collection
+
+    @property
+    def collection(self) -> AsyncIOMotorCollection:
+        return self._collection if self._collection is not None else get_database()["presence"]
+
+    async def add(self, connections: Dict[str, str], worker: str, ttl_seconds: int):
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds)
+        # Upserts, so a heartbeat that failed after adding can add the same connections again
+        requests = [UpdateOne({"_id": sid}, {"$set": {"email": email, "worker": worker, "expires_at": expires_at}},
+                              upsert=True)
+                    for sid, email in connections.items()]
+        if requests:
+            await self.collection.bulk_write(requests, ordered=False)
+
+    async def remove(self, sids: Iterable[str]):
+        sids = list(sids)
+        if sids:
+            await self.collection.delete_many({"_id": {"$in": sids}})
+
+    async def touch(self, worker: str, ttl_seconds: int):
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds)
+        await self.collection.update_many({"worker": worker}, {"$set": {"expires_at": expires_at}})
+
+    async def online_users(self, exclude_worker: Optional[str] = None) -> Set[str]:
+        # The TTL monitor only runs once a minute, so expired documents are filtered out here too
+        query = {"expires_at": {"$gt": datetime.now(timezone.utc)}}
+        if exclude_worker is not None:
+            query["worker"] = {"$ne": exclude_worker}
+        return set(await self.collection.distinct("email", query))
+
+
+in_process_presence = InMemoryPresenceBackend()
+
+
+def build_presence_backend(backend: str = PRESENCE_BACKEND):
+    """Create the presence backend.
+
+    ``memory`` keeps presence local to a single worker, ``inprocess`` shares it between services in one
+    process and ``mongo`` shares it between worker processes.
+    """
+    if backend in ("", "memory"):
+        return None
+    if backend == "inprocess":
+        return in_process_presence
+    if backend == "mongo":
+        return MongoPresenceBackend()
+    raise ValueError(f"Unknown PRESENCE_BACKEND: {backend}")
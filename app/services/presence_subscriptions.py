@@ -0,0 +1,148 @@
+import asyncio
+from typing import Dict, Iterable, List, Optional, Set
+
+import socketio
+from fastapi import HTTPException, status
+from motor.motor_asyncio import AsyncIOMotorCollection
+
+from app.config import PRESENCE_DELTA_INTERVAL_MS, PRESENCE_SUBSCRIBE_MAX_ROOMS
+from app.crud import get_inbox_room_ids
+from app.database import get_database
+from app.services.connection_manager import ConnectionManager, connection_manager
+from app.services.membership_service import MembershipService, membership_service
+from app.services.user_status_service import UserStatusService, user_status_service
+
+
+def presence_room(room_id: str) -> str:
+    """Socket.IO room of the connections subscribed to a chat room's presence."""
+    return f"presence:{room_id}"
+
+
+class PresenceSubscriptionService:
+    """Presence of the members of the chat rooms a connection subscribes to.
+
+    A subscription returns a snapshot of the room's online members; afterwards the room only receives
+    ``presence`` events listing who came online or went offline. Changes are collected for
+    ``flush_interval_ms`` and compared with the state at the start of the window, so a user who
+    disconnects and reconnects within it causes no event at all. Each flush looks up the rooms of the
+    changed users in the inbox and sends one event per room.
+
+    Only changes of connections held by this worker are sent; a crashed worker's users show as offline
+    in later snapshots once their presence expires.
+    """
+
+    def __init__(self, flush_interval_ms: int = PRESENCE_DELTA_INTERVAL_MS,
+                 connection_manager: ConnectionManager = connection_manager,
+                 user_status_service: UserStatusService = user_status_service,
+                 membership_service: MembershipService = membership_service,
+                 db_inbox: Optional[AsyncIOMotorCollection] = None,
+                 max_rooms: int = PRESENCE_SUBSCRIBE_MAX_ROOMS):
+        self.flush_interval = flush_interval_ms / 1000
+        self.connection_manager = connection_manager
+        self.user_status_service = user_status_service
+        self.membership_service = membership_service
+        self._db_inbox = db_inbox
+        self.max_rooms = max_rooms
+        self.pending: Dict[str, bool] = {}  # email -> online at the start of the window
+        self._task: Optional[asyncio.Task] = None
+        self.changes = 0
+        self.coalesced = 0
+        self.events = 0
+        user_status_service.add_presence_listener(self.user_changed)
+
+    @property
+    def db_inbox(self) -> AsyncIOMotorCollection:
+        return self._db_inbox if self._db_inbox is not None else get_database()["inbox"]
+
+    async def subscribe(self, server: socketio.AsyncServer, sid: str, email: str,
+                        room_ids: Iterable[str]) -> List[dict]:
+        """Subscribe a connection to the presence of rooms its user belongs to and return their snapshots."""
+        room_ids = list(dict.fromkeys(room_ids))
+        if len(room_ids) > self.max_rooms:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail=f"At most {self.max_rooms} rooms per subscription")
+        snapshots = []
+        for room_id in room_ids:
+            snapshots.append(await self.snapshot(email, room_id))
+            await server.enter_room(sid, presence_room(room_id))
+        return snapshots
+
+    async def snapshot(self, email: str, room_id: str) -> dict:
+        """The online members of a room the user belongs to."""
+        members = await self.membership_service.get_members(room_id)
+        if members is None or email not in members:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat room not found or access denied")
+        online = [member for member in members if self.user_status_service.is_user_online(member)]
+        return {'room_id': room_id, 'online': sorted(online)}
+
+    async def unsubscribe(self, server: socketio.AsyncServer, sid: str, room_ids: Iterable[str]):
+        for room_id in room_ids:
+            await server.leave_room(sid, presence_room(room_id))
+
+    async def get_online_users(self, email: str) -> Set[str]:
+        """Online users who share at least one room with a user."""
+        online = set()
+        for room_id in await get_inbox_room_ids(self.db_inbox, email):
+            members = await self.membership_service.get_members(str(room_id)) or ()
+            online.update(member for member in members if self.user_status_service.is_user_online(member))
+        return online
+
+    def user_changed(self, email: str, was_online: bool):
+        """Record that a user may have come online or gone offline; called by the user status service."""
+        self.changes += 1
+        if email in self.pending:
+            self.coalesced += 1
+        else:
+            self.pending[email] = was_online
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # Not serving, e.g. in a synchronous test
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"[LOG] Presence flush failed: {e}")
+            if not self.pending:
+                return
+
+    async def flush(self):
+        """Send the presence changes of the window to every room of the changed users."""
+        pending, self.pending = self.pending, {}
+        changed = {}
+        for email, was_online in pending.items():
+            is_online = self.user_status_service.is_user_online(email)
+            if is_online != was_online:
+                changed[email] = is_online
+        if not changed:
+            return
+
+        deltas: Dict[str, Dict[str, List[str]]] = {}
+        async for entry in self.db_inbox.find({"user": {"$in": list(changed)}}, {"user": 1, "room_id": 1, "_id": 0}):
+            delta = deltas.setdefault(str(entry["room_id"]), {'online': [], 'offline': []})
+            delta['online' if changed[entry["user"]] else 'offline'].append(entry["user"])
+        for room_id, delta in deltas.items():
+            await self.connection_manager.broadcast_event(presence_room(room_id), 'presence', {
+                'room_id': room_id, 'online': sorted(delta['online']), 'offline': sorted(delta['offline'])
+            })
+        self.events += len(deltas)
+
+    async def close(self):
+        """Stop the flush timer; pending changes are dropped as the connections go away anyway."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.pending.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"pending": len(self.pending), "changes": self.changes, "coalesced": self.coalesced,
+                "events": self.events}
+
+
+# Initialize the presence subscription service
+presence_subscription_service = PresenceSubscriptionService()
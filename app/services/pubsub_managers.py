@@ -0,0 +1,127 @@
+import asyncio
+from typing import Dict, Optional, Set
+
+import socketio
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+from app.config import (SOCKETIO_MESSAGE_QUEUE, SOCKETIO_CHANNEL, SOCKETIO_PUBSUB_SIZE_BYTES,
+                        SOCKETIO_OUTBOUND_QUEUE_SIZE, SOCKETIO_SLOW_CONSUMER_POLICY)
+from app.database import get_database
+from app.services import socketio_json
+from app.services.outbound_queues import QueuedAsyncManager
+
+
+class InProcessBus:
+    """Message bus shared by every manager in the same process."""
+
+    def __init__(self):
+        self.subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    def subscribe(self, channel: str = SOCKETIO_CHANNEL) -> asyncio.Queue:
+        queue = asyncio.Queue()
+        self.subscribers.setdefault(channel, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue, channel: str = SOCKETIO_CHANNEL):
+        self.subscribers.get(channel, set()).discard(queue)
+
+    def publish(self, message: dict, channel: str = SOCKETIO_CHANNEL):
+        for queue in self.subscribers.get(channel, set()):
+            queue.put_nowait(message)
+
+
+in_process_bus = InProcessBus()
+
+
+class InProcessPubSubManager(AsyncPubSubManager, QueuedAsyncManager):
+    """Pub/sub client manager over an in-process bus.
+
+    Lets several Socket.IO servers in one process behave like separate workers, which is what the
+    tests and benchmarks need.
+    """
+    name = 'inprocess'
+
+    def __init__(self, bus: InProcessBus = in_process_bus, channel: str = SOCKETIO_CHANNEL,
+                 write_only: bool = False, logger=None, max_queue_size: int = SOCKETIO_OUTBOUND_QUEUE_SIZE,
+                 policy: str = SOCKETIO_SLOW_CONSUMER_POLICY):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.configure_queues(max_queue_size, policy)
+        self.bus = bus
+        self._queue: Optional[asyncio.Queue] = None if write_only else bus.subscribe(channel)
+
+    async def _publish(self, data):
+        self.bus.publish(data, self.channel)
+
+    async def _listen(self):
+        while True:
+            yield await self._queue.get()
+
+
+class MongoPubSubManager(AsyncPubSubManager, QueuedAsyncManager):
+    """Pub/sub client manager over a capped MongoDB collection.
+
+    Every worker appends messages to the capped collection and follows it with a tailable cursor.
+    Unlike change streams, this works on a standalone mongod. As with Redis pub/sub, delivery is
+    at most once: a worker only sees messages written while its cursor is open.
+    """
+    name = 'mongo'
+
+    def __init__(self, channel: str = SOCKETIO_CHANNEL, size_bytes: int = SOCKETIO_PUBSUB_SIZE_BYTES,
+                 write_only: bool = False, logger=None, json=socketio_json,
+                 max_queue_size: int = SOCKETIO_OUTBOUND_QUEUE_SIZE, policy: str = SOCKETIO_SLOW_CONSUMER_POLICY):
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+        self.configure_queues(max_queue_size, policy)
+        self.size_bytes = size_bytes
+        self._collection: Optional[AsyncIOMotorCollection] = None
+
+    async def _get_collection(self) -> AsyncIOMotorCollection:
+        if self._collection is None:
+            db = get_database()
+            name = f"{self.channel}_pubsub"
+            try:
+                await db.create_collection(name, capped=True, size=self.size_bytes)
+                # A tailable cursor on an empty capped collection dies straight away
+                await db[name].insert_one({"payload": None})
+            except CollectionInvalid:
+                pass  # Already created by another worker
+            self._collection = db[name]
+        return self._collection
+
+    async def _publish(self, data):
+        collection = await self._get_collection()
+        # Stored encoded, so message keys never clash with BSON field name rules
+        await collection.insert_one({"payload": self.json.dumps(data)})
+
+    async def _listen(self):
+        collection = await self._get_collection()
+        last = await collection.find_one(sort=[("$natural", -1)])
+        last_id = last["_id"] if last else None
+        while True:
+            query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+            cursor = collection.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+            while cursor.alive:
+                async for document in cursor:
+                    last_id = document["_id"]
+                    if document.get("payload") is not None:
+                        yield document["payload"]
+            # The cursor dies if the collection was empty or rolled over; resume after the last message
+            await asyncio.sleep(0.5)
+
+
+def build_client_manager(backend: str = SOCKETIO_MESSAGE_QUEUE, channel: str = SOCKETIO_CHANNEL,
+                         json=socketio_json) -> Optional[socketio.AsyncManager]:
+    """Create the client manager for the configured backend.
+
+    ``memory`` keeps a single-process manager, ``inprocess`` shares messages between servers
+    in one process and ``mongo`` shares them between worker processes through MongoDB, encoded with ``json``.
+    """
+    if backend in ("", "memory"):
+        return None
+    if backend == "inprocess":
+        return InProcessPubSubManager(channel=channel)
+    if backend == "mongo":
+        return MongoPubSubManager(channel=channel, json=json)
+    raise ValueError(f"Unknown SOCKETIO_MESSAGE_QUEUE backend: {backend}")
@@ -0,0 +1,195 @@
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional, Tuple
+
+from fastapi import HTTPException, status
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import ReturnDocument
+
+from app.config import RATE_LIMIT_BACKEND, RATE_LIMIT_MAX_KEYS, RATE_LIMIT_SOCKET_MESSAGES_PER_SECOND, \
+    RATE_LIMIT_SOCKET_MESSAGES_BURST, RATE_LIMIT_USER_MESSAGES_PER_SECOND, RATE_LIMIT_USER_MESSAGES_BURST, \
+    RATE_LIMIT_LOGIN_PER_MINUTE, RATE_LIMIT_LOGIN_BURST, RATE_LIMIT_LOGIN_IP_PER_MINUTE, RATE_LIMIT_LOGIN_IP_BURST
+from app.database import get_database
+
+
+class RateLimit:
+    """Token bucket refilled with ``rate`` tokens per second and holding at most ``burst`` tokens."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0 and self.burst > 0
+
+    @property
+    def interval(self) -> float:
+        """Seconds it takes to refill one token."""
+        return 1 / self.rate
+
+
+# Limits by name; a rate of 0 disables a limit
+RATE_LIMITS: Dict[str, RateLimit] = {
+    # chat_message events per Socket.IO connection
+    "socket_message": RateLimit(RATE_LIMIT_SOCKET_MESSAGES_PER_SECOND, RATE_LIMIT_SOCKET_MESSAGES_BURST),
+    # Messages per user, sent over REST or Socket.IO
+    "message": RateLimit(RATE_LIMIT_USER_MESSAGES_PER_SECOND, RATE_LIMIT_USER_MESSAGES_BURST),
+    # Login attempts per account and per client address
+    "login": RateLimit(RATE_LIMIT_LOGIN_PER_MINUTE / 60, RATE_LIMIT_LOGIN_BURST),
+    "login_ip": RateLimit(RATE_LIMIT_LOGIN_IP_PER_MINUTE / 60, RATE_LIMIT_LOGIN_IP_BURST),
+}
+
+
+class InMemoryRateLimitBackend:
+    """Buckets local to the process, as an LRU of at most ``max_keys`` keys.
+
+    Each bucket is stored as the time at which it will be full again (GCRA), so a check is one dict
+    lookup. Evicting a key only forgets how empty its bucket was.
+    """
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._full_at: OrderedDict[str, float] = OrderedDict()
+
+    async def take(self, key: str, limit: RateLimit, now: Optional[float] = None) -> float:
+        """Take a token from the bucket; returns 0 if allowed, otherwise the seconds until one is available."""
+        now = time.time() if now is None else now
+        full_at = max(self._full_at.get(key, now), now) + limit.interval
+        # The bucket is empty once it would take longer than the whole burst to refill
+        retry_after = full_at - now - limit.burst * limit.interval
+        if retry_after > 0:
+            return retry_after
+        self._full_at[key] = full_at
+        self._full_at.move_to_end(key)
+        while len(self._full_at) > self.max_keys:
+            self._full_at.popitem(last=False)
+        return 0.0
+
+    async def give_back(self, key: str, limit: RateLimit):
+        """Return a token taken by ``take``."""
+        if key in self._full_at:
+            self._full_at[key] -= limit.interval
+
+    def clear(self):
+        self._full_at.clear()
+
+    @property
+    def size(self) -> int:
+        return len(self._full_at)
+
+
+class MongoRateLimitBackend:
+    """Buckets shared by every worker through the rate_limits collection.
+
+    A check is a single atomic update of the bucket's document. Documents expire once their bucket
+    is full again, so the collection only holds clients that are currently sending.
+    """
+
+    def __init__(self, collection: Optional[AsyncIOMotorCollection] = None):
+        self._collection = collection
+
+    @property
+    def collection(self) -> AsyncIOMotorCollection:
+        return self._collection if self._collection is not None else get_database()["rate_limits"]
+
+    async def take(self, key: str, limit: RateLimit, now: Optional[float] = None) -> float:
+        now = time.time() if now is None else now
+        limit_at = now + limit.burst * limit.interval
+        # Same computation as the in-memory backend, done by the server so concurrent workers cannot race
+        full_at = {"$add": [{"$max": [{"$ifNull": ["$full_at", now]}, now]}, limit.interval]}
+        allowed = {"$lte": ["$$full_at", limit_at]}
+        bucket = await self.collection.find_one_and_update(
+            {"_id": key},
+            [{"$set": {
+                "retry_after": {"$let": {"vars": {"full_at": full_at}, "in": {
+                    "$cond": [allowed, 0, {"$subtract": ["$$full_at", limit_at]}]}}},
+                "full_at": {"$let": {"vars": {"full_at": full_at}, "in": {
+                    "$cond": [allowed, "$$full_at", "$full_at"]}}},
+                # No bucket takes longer than this to fill up again
+                "expires_at": datetime.fromtimestamp(limit_at, timezone.utc),
+            }}],
+            upsert=True, return_document=ReturnDocument.AFTER, projection={"retry_after": True},
+        )
+        return bucket["retry_after"]
+
+    async def give_back(self, key: str, limit: RateLimit):
+        await self.collection.update_one({"_id": key}, {"$inc": {"full_at": -limit.interval}})
+
+    def clear(self):
+        pass
+
+
+class RateLimiter:
+    """Checks the token buckets of the named ``RATE_LIMITS`` and counts allowed and rejected calls."""
+
+    def __init__(self, backend=None, limits: Optional[Dict[str, RateLimit]] = None):
+        self.backend = backend or InMemoryRateLimitBackend()
+        self.limits = RATE_LIMITS if limits is None else limits
+        self.allowed: Dict[str, int] = {name: 0 for name in self.limits}
+        self.rejected: Dict[str, int] = {name: 0 for name in self.limits}
+
+    async def hit(self, name: str, key: str) -> float:
+        """Take a token for ``key``; returns 0 if allowed, otherwise the seconds to wait."""
+        limit = self.limits[name]
+        if not limit.enabled:
+            return 0.0
+        retry_after = await self.backend.take(f"{name}:{key}", limit)
+        if retry_after > 0:
+            self.rejected[name] += 1
+        else:
+            self.allowed[name] += 1
+        return retry_after
+
+    async def hit_all(self, checks: Iterable[Tuple[str, str]]) -> float:
+        """Check several (limit, key) pairs in turn, stopping at the first one that rejects.
+
+        A rejected call is not charged: the tokens already taken from the earlier buckets are given back.
+        """
+        taken = []
+        for name, key in checks:
+            retry_after = await self.hit(name, key)
+            if retry_after > 0:
+                for taken_name, taken_key in taken:
+                    await self.backend.give_back(f"{taken_name}:{taken_key}", self.limits[taken_name])
+                    self.allowed[taken_name] -= 1
+                return retry_after
+            if self.limits[name].enabled:
+                taken.append((name, key))
+        return 0.0
+
+    async def check(self, checks: Iterable[Tuple[str, str]]):
+        """Like ``hit_all``, but raises ``429 Too Many Requests`` when a limit is exceeded."""
+        retry_after = await self.hit_all(checks)
+        if retry_after > 0:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests",
+                headers={"Retry-After": str(max(1, round(retry_after)))},
+            )
+
+    def reset(self):
+        """Forget every bucket and counter, e.g. between tests."""
+        self.backend.clear()
+        self.allowed = {name: 0 for name in self.limits}
+        self.rejected = {name: 0 for name in self.limits}
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {name: {"allowed": self.allowed[name], "rejected": self.rejected[name]} for name in self.limits}
+
+
+def build_rate_limit_backend(backend: str = RATE_LIMIT_BACKEND):
+    """Create the rate limit backend.
+
+    ``memory`` limits each worker separately and ``mongo`` shares the buckets between worker processes.
+    """
+    if backend in ("", "memory"):
+        return InMemoryRateLimitBackend()
+    if backend == "mongo":
+        return MongoRateLimitBackend()
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {backend}")
+
+
+# Initialize the rate limiter
+rate_limiter = RateLimiter(build_rate_limit_backend())
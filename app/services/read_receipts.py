@@ -0,0 +1,119 @@
+import asyncio
+from typing import Dict, Optional, Tuple
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorCollection
+
+from app.config import READ_RECEIPT_FLUSH_INTERVAL_MS
+from app.crud import count_unread_messages, read_cursor_update
+from app.database import get_database
+from app.services.connection_manager import ConnectionManager, connection_manager
+
+
+class ReadReceiptService:
+    """Records how far each member has read each room.
+
+    Marks are coalesced in memory per user and room, keeping only the furthest message, and flushed once
+    per ``flush_interval_ms`` with a single bulk write. A client acknowledging every message while it
+    scrolls therefore costs one write per interval. Each flush takes the messages between the stored and the
+    new cursor off the member's unread count and tells the room who has read up to where.
+    """
+
+    def __init__(self, flush_interval_ms: int = READ_RECEIPT_FLUSH_INTERVAL_MS,
+                 connection_manager: ConnectionManager = connection_manager,
+                 db_inbox: Optional[AsyncIOMotorCollection] = None,
+                 db_messages: Optional[AsyncIOMotorCollection] = None):
+        self.flush_interval = flush_interval_ms / 1000
+        self.connection_manager = connection_manager
+        self._db_inbox = db_inbox
+        self._db_messages = db_messages
+        self.pending: Dict[Tuple[str, str], ObjectId] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.marks = 0
+        self.writes = 0
+        self.flushes = 0
+
+    @property
+    def db_inbox(self) -> AsyncIOMotorCollection:
+        return self._db_inbox if self._db_inbox is not None else get_database()["inbox"]
+
+    @property
+    def db_messages(self) -> AsyncIOMotorCollection:
+        return self._db_messages if self._db_messages is not None else get_database()["messages"]
+
+    def mark_read(self, email: str, room_id: str, message_id: ObjectId):
+        """Record that a user has read a room up to and including a message."""
+        key = (email, room_id)
+        if key not in self.pending or message_id > self.pending[key]:
+            self.pending[key] = message_id
+        self.marks += 1
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"[LOG] Read receipt flush failed: {e}")
+            if not self.pending:
+                return
+
+    async def flush(self):
+        """Write every pending read cursor."""
+        pending, self.pending = self.pending, {}
+        if not pending:
+            return
+        try:
+            entries = await asyncio.gather(*(
+                self.db_inbox.find_one({"user": email, "room_id": ObjectId(room_id)}, {"last_read_id": 1})
+                for email, room_id in pending
+            ))
+            moves: Dict[Tuple[str, str], Tuple[Optional[ObjectId], ObjectId]] = {}
+            for ((email, room_id), message_id), entry in zip(pending.items(), entries):
+                previous_read_id = entry.get("last_read_id") if entry else None
+                # Skip rooms the user has left and cursors that would move back
+                if entry is not None and (previous_read_id is None or previous_read_id < message_id):
+                    moves[(email, room_id)] = (previous_read_id, message_id)
+            read_counts = await asyncio.gather(*(
+                count_unread_messages(self.db_messages, ObjectId(room_id), email, previous_read_id, message_id)
+                for (email, room_id), (previous_read_id, message_id) in moves.items()
+            ))
+            if moves:
+                result = await self.db_inbox.bulk_write([
+                    read_cursor_update(email, ObjectId(room_id), previous_read_id, message_id, read_count)
+                    for ((email, room_id), (previous_read_id, message_id)), read_count
+                    in zip(moves.items(), read_counts)
+                ], ordered=False)
+                if result.matched_count < len(moves):
+                    # Another worker moved a cursor meanwhile; the next flush starts from the stored one
+                    self._requeue({key: message_id for key, (_, message_id) in moves.items()})
+        except Exception:
+            # Keep the cursors for the next flush, unless newer ones arrived meanwhile
+            self._requeue(pending)
+            raise
+        self.writes += len(moves)
+        self.flushes += 1
+
+        for (email, room_id), (_, message_id) in moves.items():
+            await self.connection_manager.broadcast_event(room_id, 'read_receipt', {
+                'room_id': room_id, 'user': email, 'message_id': str(message_id)
+            })
+
+    def _requeue(self, cursors: Dict[Tuple[str, str], ObjectId]):
+        for key, message_id in cursors.items():
+            if key not in self.pending or message_id > self.pending[key]:
+                self.pending[key] = message_id
+
+    async def close(self):
+        """Write the pending cursors and stop the flush timer."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+
+# Initialize the read receipt service
+read_receipt_service = ReadReceiptService()
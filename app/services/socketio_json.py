@@ -0,0 +1,24 @@
+"""orjson-backed ``json`` module for Socket.IO packets.
+
+python-socketio and python-engineio only call ``dumps`` and ``loads`` on the module they are given. Payloads
+wrapped by :func:`encode_payload` are already JSON, so they are copied into each packet as-is instead of
+being serialized again.
+"""
+from typing import Any
+
+import orjson
+from pydantic import BaseModel
+
+
+def dumps(obj: Any, **kwargs) -> str:
+    # orjson output is always compact, so the separators socketio asks for are already what it produces
+    return orjson.dumps(obj).decode()
+
+
+def loads(s, **kwargs) -> Any:
+    return orjson.loads(s)
+
+
+def encode_payload(model: BaseModel) -> orjson.Fragment:
+    """Serialize a model once into a payload that can be embedded in any number of packets."""
+    return orjson.Fragment(model.__pydantic_serializer__.to_json(model))
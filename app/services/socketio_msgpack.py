@@ -0,0 +1,66 @@
+"""MessagePack encoding for the Socket.IO server that binary clients connect to.
+
+Frames are MessagePack instead of JSON text, datetimes travel as native MessagePack timestamps, and
+the keys of event payloads are shortened with ``COMPACT_KEYS``, e.g. a new message is sent as
+``{"s": sender, "c": content, "t": timestamp}``. Incoming events may use either the short or the
+long keys; handlers always see the long ones.
+"""
+from datetime import datetime, timezone
+from typing import Any
+
+import msgpack
+from socketio.msgpack_packet import MsgPackPacket
+
+# Payload key -> key sent to MessagePack clients
+COMPACT_KEYS = {
+    "sender": "s",
+    "content": "c",
+    "timestamp": "t",
+    "room_id": "r",
+    "room": "rm",
+    "message": "m",
+    "message_id": "mi",
+    "user": "u",
+    "status": "st",
+    "id": "i",
+}
+EXPANDED_KEYS = {short: key for key, short in COMPACT_KEYS.items()}
+
+
+def encode_default(obj: Any) -> Any:
+    if isinstance(obj, datetime):
+        if obj.tzinfo is None:
+            obj = obj.replace(tzinfo=timezone.utc)  # Stored timestamps are UTC
+        return msgpack.Timestamp.from_datetime(obj)
+    raise TypeError(f"Cannot serialize {type(obj).__name__} to MessagePack")
+
+
+def rename_keys(data: Any, keys: dict) -> Any:
+    """Rename the keys of every dict in a payload; values are left alone."""
+    if isinstance(data, dict):
+        return {keys.get(key, key): rename_keys(value, keys) for key, value in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [rename_keys(item, keys) for item in data]
+    return data
+
+
+def dumps(obj: Any, **kwargs) -> bytes:
+    return msgpack.packb(obj, default=encode_default)
+
+
+def loads(s: bytes, **kwargs) -> Any:
+    return msgpack.unpackb(s, timestamp=3)  # Timestamps back to datetime
+
+
+class CompactMsgPackPacket(MsgPackPacket):
+    """Socket.IO packet encoded as MessagePack with compact payload keys."""
+
+    def encode(self):
+        packet = self._to_dict()
+        if "data" in packet:
+            packet["data"] = rename_keys(packet["data"], COMPACT_KEYS)
+        return dumps(packet)
+
+    def decode(self, encoded_packet):
+        super().decode(encoded_packet)
+        self.data = rename_keys(self.data, EXPANDED_KEYS)
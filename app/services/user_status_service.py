@@ -1,45 +1,145 @@
-from typing import Dict, Set
+import asyncio
+from typing import Callable, Dict, Iterable, List, Optional, Set
 
+from app.config import WORKER_ID, PRESENCE_HEARTBEAT_SECONDS, PRESENCE_TTL_SECONDS
 from app.services.connection_manager import connection_manager
+from app.services.presence_backends import build_presence_backend
 
 
 class UserStatusService:
-    def __init__(self):
+    """Registry of online users.
+
+    Connections held by this worker are tracked in memory with a sid -> user reverse index, so connect
+    and disconnect are O(1). A heartbeat mirrors them to the shared presence backend, extends their TTL
+    and pulls the users online on other workers.
+    """
+
+    def __init__(self, backend=None, worker_id: str = WORKER_ID,
+                 heartbeat_seconds: int = PRESENCE_HEARTBEAT_SECONDS, ttl_seconds: int = PRESENCE_TTL_SECONDS):
         self.active_connections: Dict[str, Set[str]] = {}
+        self.sid_to_user: Dict[str, str] = {}
+        self.backend = backend
+        self.worker_id = worker_id
+        self.heartbeat_seconds = heartbeat_seconds
+        self.ttl_seconds = ttl_seconds
+        self.remote_online_users: Set[str] = set()  # Users online on other workers, as of the last heartbeat
+        self._added: Dict[str, str] = {}  # Connections not yet written to the backend
+        self._removed: Set[str] = set()  # Connections not yet removed from the backend
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self.presence_listeners: List[Callable[[str, bool], None]] = []
+
+    def add_presence_listener(self, listener: Callable[[str, bool], None]):
+        """Call ``listener(email, was_online)`` when a user's first connection here opens or the last one closes."""
+        self.presence_listeners.append(listener)
+
+    def _notify_presence(self, email: str, was_online: bool):
+        for listener in self.presence_listeners:
+            listener(email, was_online)
 
     def is_user_online(self, email: str) -> bool:
-        return email in self.active_connections
+        return email in self.active_connections or email in self.remote_online_users
+
+    def online_statuses(self, emails: Iterable[str]) -> Dict[str, bool]:
+        """Resolve the presence of many users at once."""
+        return {email: self.is_user_online(email) for email in emails}
+
+    def get_user_by_sid(self, sid: str) -> Optional[str]:
+        return self.sid_to_user.get(sid)
 
     def set_user_online(self, email: str, sid: str):
+        was_online = None
         if email not in self.active_connections:
+            was_online = self.is_user_online(email)
             self.active_connections[email] = set()
         self.active_connections[email].add(sid)
-        print(f"[LOG] User {email} connected with SID {sid}. Active connections: {self.active_connections}")
+        self.sid_to_user[sid] = email
+        self._added[sid] = email
+        self._removed.discard(sid)
+        if was_online is not None:
+            self._notify_presence(email, was_online)
+        print(f"[LOG] User {email} connected with SID {sid}. Active connections: {len(self.sid_to_user)}")
 
     def set_user_offline(self, email: str, sid: str):
         if email in self.active_connections:
-            self.active_connections[email].remove(sid)
-            if not self.active_connections[email]:
+            self.active_connections[email].discard(sid)
+            last_connection = not self.active_connections[email]
+            if last_connection:
                 del self.active_connections[email]
-            print(f"[LOG] User {email} disconnected with SID {sid}. Remaining connections: {self.active_connections}")
+            self.sid_to_user.pop(sid, None)
+            if self._added.pop(sid, None) is None:
+                self._removed.add(sid)
+            print(f"[LOG] User {email} disconnected with SID {sid}. Remaining connections: {len(self.sid_to_user)}")
+            if last_connection:
+                self._notify_presence(email, True)
+
+    def set_sid_offline(self, sid: str) -> Optional[str]:
+        """Mark a connection offline by sid alone and return the user it belonged to."""
+        email = self.sid_to_user.get(sid)
+        if email is not None:
+            self.set_user_offline(email, sid)
+        return email
 
     @property
     def online_users(self) -> Set[str]:
-        return set(self.active_connections.keys())
+        return set(self.active_connections.keys()) | self.remote_online_users
 
     def get_room_online_users(self, room: str) -> Set[str]:
         # Assuming that room corresponds to a key in the active_connections dict
         return set(self.active_connections.get(room, set()))
 
+    async def heartbeat(self):
+        """Sync local connections to the backend, extend their TTL and refresh remote presence."""
+        if self.backend is None:
+            return
+        added, self._added = self._added, {}
+        removed, self._removed = self._removed, set()
+        try:
+            await self.backend.remove(removed)
+            await self.backend.add(added, self.worker_id, self.ttl_seconds)
+            await self.backend.touch(self.worker_id, self.ttl_seconds)
+            self.remote_online_users = await self.backend.online_users(exclude_worker=self.worker_id)
+        except Exception:
+            # Retry the same changes on the next heartbeat
+            self._added = {**added, **self._added}
+            self._removed |= removed
+            raise
+
+    async def _run_heartbeat(self):
+        while True:
+            try:
+                await self.heartbeat()
+            except Exception as e:
+                print(f"[LOG] Presence heartbeat failed: {e}")
+            await asyncio.sleep(self.heartbeat_seconds)
+
+    def start_heartbeat(self):
+        if self._heartbeat_task is None:
+            self._heartbeat_task = asyncio.create_task(self._run_heartbeat())
+
+    async def stop_heartbeat(self):
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        if self.backend is not None:
+            # Leave the shared store right away instead of waiting for the TTL
+            try:
+                await self.backend.remove(list(self.sid_to_user) + list(self._removed))
+            except Exception as e:
+                print(f"[LOG] Could not remove presence on shutdown: {e}")
+
     async def broadcast(self, message: str, room: str = None):
         if room:
             targets = [sid for sid in self.active_connections.get(room, set())]
         else:
             targets = [sid for sids in self.active_connections.values() for sid in sids]
 
-        for sid in targets:
-            await connection_manager.send(sid, message)
+        # One emit for every target; each connection's queue delivers it without waiting for the others
+        await connection_manager.send_many(targets, message)
 
     @staticmethod
     async def send_personal_message(message: str, sid: str):
         await connection_manager.send(sid, message)
+
+
+# Initialize the presence registry shared by HTTP and Socket.IO handlers
+user_status_service = UserStatusService(backend=build_presence_backend())
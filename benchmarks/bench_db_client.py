@@ -0,0 +1,59 @@
+"""Compare a new Motor client per request with the shared, pooled client.
+
+Run against the database configured in ``.env``::
+
+    python -m benchmarks.bench_db_client --requests 500
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.config import DATABASE_URL, DATABASE_NAME
+from app.database import connect_to_mongo, close_mongo_connection, get_database
+
+
+async def per_request_client(requests: int) -> List[float]:
+    """Old behaviour: every request builds its own client before querying."""
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        client = AsyncIOMotorClient(DATABASE_URL)
+        await client[DATABASE_NAME]["users"].find_one({"email": "benchmark@example.com"})
+        latencies.append(time.perf_counter() - start)
+        client.close()
+    return latencies
+
+
+async def shared_client(requests: int) -> List[float]:
+    """New behaviour: every request reuses the lifespan-managed pool."""
+    await connect_to_mongo()
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        await get_database()["users"].find_one({"email": "benchmark@example.com"})
+        latencies.append(time.perf_counter() - start)
+    close_mongo_connection()
+    return latencies
+
+
+def report(name: str, latencies: List[float]) -> None:
+    latencies = sorted(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"{name:<20} mean {statistics.mean(latencies) * 1000:8.3f} ms   "
+          f"p50 {statistics.median(latencies) * 1000:8.3f} ms   p99 {p99 * 1000:8.3f} ms")
+
+
+async def main(requests: int) -> None:
+    report("per-request client", await per_request_client(requests))
+    report("shared client", await shared_client(requests))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests))
@@ -0,0 +1,67 @@
+"""Measure cross-worker Socket.IO fan-out throughput.
+
+Starts ``--workers`` Socket.IO servers that share a pub/sub backend, connects ``--sockets`` fake clients
+to the same room on each of them and broadcasts ``--messages`` messages from the first worker::
+
+    python -m benchmarks.bench_fanout --backend inprocess
+    python -m benchmarks.bench_fanout --backend mongo   # needs the database from .env
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timezone
+
+from app.services.connection_manager import ConnectionManager, SocketIOMessage
+from app.services.pubsub_managers import InProcessBus, InProcessPubSubManager, MongoPubSubManager
+
+
+async def start_worker(backend: str, bus: InProcessBus, sockets: int, messages: int,
+                       counter: list) -> ConnectionManager:
+    # Outbound queues large enough for the whole burst, so no frame is dropped
+    if backend == "mongo":
+        client_manager = MongoPubSubManager(channel="benchmark", max_queue_size=messages)
+    else:
+        client_manager = InProcessPubSubManager(bus=bus, max_queue_size=messages)
+    worker = ConnectionManager(client_manager=client_manager)
+
+    async def count_packet(eio_sid, eio_pkt):
+        counter[0] += 1
+
+    worker.sio._send_eio_packet = count_packet
+    worker.sio.manager.initialize()
+    for i in range(sockets):
+        sid = await worker.sio.manager.connect(f"eio-{id(worker)}-{i}", '/')
+        await worker.sio.manager.enter_room(sid, '/', "benchmark_room")
+    return worker
+
+
+async def main(backend: str, workers: int, sockets: int, messages: int):
+    bus = InProcessBus()
+    counter = [0]
+    servers = [await start_worker(backend, bus, sockets, messages, counter) for _ in range(workers)]
+    await asyncio.sleep(0.5)  # let every listener subscribe
+
+    expected = workers * sockets * messages
+    message = SocketIOMessage(sender="benchmark@example.com", content="x" * 100, timestamp=datetime.now(timezone.utc))
+    start = time.perf_counter()
+    for _ in range(messages):
+        await servers[0].broadcast("benchmark_room", message)
+    while counter[0] < expected and time.perf_counter() - start < 60:
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - start
+
+    print(f"{backend}: {workers} workers x {sockets} sockets, {messages} messages")
+    print(f"  delivered {counter[0]}/{expected} frames in {elapsed:.3f} s")
+    print(f"  {messages / elapsed:.0f} messages/s, {counter[0] / elapsed:.0f} frames/s")
+    for server in servers:
+        server.sio.manager.thread.cancel()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=["inprocess", "mongo"], default="inprocess")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--sockets", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(main(args.backend, args.workers, args.sockets, args.messages))
@@ -0,0 +1,93 @@
+"""Measure the cost of encoding and sending one chat message to a room.
+
+The old path emitted every REST message twice: ``broadcast_message`` built from ``model_dump`` and
+``chat_response`` built from ``jsonable_encoder``, both encoded with the standard ``json`` module. The new path
+encodes the message once and emits it once. Frames are recorded instead of sent, so no clients or database are
+needed::
+
+    python -m benchmarks.bench_message_encoding --recipients 100 --messages 2000
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+
+from fastapi.encoders import jsonable_encoder
+from socketio import packet
+
+from app.services import socketio_json
+from app.services.connection_manager import ConnectionManager, SocketIOMessage
+
+
+async def start_server(recipients: int, frames: list) -> ConnectionManager:
+    manager = ConnectionManager()
+
+    async def record_packet(eio_sid, eio_pkt):
+        frames.append(eio_pkt.data)
+
+    manager.sio._send_eio_packet = record_packet
+    for i in range(recipients):
+        sid = await manager.sio.manager.connect(f"eio{i}", '/')
+        await manager.sio.manager.enter_room(sid, '/', "benchmark_room")
+    return manager
+
+
+async def old_path(manager: ConnectionManager, message: SocketIOMessage):
+    await manager.sio.emit('broadcast_message', message.model_dump(mode='json'), room="benchmark_room")
+    await manager.sio.emit('chat_response', {'room_id': "benchmark_room", 'message': jsonable_encoder(message)},
+                           room="benchmark_room")
+
+
+async def new_path(manager: ConnectionManager, message: SocketIOMessage):
+    await manager.broadcast("benchmark_room", message)
+
+
+async def run(name: str, json_module, send, recipients: int, messages: int):
+    packet.Packet.json = json_module
+    frames = []
+    manager = await start_server(recipients, frames)
+    message = SocketIOMessage(sender="benchmark@example.com", content="x" * 200, timestamp=datetime.now(timezone.utc))
+
+    start = time.perf_counter()
+    for _ in range(messages):
+        await send(manager, message)
+        await manager.flush()  # Hand the frames to the (recorded) transports
+    elapsed = time.perf_counter() - start
+
+    print(f"{name:<4} fan-out  {messages / elapsed:9.0f} messages/s   "
+          f"{len(frames) / (messages * recipients):.0f} frames per message per recipient")
+
+
+def measure_encoding(messages: int):
+    """Time only the serialization of one message into its packet text."""
+    message = SocketIOMessage(sender="benchmark@example.com", content="x" * 200, timestamp=datetime.now(timezone.utc))
+
+    start = time.perf_counter()
+    for _ in range(messages):
+        json.dumps(['broadcast_message', message.model_dump(mode='json')], separators=(',', ':'))
+        json.dumps(['chat_response', {'room_id': "benchmark_room", 'message': jsonable_encoder(message)}],
+                   separators=(',', ':'))
+    old = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(messages):
+        socketio_json.dumps(['broadcast_message', socketio_json.encode_payload(message)])
+    new = time.perf_counter() - start
+
+    print(f"old  encode   {old / messages * 1e6:7.2f} us/message")
+    print(f"new  encode   {new / messages * 1e6:7.2f} us/message")
+
+
+async def main(recipients: int, messages: int):
+    measure_encoding(messages)
+    await run("old", json, old_path, recipients, messages)
+    await run("new", socketio_json, new_path, recipients, messages)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--recipients", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(main(args.recipients, args.messages))
@@ -0,0 +1,84 @@
+"""Compare per-message writes with the batched MessageWriter under concurrent senders.
+
+Each sender posts messages to its own room. The old path costs two round trips per message (insert the message,
+then bump the room counter); the writer groups concurrent messages into one ``insert_many`` and one counter
+``bulk_write``. Run against the database configured in ``.env``::
+
+    python -m benchmarks.bench_message_writes --senders 200 --messages 10
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import List
+
+from bson import ObjectId
+
+from app.crud import message_document, create_message, increment_message_count
+from app.database import connect_to_mongo, close_mongo_connection, get_database
+from app.schemas import MessageCreateSchema
+from app.services.message_writer import MessageWriter
+
+
+def percentile(latencies: List[float], fraction: float) -> float:
+    return latencies[max(int(len(latencies) * fraction) - 1, 0)]
+
+
+async def per_message(db, room_id: ObjectId, message: MessageCreateSchema, latencies: List[float]):
+    """Old behaviour: every message is its own insert plus its own counter update."""
+    start = time.perf_counter()
+    await create_message(db["messages"], room_id, message)
+    await increment_message_count(db["chat_rooms"], room_id)
+    latencies.append(time.perf_counter() - start)
+
+
+async def batched(writer: MessageWriter, room_id: ObjectId, message: MessageCreateSchema, latencies: List[float]):
+    """New behaviour: the message joins the writer's current batch."""
+    start = time.perf_counter()
+    await writer.submit(message_document(room_id, message))
+    latencies.append(time.perf_counter() - start)
+
+
+async def run(name: str, senders: int, messages: int, send):
+    db = get_database()
+    room_ids = [(await db["chat_rooms"].insert_one({"name": "benchmark", "members": [],
+                                                    "message_count": 0})).inserted_id for _ in range(senders)]
+    latencies: List[float] = []
+
+    async def sender(room_id: ObjectId):
+        for i in range(messages):
+            message = MessageCreateSchema(sender="benchmark@example.com", content=f"message {i}",
+                                          timestamp=datetime.now(timezone.utc).isoformat())
+            await send(room_id, message, latencies)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(sender(room_id) for room_id in room_ids))
+    elapsed = time.perf_counter() - start
+
+    await db["messages"].delete_many({"room_id": {"$in": room_ids}})
+    await db["chat_rooms"].delete_many({"_id": {"$in": room_ids}})
+    latencies.sort()
+    print(f"{name:<12} {len(latencies) / elapsed:9.1f} messages/s   p50 {percentile(latencies, 0.5) * 1000:7.2f} ms   "
+          f"p99 {percentile(latencies, 0.99) * 1000:7.2f} ms")
+
+
+async def main(senders: int, messages: int):
+    await connect_to_mongo()
+    db = get_database()
+    await run("per message", senders, messages,
+              lambda room_id, message, latencies: per_message(db, room_id, message, latencies))
+
+    writer = MessageWriter()
+    await run("batched", senders, messages,
+              lambda room_id, message, latencies: batched(writer, room_id, message, latencies))
+    await writer.close()
+    print(f"batched: {writer.messages_written} messages in {writer.batches_written} batches")
+    close_mongo_connection()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--senders", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.senders, args.messages))
@@ -0,0 +1,115 @@
+"""Measure presence traffic: global online lists versus room snapshots, and presence events under reconnect storms.
+
+``--users`` users are online, spread over rooms of ``--room-size`` members. The first part compares the bytes of
+one ``get_online_users`` answer with the whole online set against a room's snapshot. In the second part
+``--flapping`` users disconnect and reconnect ``--flaps`` times within one window; presence events are sent
+once per change or coalesced per window. Inbox entries are written to the ``{DATABASE_NAME}_presence_benchmark``
+database, which is dropped afterwards, and frames are recorded instead of sent::
+
+    python -m benchmarks.bench_presence --users 20000 --room-size 50 --flapping 500 --flaps 5
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import time
+from typing import List, Tuple
+
+import orjson
+from bson import ObjectId
+
+from app.config import DATABASE_NAME
+from app.database import get_client, close_mongo_connection
+from app.indexes import apply_indexes
+from app.services.connection_manager import ConnectionManager
+from app.services.membership_service import MembershipService
+from app.services.presence_subscriptions import PresenceSubscriptionService, presence_room
+from app.services.user_status_service import UserStatusService
+
+
+def quiet():
+    """Silence the per-connection log lines of the user status service."""
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+async def start(db, users: int, room_size: int, frames: list) -> Tuple[PresenceSubscriptionService, List[str]]:
+    connection_manager = ConnectionManager()
+
+    async def record_packet(eio_sid, eio_pkt):
+        frames.append(eio_pkt.data)
+
+    connection_manager.sio._send_eio_packet = record_packet
+    connection_manager.sio.manager.initialize()
+    membership_service = MembershipService(max_size=users, db_chat_rooms=db["chat_rooms"])
+    service = PresenceSubscriptionService(flush_interval_ms=1000, connection_manager=connection_manager,
+                                          user_status_service=UserStatusService(),
+                                          membership_service=membership_service, db_inbox=db["inbox"])
+
+    entries, room_ids = [], []
+    for start_index in range(0, users, room_size):
+        room_id = ObjectId()
+        room_ids.append(str(room_id))
+        members = [f"user{i}@example.com" for i in range(start_index, min(start_index + room_size, users))]
+        membership_service.set_members(str(room_id), members)
+        entries.extend({"user": member, "room_id": room_id} for member in members)
+        # One subscriber per room
+        sid = await connection_manager.sio.manager.connect(f"eio-{room_id}", '/')
+        await connection_manager.sio.manager.enter_room(sid, '/', presence_room(str(room_id)))
+    await db["inbox"].insert_many(entries)
+    with quiet():
+        for i in range(users):
+            service.user_status_service.set_user_online(f"user{i}@example.com", f"sid{i}")
+    service.pending.clear()
+    return service, room_ids
+
+
+async def main(users: int, room_size: int, flapping: int, flaps: int):
+    db = get_client()[f"{DATABASE_NAME}_presence_benchmark"]
+    await apply_indexes(db)
+    frames = []
+    try:
+        service, room_ids = await start(db, users, room_size, frames)
+        status = service.user_status_service
+
+        global_list = orjson.dumps(sorted(status.online_users))
+        snapshot = orjson.dumps(await service.snapshot("user0@example.com", room_ids[0]))
+        print(f"get_online_users: {len(global_list):9d} bytes for every online user, "
+              f"{len(snapshot):6d} bytes for a room snapshot")
+
+        for name, per_change in (("per change", True), ("coalesced", False)):
+            frames.clear()
+            with quiet():
+                start_time = time.perf_counter()
+                for i in range(flapping):
+                    email, sid = f"user{i * room_size % users}@example.com", f"sid{i * room_size % users}"
+                    for flap in range(flaps):
+                        status.set_sid_offline(sid if flap == 0 else f"flap{i}-{flap}")
+                        if per_change:
+                            await service.flush()
+                        status.set_user_online(email, f"flap{i}-{flap + 1}")
+                        if per_change:
+                            await service.flush()
+                await service.flush()
+                await service.connection_manager.flush()
+                elapsed = time.perf_counter() - start_time
+                # Back to the original connections for the next round
+                for i in range(flapping):
+                    status.set_sid_offline(f"flap{i}-{flaps}")
+                    status.set_user_online(f"user{i * room_size % users}@example.com", f"sid{i * room_size % users}")
+                service.pending.clear()
+            print(f"{name:<11} {flapping} users x {flaps} reconnects: {len(frames):6d} presence frames "
+                  f"in {elapsed:.3f} s")
+        await service.close()
+    finally:
+        await get_client().drop_database(db.name)
+        close_mongo_connection()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--room-size", type=int, default=50)
+    parser.add_argument("--flapping", type=int, default=200, help="Users that reconnect")
+    parser.add_argument("--flaps", type=int, default=5, help="Reconnects per user within one window")
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.room_size, args.flapping, args.flaps))
@@ -0,0 +1,60 @@
+"""Measure the cost of a rate limit check as the number of tracked clients grows.
+
+Each round spreads ``--checks`` checks over a number of keys, so the buckets fill up and some checks are rejected.
+The ``memory`` backend needs nothing else; ``mongo`` uses the ``rate_limits`` collection of the
+``{DATABASE_NAME}_rate_limit_benchmark`` database::
+
+    python -m benchmarks.bench_rate_limiter --keys 1000 100000 1000000
+    python -m benchmarks.bench_rate_limiter --backend mongo --checks 5000
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from app.config import DATABASE_NAME
+from app.database import connect_to_mongo, close_mongo_connection, get_client
+from app.services.rate_limiter import InMemoryRateLimitBackend, MongoRateLimitBackend, RateLimit, RateLimiter
+
+
+async def run(limiter: RateLimiter, keys: int, checks: int):
+    # Random keys, so the LRU is exercised as it would be with many clients
+    names = [f"user{random.randrange(keys)}@example.com" for _ in range(checks)]
+    start = time.perf_counter()
+    for name in names:
+        await limiter.hit("message", name)
+    elapsed = time.perf_counter() - start
+    stats = limiter.stats()["message"]
+    print(f"{keys:>9} keys   {elapsed / checks * 1e6:8.2f} us/check   {checks / elapsed:10.0f} checks/s   "
+          f"{stats['rejected']} of {checks} rejected")
+
+
+async def main(backend: str, key_counts: list, checks: int):
+    limits = {"message": RateLimit(rate=1, burst=5)}
+    if backend == "mongo":
+        await connect_to_mongo()
+        db = get_client()[f"{DATABASE_NAME}_rate_limit_benchmark"]
+        try:
+            for keys in key_counts:
+                await db["rate_limits"].delete_many({})
+                await run(RateLimiter(MongoRateLimitBackend(db["rate_limits"]), limits), keys, checks)
+        finally:
+            await get_client().drop_database(db.name)
+            close_mongo_connection()
+        return
+
+    for keys in key_counts:
+        backend = InMemoryRateLimitBackend(max_keys=max(key_counts))
+        # Start with every key tracked, as on a busy worker
+        for i in range(keys):
+            await backend.take(f"message:user{i}@example.com", limits["message"])
+        await run(RateLimiter(backend, limits), keys, checks)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=["memory", "mongo"], default="memory")
+    parser.add_argument("--keys", type=int, nargs="+", default=[1000, 100000, 1000000])
+    parser.add_argument("--checks", type=int, default=200000)
+    args = parser.parse_args()
+    asyncio.run(main(args.backend, args.keys, args.checks))
@@ -0,0 +1,72 @@
+"""Compare the old and the single-pass serialization of a page of messages.
+
+The old path converted each MongoDB document to ``MessageInDB``, then to ``MessageResponseSchema``, and FastAPI
+validated and encoded the page once more through ``response_model``. The new path builds the response from the
+documents directly and encodes it with orjson. No database is needed::
+
+    python -m benchmarks.bench_response_serialization --page-size 50 --pages 2000
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from app.crud import message_from_doc
+from app.schemas import MessagePageResponseSchema, MessageResponseSchema
+from app.services.chat_service import ChatService
+
+RESPONSE_FIELD = create_model_field(name="Response_get_all_messages", type_=MessagePageResponseSchema)
+
+
+def documents(page_size: int) -> list:
+    return [{"_id": ObjectId(), "room_id": ObjectId(), "sender": "benchmark@example.com",
+             "content": f"message {i} " + "lorem ipsum " * 8, "timestamp": datetime.now(timezone.utc)}
+            for i in range(page_size)]
+
+
+async def old_path(page: list) -> bytes:
+    messages = [message_from_doc(document) for document in page]
+    schema = MessagePageResponseSchema(messages=[
+        MessageResponseSchema(id=str(message.id), sender=message.sender, content=message.content,
+                              timestamp=message.timestamp.isoformat())
+        for message in messages
+    ], next_cursor=str(messages[0].id))
+    content = await serialize_response(field=RESPONSE_FIELD, response_content=schema)
+    return JSONResponse(content).body
+
+
+async def new_path(page: list) -> bytes:
+    content = {"messages": [ChatService.message_payload(document) for document in page],
+               "next_cursor": str(page[0]["_id"])}
+    return ORJSONResponse(content).body
+
+
+async def run(name: str, serialize, page: list, pages: int) -> bytes:
+    start = time.perf_counter()
+    for _ in range(pages):
+        body = await serialize(page)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<12} {len(page) * pages / elapsed:12.0f} messages/s   {elapsed / pages * 1e6:8.1f} us/page")
+    return body
+
+
+async def main(page_size: int, pages: int):
+    page = documents(page_size)
+    old_body = await run("old path", old_path, page, pages)
+    new_body = await run("single pass", new_path, page, pages)
+    # Both paths must produce the same document, whatever the byte-level formatting
+    assert MessagePageResponseSchema.model_validate_json(old_body) == \
+        MessagePageResponseSchema.model_validate_json(new_body)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--pages", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(main(args.page_size, args.pages))
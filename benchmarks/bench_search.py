@@ -0,0 +1,107 @@
+"""Measure message search latency as the history grows.
+
+A synthetic corpus of messages with Zipf-distributed words is written to a scratch database in steps. After
+each step a user belonging to ``--user-rooms`` of the rooms runs two-word searches through the search index,
+and for comparison the same searches as a case-insensitive regex over the rooms' messages, which is what a
+search without an index amounts to. The index stays flat while the scan grows with the corpus. Run against
+the database server configured in ``.env``; the scratch database is dropped afterwards::
+
+    python -m benchmarks.bench_search --messages 2000000 --steps 4
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timezone
+from typing import List
+
+from bson import ObjectId
+
+from app.config import DATABASE_NAME, SEARCH_MAX_CANDIDATES, SEARCH_PAGE_SIZE
+from app.crud import insert_message_batch, rank_message_ids, get_messages_by_ids, search_terms
+from app.database import get_client, close_mongo_connection
+from app.indexes import apply_indexes
+
+VOCABULARY = [f"word{i}" for i in range(20000)]
+# Zipf weights: a few words are very common, most are rare, as in real chat
+WEIGHTS = [1 / (rank + 1) for rank in range(len(VOCABULARY))]
+
+
+def percentile(latencies: List[float], fraction: float) -> float:
+    return latencies[max(int(len(latencies) * fraction) - 1, 0)]
+
+
+def synthetic_messages(room_ids: List[ObjectId], count: int) -> List[dict]:
+    now = datetime.now(timezone.utc)
+    return [
+        {"_id": ObjectId(), "room_id": random.choice(room_ids), "sender": "benchmark@example.com",
+         "content": " ".join(random.choices(VOCABULARY, WEIGHTS, k=random.randint(5, 15))), "timestamp": now}
+        for _ in range(count)
+    ]
+
+
+async def indexed_search(db, query: str, room_ids: List[ObjectId]) -> int:
+    ranked = await rank_message_ids(db["message_terms"], search_terms(query), room_ids, SEARCH_MAX_CANDIDATES)
+    page = await get_messages_by_ids(db["messages"], [message_id for message_id, _ in ranked[:SEARCH_PAGE_SIZE]])
+    return len(page)
+
+
+async def scan_search(db, query: str, room_ids: List[ObjectId]) -> int:
+    pattern = "|".join(search_terms(query))
+    cursor = db["messages"].find({"room_id": {"$in": room_ids}, "content": {"$regex": pattern, "$options": "i"}})
+    return len(await cursor.sort("_id", -1).limit(SEARCH_PAGE_SIZE).to_list(None))
+
+
+async def measure(name: str, corpus: int, queries: List[str], search):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        await search(query)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    print(f"{corpus:>10} messages   {name:<8} p50 {percentile(latencies, 0.5) * 1000:8.2f} ms   "
+          f"p99 {percentile(latencies, 0.99) * 1000:8.2f} ms")
+
+
+async def main(messages: int, steps: int, rooms: int, user_rooms: int, queries: int, batch_size: int, scan: bool):
+    db = get_client()[f"{DATABASE_NAME}_search_benchmark"]
+    await db.client.drop_database(db.name)
+    await apply_indexes(db)
+    room_ids = [ObjectId() for _ in range(rooms)]
+    await db["chat_rooms"].insert_many([{"_id": room_id, "name": "benchmark", "members": [], "message_count": 0}
+                                        for room_id in room_ids])
+    searched_rooms = random.sample(room_ids, min(user_rooms, rooms))
+    # Mostly uncommon words, which is what people search for
+    search_queries = [" ".join(random.choices(VOCABULARY[100:5000], k=2)) for _ in range(queries)]
+
+    written = 0
+    try:
+        for step in range(1, steps + 1):
+            target = messages * step // steps
+            while written < target:
+                batch = synthetic_messages(room_ids, min(batch_size, target - written))
+                await insert_message_batch(db["messages"], db["chat_rooms"], batch,
+                                           db_message_terms=db["message_terms"])
+                written += len(batch)
+            await measure("index", written, search_queries,
+                          lambda query: indexed_search(db, query, searched_rooms))
+            if scan:
+                await measure("scan", written, search_queries,
+                              lambda query: scan_search(db, query, searched_rooms))
+    finally:
+        await db.client.drop_database(db.name)
+        close_mongo_connection()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000000)
+    parser.add_argument("--steps", type=int, default=4, help="Corpus sizes to measure at, evenly spaced")
+    parser.add_argument("--rooms", type=int, default=5000)
+    parser.add_argument("--user-rooms", type=int, default=50, help="Rooms the searching user belongs to")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--no-scan", dest="scan", action="store_false", help="Skip the unindexed comparison")
+    args = parser.parse_args()
+    asyncio.run(main(args.messages, args.steps, args.rooms, args.user_rooms, args.queries, args.batch_size,
+                     args.scan))
@@ -0,0 +1,92 @@
+"""Measure how slow Socket.IO clients delay broadcasts to the healthy ones, inline sends versus outbound queues.
+
+Broadcasts ``--messages`` chat messages, one every ``--interval-ms``, to a room of ``--healthy`` clients and
+``--slow`` clients whose transport takes ``--stall-ms`` per frame. The latency of a healthy client is the time from
+a message's scheduled send until the client has it. Frames are recorded instead of sent, so no clients or database
+are needed::
+
+    python -m benchmarks.bench_slow_consumers --healthy 200 --slow 5 --stall-ms 50
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime, timezone
+
+import socketio
+
+from app.services.connection_manager import ConnectionManager, SocketIOMessage
+from app.services.outbound_queues import QueuedAsyncManager
+
+
+async def start_server(client_manager: socketio.AsyncManager, healthy: int, slow: int, stall: float,
+                       latencies: list, schedule: list) -> ConnectionManager:
+    manager = ConnectionManager(client_manager=client_manager)
+    received = {}
+
+    async def record_packet(eio_sid, eio_pkt):
+        if eio_sid.startswith("slow"):
+            await asyncio.sleep(stall)
+            return
+        # Healthy clients get every frame in order, so the count tells which message arrived
+        index = received[eio_sid] = received.get(eio_sid, -1) + 1
+        latencies.append(time.perf_counter() - schedule[index])
+
+    manager.sio._send_eio_packet = record_packet
+    manager.sio.manager.initialize()
+    for eio_sid in [f"healthy{i}" for i in range(healthy)] + [f"slow{i}" for i in range(slow)]:
+        sid = await manager.sio.manager.connect(eio_sid, '/')
+        await manager.sio.manager.enter_room(sid, '/', "benchmark_room")
+    return manager
+
+
+async def run(name: str, client_manager: socketio.AsyncManager, healthy: int, slow: int, stall: float,
+              messages: int, interval: float):
+    latencies, schedule = [], []
+    manager = await start_server(client_manager, healthy, slow, stall, latencies, schedule)
+    message = SocketIOMessage(sender="benchmark@example.com", content="x" * 40, timestamp=datetime.now(timezone.utc))
+
+    start = time.perf_counter()
+    schedule.extend(start + i * interval for i in range(messages))
+    for i in range(messages):
+        delay = schedule[i] - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await manager.broadcast("benchmark_room", message)
+    # Frames already queued for the slow clients do not count towards the healthy ones
+    while len(latencies) < healthy * messages and time.perf_counter() - start < 120:
+        await asyncio.sleep(0.001)
+
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(f"{name:<7} healthy latency p50 {p50:8.2f} ms   p99 {p99:8.2f} ms   max {latencies[-1] * 1000:8.2f} ms")
+    if isinstance(client_manager, QueuedAsyncManager):
+        print(f"        outbound queues: {manager.outbound_stats()}")
+    for queue in getattr(client_manager, "queues", {}).values():
+        if queue.task is not None:
+            queue.task.cancel()
+
+
+async def main(healthy: int, slow: int, stall_ms: float, messages: int, interval_ms: float, queue_size: int,
+               policy: str):
+    print(f"{healthy} healthy and {slow} slow clients ({stall_ms} ms per frame), {messages} messages "
+          f"every {interval_ms} ms")
+    stall, interval = stall_ms / 1000, interval_ms / 1000
+    await run("inline", socketio.AsyncManager(), healthy, slow, stall, messages, interval)
+    await run("queued", QueuedAsyncManager(max_queue_size=queue_size, policy=policy), healthy, slow, stall, messages,
+              interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--healthy", type=int, default=200)
+    parser.add_argument("--slow", type=int, default=5)
+    parser.add_argument("--stall-ms", type=float, default=50, help="Time a slow client takes per frame")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--interval-ms", type=float, default=5, help="Time between broadcasts")
+    parser.add_argument("--queue-size", type=int, default=64)
+    parser.add_argument("--policy", choices=["drop_oldest", "coalesce", "disconnect"], default="drop_oldest")
+    args = parser.parse_args()
+    asyncio.run(main(args.healthy, args.slow, args.stall_ms, args.messages, args.interval_ms, args.queue_size,
+                     args.policy))
@@ -0,0 +1,61 @@
+"""Compare bytes per frame and CPU per broadcast of the JSON and the MessagePack Socket.IO servers.
+
+Connects ``--recipients`` fake clients to a room on one server at a time and broadcasts ``--messages`` chat
+messages to them. Frames are recorded instead of sent, so no clients or database are needed::
+
+    python -m benchmarks.bench_socketio_msgpack --recipients 100 --messages 2000
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timezone
+
+import socketio
+
+from app.services.connection_manager import ConnectionManager, SocketIOMessage
+
+
+async def start_server(server: socketio.AsyncServer, recipients: int, frames: list):
+    async def record_packet(eio_sid, eio_pkt):
+        frames.append(eio_pkt.data)
+
+    server._send_eio_packet = record_packet
+    for i in range(recipients):
+        sid = await server.manager.connect(f"eio{i}", '/')
+        await server.manager.enter_room(sid, '/', "benchmark_room")
+
+
+async def run(name: str, server: socketio.AsyncServer, manager: ConnectionManager, recipients: int, messages: int,
+              content: str):
+    frames = []
+    await start_server(server, recipients, frames)
+    message = SocketIOMessage(sender="benchmark@example.com", content=content, timestamp=datetime.now(timezone.utc))
+
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    for _ in range(messages):
+        await manager.broadcast("benchmark_room", message)
+        await manager.flush()  # Hand the frames to the (recorded) transports
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+
+    frame_bytes = sum(len(frame) for frame in frames) / len(frames)
+    print(f"{name:<8} {frame_bytes:7.1f} bytes/frame   {cpu / messages * 1e6:8.1f} us CPU/broadcast   "
+          f"{messages / wall:9.0f} broadcasts/s   ({len(frames)} frames)")
+
+
+async def main(recipients: int, messages: int, content_length: int):
+    content = "x" * content_length
+    # Each server in turn holds all recipients; the other one has nobody to send to
+    json_manager = ConnectionManager()
+    await run("json", json_manager.sio, json_manager, recipients, messages, content)
+    msgpack_manager = ConnectionManager(msgpack=True)
+    await run("msgpack", msgpack_manager.msgpack_sio, msgpack_manager, recipients, messages, content)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--recipients", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--content-length", type=int, default=40, help="Characters per message")
+    args = parser.parse_args()
+    asyncio.run(main(args.recipients, args.messages, args.content_length))
@@ -0,0 +1,13 @@
+import pytest
+from pytest_benchmark.utils import parse_compare_fail
+
+# Used with --benchmark-compare unless --benchmark-compare-fail is given
+REGRESSION_THRESHOLD = "median:15%"
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_configure(config):
+    if config.pluginmanager.hasplugin("_cov") and not config.getoption("no_cov", False):
+        raise pytest.UsageError("Run the benchmarks with --no-cov; coverage tracing distorts the timings")
+    if config.getoption("benchmark_compare") and not config.getoption("benchmark_compare_fail"):
+        config.option.benchmark_compare_fail = [parse_compare_fail(REGRESSION_THRESHOLD)]
@@ -0,0 +1,74 @@
+"""Rooms and message histories shared by the hot path benchmarks, served from memory."""
+import bisect
+import itertools
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Any, Dict, List
+
+from bson import ObjectId
+from pymongo import DESCENDING
+
+# Messages per room, from a new conversation to a long-lived group chat
+SIZES = (10, 1_000, 100_000)
+
+ROOM_ID = ObjectId()
+MEMBERS = [f"user{i}@example.com" for i in range(50)]
+CONTENT = "See you at the station at half past six, the train to the coast leaves at seven sharp"
+
+
+@lru_cache(maxsize=None)
+def room_messages(size: int) -> List[Dict[str, Any]]:
+    """Message documents of a room, oldest first, as stored in the messages collection."""
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    return [
+        {"_id": ObjectId(), "sender": MEMBERS[i % len(MEMBERS)], "content": CONTENT,
+         "timestamp": start + timedelta(seconds=i), "room_id": ROOM_ID}
+        for i in range(size)
+    ]
+
+
+def legacy_room_document(size: int) -> Dict[str, Any]:
+    """A chat room document from before messages had their own collection, with its history embedded."""
+    return {
+        "_id": ROOM_ID, "name": "Weekend trip", "members": MEMBERS, "is_group_chat": True, "message_count": size,
+        "messages": [{key: value for key, value in message.items() if key != "room_id"}
+                     for message in room_messages(size)],
+    }
+
+
+class MessageCollection:
+    """The messages of one room, answering the indexed queries of ``crud.get_message_documents`` in memory."""
+
+    def __init__(self, documents: List[Dict[str, Any]]):
+        self.documents = documents
+        self.ids = [document["_id"] for document in documents]
+
+    def find(self, query: Dict[str, Any]) -> "MessageCursor":
+        assert query["room_id"] == ROOM_ID
+        id_range = query.get("_id", {})
+        start = bisect.bisect_right(self.ids, id_range["$gt"]) if "$gt" in id_range else 0
+        end = bisect.bisect_left(self.ids, id_range["$lt"]) if "$lt" in id_range else len(self.ids)
+        return MessageCursor(self.documents, start, end)
+
+
+class MessageCursor:
+    def __init__(self, documents: List[Dict[str, Any]], start: int, end: int):
+        self.documents = documents
+        self.start = start
+        self.end = end
+        self.descending = False
+        self.count = None
+
+    def sort(self, key: str, direction: int) -> "MessageCursor":
+        self.descending = direction == DESCENDING
+        return self
+
+    def limit(self, count: int) -> "MessageCursor":
+        self.count = count
+        return self
+
+    async def __aiter__(self):
+        indexes = range(self.end - 1, self.start - 1, -1) if self.descending else range(self.start, self.end)
+        for index in itertools.islice(indexes, self.count):
+            # Motor hands out a new document for every result
+            yield dict(self.documents[index])
@@ -0,0 +1,159 @@
+"""Micro-benchmarks of the code every message passes through, for rooms of 10, 1k and 100k messages.
+
+No database is needed: message pages are served from memory and Socket.IO frames are discarded instead of
+sent. Save a baseline on the base commit, then compare a change against it; the run fails when a benchmark's
+median got more than 15% slower (``REGRESSION_THRESHOLD`` in ``conftest.py``)::
+
+    python -m pytest benchmarks --no-cov --benchmark-save=baseline
+    python -m pytest benchmarks --no-cov --benchmark-compare
+"""
+import asyncio
+import itertools
+from datetime import datetime, timezone
+
+import pytest
+
+from app.crud import document_to_dict, message_from_doc, chat_room_from_doc
+from app.models import UserInDB
+from app.schemas import MessageCreateSchema
+from app.services.chat_service import ChatService
+from app.services.connection_manager import ConnectionManager, SocketIOMessage
+from app.services.membership_service import MembershipService
+from app.services import user_status_service as user_status_module
+from app.services.user_status_service import UserStatusService
+from benchmarks.hot_path_data import SIZES, ROOM_ID, MEMBERS, CONTENT, room_messages, legacy_room_document, \
+    MessageCollection
+
+USER = UserInDB(id="1", email=MEMBERS[0], username="user0", hashed_password="")
+
+
+class StoredMessageWriter:
+    """Stands in for the message writer, returning each document as if its batch had been written."""
+
+    async def submit(self, document):
+        return document
+
+
+def rounds(size: int) -> int:
+    return max(5, min(1000, 100_000 // size))
+
+
+def legacy_room_copy(room: dict) -> dict:
+    # document_to_dict renames the _id of the embedded messages in place
+    return {**room, "messages": [dict(message) for message in room["messages"]]}
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+async def start_connection_manager(recipients: int) -> ConnectionManager:
+    connection_manager = ConnectionManager()
+
+    async def discard_packet(eio_sid, eio_pkt):
+        pass
+
+    connection_manager.sio._send_eio_packet = discard_packet
+    connection_manager.sio.manager.initialize()
+    for i in range(recipients):
+        sid = await connection_manager.sio.manager.connect(f"eio{i}", '/')
+        await connection_manager.connect(str(ROOM_ID), sid)
+    return connection_manager
+
+
+def chat_service(db_messages=None, connection_manager=None) -> ChatService:
+    membership_service = MembershipService()
+    membership_service.set_members(str(ROOM_ID), MEMBERS)
+    return ChatService(db_chat_rooms=None, db_messages=db_messages, db_inbox=None, db_message_terms=None,
+                       connection_manager=connection_manager, user_status_service=UserStatusService(),
+                       message_writer=StoredMessageWriter(), membership_service=membership_service,
+                       media_storage=None, media_processor=None, read_receipt_service=None)
+
+
+def test_document_to_dict_message(benchmark):
+    benchmark(document_to_dict, room_messages(1)[0])
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_document_to_dict_legacy_room(benchmark, size):
+    room = legacy_room_document(size)
+    benchmark.pedantic(document_to_dict, setup=lambda: ((legacy_room_copy(room),), {}), rounds=rounds(size))
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_message_from_doc_history(benchmark, size):
+    # What GET /chat/chat_rooms/{room_id}?include=messages converts
+    documents = room_messages(size)
+    messages = benchmark(lambda: [message_from_doc(document) for document in documents])
+    assert len(messages) == size
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_chat_room_from_doc_legacy_room(benchmark, size):
+    room = legacy_room_document(size)
+    chat_room = benchmark.pedantic(chat_room_from_doc, setup=lambda: ((legacy_room_copy(room),), {}),
+                                   rounds=rounds(size))
+    assert len(chat_room.messages) == size
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_get_all_messages_latest_page(benchmark, loop, size):
+    service = chat_service(db_messages=MessageCollection(room_messages(size)))
+    page = benchmark(lambda: loop.run_until_complete(service.get_all_messages(str(ROOM_ID), USER)))
+    assert len(page["messages"]) == min(size, 50)
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_get_all_messages_older_page(benchmark, loop, size):
+    documents = room_messages(size)
+    service = chat_service(db_messages=MessageCollection(documents))
+    before = str(documents[size // 2]["_id"])
+    benchmark(lambda: loop.run_until_complete(service.get_all_messages(str(ROOM_ID), USER, before=before)))
+
+
+def test_create_new_message(benchmark, loop):
+    connection_manager = loop.run_until_complete(start_connection_manager(len(MEMBERS)))
+    service = chat_service(connection_manager=connection_manager)
+
+    async def create_new_message():
+        message = MessageCreateSchema(sender=USER.email, content=CONTENT, timestamp="")
+        response = await service.create_new_message(str(ROOM_ID), message, USER)
+        await connection_manager.flush()
+        return response
+
+    assert benchmark(lambda: loop.run_until_complete(create_new_message())).content == CONTENT
+
+
+@pytest.mark.parametrize("recipients", (10, 1_000))
+def test_broadcast(benchmark, loop, recipients):
+    connection_manager = loop.run_until_complete(start_connection_manager(recipients))
+    message = SocketIOMessage(sender=USER.email, content=CONTENT, timestamp=datetime.now(timezone.utc))
+
+    async def broadcast():
+        await connection_manager.broadcast(str(ROOM_ID), message)
+        await connection_manager.flush()
+
+    benchmark(lambda: loop.run_until_complete(broadcast()))
+    assert connection_manager.outbound_stats()["dropped"] == 0
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_set_user_online(benchmark, monkeypatch, size):
+    """Connect and disconnect one user while ``size`` others are online, so the registry keeps its size."""
+    # Measure the registry, not the [LOG] line written to the terminal on every change
+    monkeypatch.setattr(user_status_module, "print", lambda *args, **kwargs: None, raising=False)
+    user_status_service = UserStatusService()
+    for i in range(size):
+        user_status_service.set_user_online(f"online{i}@example.com", f"sid{i}")
+    sids = (f"new{i}" for i in itertools.count())
+
+    def connect_and_disconnect():
+        sid = next(sids)
+        user_status_service.set_user_online(USER.email, sid)
+        user_status_service.set_sid_offline(sid)
+
+    benchmark(connect_and_disconnect)
+    assert len(user_status_service.sid_to_user) == size
@@ -0,0 +1,59 @@
+"""Compare two load test reports, e.g. of the parent commit and of a change.
+
+Prints throughput and p50/p99 latency per request with the change from ``base`` to ``new``, and exits with
+status 1 when a request's p99 got more than ``--threshold`` percent slower or its throughput dropped by as
+much. Both runs should use the same options and the same database backend::
+
+    python -m loadtests.compare reports/base.json reports/new.json --threshold 10
+"""
+import argparse
+import json
+import sys
+from typing import Dict, Optional
+
+
+def load(path: str) -> dict:
+    with open(path) as report_file:
+        return json.load(report_file)
+
+
+def change(base: float, new: float) -> Optional[float]:
+    """Relative change in percent, or None without a base value."""
+    return (new / base - 1) * 100 if base else None
+
+
+def format_change(value: Optional[float]) -> str:
+    return "     n/a" if value is None else f"{value:+7.1f}%"
+
+
+def main(base_path: str, new_path: str, threshold: float) -> int:
+    base, new = load(base_path), load(new_path)
+    print(f"base {base['commit'][:12] or '?'} {base['label']}  ->  new {new['commit'][:12] or '?'} {new['label']}")
+    base_requests: Dict[tuple, dict] = {(entry["type"], entry["name"]): entry for entry in base["requests"]}
+    regressions = []
+    print(f"{'request':<52} {'rps':>9} {'change':>8} {'p50 ms':>8} {'change':>8} {'p99 ms':>8} {'change':>8}")
+    for entry in new["requests"] + [new["total"]]:
+        key = (entry["type"], entry["name"])
+        name = " ".join(key).strip()
+        before = base["total"] if entry is new["total"] else base_requests.get(key)
+        if before is None:
+            print(f"{name[:52]:<52} {entry['rps']:9.1f}  (not in base)")
+            continue
+        rps, p50, p99 = (change(before[stat], entry[stat]) for stat in ("rps", "p50_ms", "p99_ms"))
+        print(f"{name[:52]:<52} {entry['rps']:9.1f} {format_change(rps)} {entry['p50_ms']:8.0f} "
+              f"{format_change(p50)} {entry['p99_ms']:8.0f} {format_change(p99)}")
+        if (p99 is not None and p99 > threshold) or (rps is not None and rps < -threshold):
+            regressions.append(name)
+    if regressions:
+        print(f"Regressed by more than {threshold}%: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Percent of change counted as a regression")
+    args = parser.parse_args()
+    sys.exit(main(args.base, args.new, args.threshold))
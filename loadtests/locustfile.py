@@ -0,0 +1,214 @@
+"""Load test scenarios for ``app.main:sio_app``.
+
+- ``SignupLoginUser``: a signup and login storm; every iteration registers a new user and logs in.
+- ``MessagePostUser``: a steady mix of posting messages, reading the latest page of a room and the inbox.
+- ``HistoryReadUser``: reads a room's history back through ``--history-pages`` pages of the cursor.
+- ``SocketIOUser``: a Socket.IO client that receives its room's broadcasts and sends a message now and then.
+  The time from sending a message to receiving its broadcast is reported as ``WS broadcast_message``.
+
+All but the storm log in as users seeded by ``loadtests/seed.py`` or ``loadtests/serve.py --memory``. Each
+simulated user draws its choices from a random generator seeded with its number, so a run with the same options
+sends the same requests. When the run ends, throughput and latency percentiles per request are written as JSON
+to ``--report``; compare two with ``python -m loadtests.compare``::
+
+    locust --config loadtests/locust.conf MessagePostUser SocketIOUser --report reports/mix.json
+"""
+import itertools
+import json
+import os
+import random
+import subprocess
+import time
+from datetime import datetime, timezone
+
+import socketio
+from locust import HttpUser, constant_pacing, constant_throughput, events, task
+from locust.runners import WorkerRunner
+
+# Must match loadtests/seed.py
+EMAIL_DOMAIN = "loadtest.example.com"
+DEFAULT_PASSWORD = "loadtest-password"
+SENT_AT_MARKER = " sent_at="
+
+# Numbers the simulated users, across every scenario of this process
+user_numbers = itertools.count()
+
+
+@events.init_command_line_parser.add_listener
+def add_arguments(parser):
+    group = parser.add_argument_group("Chat service")
+    group.add_argument("--seed-users", type=int, default=1000, help="Users created by the seed script")
+    group.add_argument("--seed-password", default=DEFAULT_PASSWORD, help="Password of the seeded users")
+    group.add_argument("--history-pages", type=int, default=5, help="Pages read back per history read")
+    group.add_argument("--report", default="loadtest-report.json", help="Where to write the JSON report")
+    group.add_argument("--label", default="", help="Free text stored in the report, e.g. the database used")
+
+
+def message_content(rng: random.Random) -> str:
+    """A message carrying the time it was sent, so receivers can report the delivery latency."""
+    return f"Load test message {rng.randrange(1_000_000)}{SENT_AT_MARKER}{time.time():.6f}"
+
+
+class SignupLoginUser(HttpUser):
+    wait_time = constant_throughput(1)
+    weight = 1
+
+    def on_start(self):
+        self.number = next(user_numbers)
+        # Distinct across runs, so a database that is not reseeded has no duplicates
+        self.prefix = f"storm{int(time.time())}n{self.number}"
+        self.iterations = itertools.count()
+
+    @task
+    def signup_and_login(self):
+        username = f"{self.prefix}i{next(self.iterations)}"
+        email = f"{username}@{EMAIL_DOMAIN}"
+        response = self.client.post("/auth/signup", json={"email": email, "username": username,
+                                                          "password": DEFAULT_PASSWORD})
+        if response.status_code == 201:
+            self.client.post("/auth/login", data={"username": email, "password": DEFAULT_PASSWORD})
+
+
+class SeededUser(HttpUser):
+    """Logs in as a seeded user and looks up the user's rooms before running its tasks."""
+    abstract = True
+
+    def on_start(self):
+        self.number = next(user_numbers)
+        self.rng = random.Random(self.number)
+        options = self.environment.parsed_options
+        self.email = f"loadtest{self.number % options.seed_users}@{EMAIL_DOMAIN}"
+        response = self.client.post("/auth/login", data={"username": self.email, "password": options.seed_password})
+        if response.status_code != 200:
+            raise RuntimeError(f"Login as {self.email} failed with {response.status_code}; is the database seeded?")
+        self.token = response.json()["access_token"]
+        self.client.headers["Authorization"] = f"Bearer {self.token}"
+        entries = self.client.get("/chat/inbox/").json()["entries"]
+        if not entries:
+            raise RuntimeError(f"{self.email} has no rooms; is the database seeded?")
+        self.room_ids = [entry["room_id"] for entry in entries]
+
+    def post_message(self, room_id: str):
+        self.client.post(f"/chat/chat_rooms/{room_id}/messages", name="/chat/chat_rooms/[room_id]/messages",
+                         json={"sender": self.email, "content": message_content(self.rng), "timestamp": ""})
+
+
+class MessagePostUser(SeededUser):
+    wait_time = constant_throughput(1)
+    weight = 4
+
+    @task(6)
+    def post(self):
+        self.post_message(self.rng.choice(self.room_ids))
+
+    @task(3)
+    def read_latest_page(self):
+        room_id = self.rng.choice(self.room_ids)
+        self.client.get(f"/chat/chat_rooms/{room_id}/messages", name="/chat/chat_rooms/[room_id]/messages")
+
+    @task(1)
+    def read_inbox(self):
+        self.client.get("/chat/inbox/")
+
+
+class HistoryReadUser(SeededUser):
+    wait_time = constant_throughput(1)
+    weight = 3
+
+    @task
+    def read_history(self):
+        room_id = self.rng.choice(self.room_ids)
+        url = f"/chat/chat_rooms/{room_id}/messages"
+        page = self.client.get(url, name="/chat/chat_rooms/[room_id]/messages").json()
+        for _ in range(self.environment.parsed_options.history_pages - 1):
+            if not page.get("next_cursor"):
+                break
+            page = self.client.get(url, params={"before": page["next_cursor"]},
+                                   name="/chat/chat_rooms/[room_id]/messages?before").json()
+
+
+class SocketIOUser(SeededUser):
+    """A Socket.IO client; the room broadcasts it receives are what this scenario measures."""
+    wait_time = constant_pacing(5)
+    weight = 2
+
+    def on_start(self):
+        super().on_start()
+        self.sio = socketio.Client(reconnection=False)
+        self.sio.on("broadcast_message", self.on_broadcast)
+        start = time.perf_counter()
+        exception = None
+        try:
+            self.sio.connect(self.host, headers={"Authorization": f"Bearer {self.token}"}, transports=["websocket"],
+                             wait_timeout=10)
+        except socketio.exceptions.ConnectionError as e:
+            exception = e
+        events.request.fire(request_type="WS", name="connect", response_time=(time.perf_counter() - start) * 1000,
+                            response_length=0, exception=exception, context={})
+
+    def on_stop(self):
+        self.sio.disconnect()
+
+    def on_broadcast(self, data):
+        content = data.get("content", "") if isinstance(data, dict) else ""
+        if SENT_AT_MARKER not in content:
+            return
+        sent_at = float(content.rpartition(SENT_AT_MARKER)[2])
+        events.request.fire(request_type="WS", name="broadcast_message",
+                            response_time=(time.time() - sent_at) * 1000, response_length=len(content),
+                            exception=None, context={})
+
+    @task
+    def send_message(self):
+        if self.sio.connected:
+            self.sio.emit("chat_message", {"room": self.rng.choice(self.room_ids),
+                                           "message": message_content(self.rng)})
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def entry_report(entry) -> dict:
+    return {
+        "type": entry.method,
+        "name": entry.name,
+        "requests": entry.num_requests,
+        "failures": entry.num_failures,
+        "rps": round(entry.total_rps, 2),
+        "avg_ms": round(entry.avg_response_time, 2),
+        "p50_ms": entry.get_response_time_percentile(0.5),
+        "p90_ms": entry.get_response_time_percentile(0.9),
+        "p99_ms": entry.get_response_time_percentile(0.99),
+        "max_ms": round(entry.max_response_time or 0, 2),
+    }
+
+
+@events.quitting.add_listener
+def write_report(environment, **kwargs):
+    if isinstance(environment.runner, WorkerRunner) or environment.runner is None:
+        return  # The master reports for its workers
+    options = environment.parsed_options
+    stats = environment.runner.stats
+    report = {
+        "commit": git_commit(),
+        "label": options.label,
+        "started_at": datetime.fromtimestamp(stats.start_time, timezone.utc).isoformat(),
+        "duration_s": round(stats.last_request_timestamp - stats.start_time, 1)
+        if stats.last_request_timestamp else 0.0,
+        "host": environment.host,
+        "users": options.num_users,
+        "spawn_rate": options.spawn_rate,
+        "user_classes": sorted(user_class.__name__ for user_class in environment.user_classes),
+        "requests": [entry_report(entry) for _, entry in sorted(stats.entries.items())],
+        "total": entry_report(stats.total),
+    }
+    if os.path.dirname(options.report):
+        os.makedirs(os.path.dirname(options.report), exist_ok=True)
+    with open(options.report, "w") as report_file:
+        json.dump(report, report_file, indent=2)
+    print(f"[LOG] Load test report written to {options.report}")
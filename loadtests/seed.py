@@ -0,0 +1,93 @@
+"""Seed the users, chat rooms and message history the load test scenarios log in with and read.
+
+Users are ``loadtest{i}@loadtest.example.com`` with the password ``--password``, grouped into group chats of
+``--room-size`` members, each holding ``--messages`` messages. The password is hashed once and shared, so
+seeding does not spend minutes in bcrypt. Existing load test data is replaced::
+
+    python -m loadtests.seed --users 1000 --room-size 50 --messages 1000
+"""
+import argparse
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+
+from app.crud import hash_password, inbox_entry, chat_room_from_doc, insert_message_batch
+from app.database import get_database, close_mongo_connection
+from app.indexes import apply_indexes
+
+EMAIL_DOMAIN = "loadtest.example.com"
+DEFAULT_PASSWORD = "loadtest-password"
+# Messages inserted per batch while seeding
+BATCH_SIZE = 1000
+
+
+def user_email(index: int) -> str:
+    return f"loadtest{index}@{EMAIL_DOMAIN}"
+
+
+def message_id(timestamp: datetime, room_index: int, index: int) -> ObjectId:
+    """A unique message id that sorts by timestamp like one generated when the message was sent."""
+    return ObjectId(int(timestamp.timestamp()).to_bytes(4, "big") + room_index.to_bytes(4, "big")
+                    + index.to_bytes(4, "big"))
+
+
+async def seed(db, users: int, room_size: int, messages: int, password: str = DEFAULT_PASSWORD):
+    """Replace the load test data in ``db`` with freshly seeded users, rooms and messages."""
+    await apply_indexes(db)
+    emails = [user_email(i) for i in range(users)]
+    old_rooms = [room["_id"] async for room in db["chat_rooms"].find({"members": {"$in": emails}}, {"_id": 1})]
+    await db["users"].delete_many({"email": {"$regex": f"@{EMAIL_DOMAIN}$"}})
+    await db["chat_rooms"].delete_many({"_id": {"$in": old_rooms}})
+    await db["messages"].delete_many({"room_id": {"$in": old_rooms}})
+    await db["inbox"].delete_many({"room_id": {"$in": old_rooms}})
+    await db["message_terms"].delete_many({"room_id": {"$in": old_rooms}})
+
+    hashed_password = hash_password(password)
+    await db["users"].insert_many([
+        {"email": email, "username": email.split("@")[0], "full_name": None, "hashed_password": hashed_password}
+        for email in emails
+    ])
+
+    # Message timestamps count back from now, one second apart, so pages have a stable order
+    start = datetime.now(timezone.utc) - timedelta(seconds=messages)
+    for room_index, first in enumerate(range(0, users, room_size)):
+        members = emails[first:first + room_size]
+        room = {"_id": ObjectId(), "name": f"Load test room {room_index}", "members": members,
+                "is_group_chat": True, "message_count": 0}
+        await db["chat_rooms"].insert_one(room)
+        chat_room = chat_room_from_doc(room)
+        await db["inbox"].insert_many([inbox_entry(room["_id"], member, chat_room) for member in members])
+
+        documents = []
+        for i in range(messages):
+            timestamp = start + timedelta(seconds=i)
+            documents.append({"_id": message_id(timestamp, room_index, i), "sender": members[i % len(members)],
+                              "content": f"Seeded message {i} in room {room_index}", "timestamp": timestamp,
+                              "room_id": room["_id"]})
+            if len(documents) == BATCH_SIZE:
+                await insert_message_batch(db["messages"], db["chat_rooms"], documents, db_inbox=db["inbox"],
+                                           db_message_terms=db["message_terms"])
+                documents = []
+        if documents:
+            await insert_message_batch(db["messages"], db["chat_rooms"], documents, db_inbox=db["inbox"],
+                                       db_message_terms=db["message_terms"])
+    print(f"[LOG] Seeded {users} users in {(users + room_size - 1) // room_size} rooms "
+          f"with {messages} messages each")
+
+
+async def main(users: int, room_size: int, messages: int, password: str):
+    try:
+        await seed(get_database(), users, room_size, messages, password)
+    finally:
+        close_mongo_connection()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--room-size", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=1000, help="Messages per room")
+    parser.add_argument("--password", default=DEFAULT_PASSWORD)
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.room_size, args.messages, args.password))
@@ -0,0 +1,64 @@
+"""Serve ``app.main:sio_app`` for a load test, against MongoDB or an in-memory stand-in.
+
+Without ``--memory`` the service uses ``DATABASE_URL`` like in production; seed it first with
+``python -m loadtests.seed``. With ``--memory`` every collection lives in the server process through
+``mongomock-motor`` (``pip install mongomock-motor``) and is seeded on startup, so no mongod is needed. The
+stand-in measures the service rather than MongoDB: compare results only with runs against the same backend.
+It has no indexes, so duplicate signups are not rejected.
+
+Every simulated client of a load test shares one address, so the per-address login limit is turned off
+unless ``RATE_LIMIT_LOGIN_IP_PER_MINUTE`` is set::
+
+    python -m loadtests.serve --memory --users 1000 --room-size 50 --messages 1000
+"""
+import argparse
+import asyncio
+import os
+
+import uvicorn
+from dotenv import load_dotenv
+
+# Settings from the environment and .env win; app.config reads them on import
+load_dotenv()
+os.environ.setdefault("RATE_LIMIT_LOGIN_IP_PER_MINUTE", "0")
+
+
+def use_in_memory_database():
+    """Point the shared MongoDB client at one mongomock-motor client for the life of the process."""
+    try:
+        from mongomock_motor import AsyncMongoMockClient
+    except ImportError:
+        raise SystemExit("--memory needs mongomock-motor: pip install mongomock-motor")
+    os.environ.setdefault("DATABASE_NAME", "chat_loadtest")
+
+    from app import database, indexes
+    client = AsyncMongoMockClient()
+    # get_client creates a new client whenever the event loop changes; it must keep finding the same data
+    database.create_client = lambda: client
+    # mongomock scans a whole collection for each insert into a uniquely indexed one
+    indexes.INDEXES.clear()
+
+
+async def main(host: str, port: int, memory: bool, users: int, room_size: int, messages: int):
+    if memory:
+        # Imported once the database settings are in place
+        from app.database import get_database
+        from loadtests.seed import seed
+
+        await seed(get_database(), users, room_size, messages)
+    config = uvicorn.Config("app.main:sio_app", host=host, port=port, log_level="warning")
+    await uvicorn.Server(config).serve()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--memory", action="store_true", help="Use a seeded in-memory database instead of MongoDB")
+    parser.add_argument("--users", type=int, default=1000, help="Users to seed with --memory")
+    parser.add_argument("--room-size", type=int, default=50, help="Members per seeded room with --memory")
+    parser.add_argument("--messages", type=int, default=1000, help="Messages per seeded room with --memory")
+    args = parser.parse_args()
+    if args.memory:
+        use_in_memory_database()
+    asyncio.run(main(args.host, args.port, args.memory, args.users, args.room_size, args.messages))
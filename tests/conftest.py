@@ -11,7 +11,12 @@ from motor.motor_asyncio import AsyncIOMotorClient
 
 from app.database import get_database
 from app.dependencies import get_db
+from app.indexes import apply_indexes
 from app.main import app
+from app.services.auth_cache import principal_cache
+from app.services.media_processor import media_processor
+from app.services.media_storage import media_storage
+from app.services.rate_limiter import rate_limiter
 
 # Load environment variables
 load_dotenv()
@@ -39,17 +44,37 @@ async def setup_db():
     # Override the dependency to use the test database
     app.dependency_overrides[get_database] = lambda: db
 
+    # Signup relies on the unique indexes to reject duplicates
+    await apply_indexes(db)
+
     yield db
 
     # Close the database connection after tests
     client.close()
 
 
+@pytest.fixture(autouse=True)
+def reset_rate_limits():
+    # Every test logs in from the same address
+    rate_limiter.reset()
+
+
+@pytest.fixture(autouse=True)
+def media_directory(tmp_path, monkeypatch):
+    # Uploads go to a directory of their own, and no job of an earlier test is reused
+    directory = str(tmp_path / "media")
+    monkeypatch.setattr(media_storage, "directory", directory)
+    monkeypatch.setattr(media_processor, "jobs", type(media_processor.jobs)())
+    return directory
+
+
 @pytest.fixture(scope="function")
 async def clear_db(setup_db):
     db = setup_db
     for collection_name in await db.list_collection_names():
         await db[collection_name].delete_many({})
+    # The deleted users must not stay authenticated through their cached tokens
+    principal_cache.clear()
     yield db
 
 
@@ -1,7 +1,11 @@
 import pytest
 from fastapi.testclient import TestClient
+from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
 
 from app.main import app
+from app.services.auth_cache import principal_cache
+from app.services.password_hasher import password_hasher
+from app.services.rate_limiter import RATE_LIMITS, RateLimit
 
 
 @pytest.fixture
@@ -68,6 +72,28 @@ async def test_get_current_user(test_client: TestClient, clear_db):
     assert "id" in data
 
 
+@pytest.mark.anyio
+async def test_rehash_on_login_invalidates_cached_user(test_client: TestClient, clear_db, monkeypatch):
+    test_client.post("/auth/signup", json={"username": "rehash", "email": "rehash@example.com",
+                                           "password": "password123"})
+    token = test_client.post("/auth/login", data={"username": "rehash@example.com",
+                                                  "password": "password123"}).json()["access_token"]
+    assert test_client.get("/auth/users/me", headers={"Authorization": f"Bearer {token}"}).status_code == 200
+    assert principal_cache.get(token) is not None
+
+    # The stored hash is outdated, so the next login replaces it
+    verify_and_update = password_hasher.verify_and_update
+
+    async def rehash(password, hashed_password):
+        valid, _ = await verify_and_update(password, hashed_password)
+        return valid, hashed_password
+
+    monkeypatch.setattr(password_hasher, "verify_and_update", rehash)
+    response = test_client.post("/auth/login", data={"username": "rehash@example.com", "password": "password123"})
+    assert response.status_code == 200
+    assert principal_cache.get(token) is None
+
+
 @pytest.mark.anyio
 async def test_signup_with_duplicate_email(test_client: TestClient, clear_db):
     # First create the user
@@ -106,3 +132,37 @@ async def test_signup_with_duplicate_username(test_client: TestClient, clear_db)
 
     assert response.status_code == 400
     assert response.json() == {"detail": "Username already registered"}
+
+
+@pytest.mark.anyio
+async def test_login_rate_limited(test_client: TestClient, clear_db):
+    # Failed attempts use up the account's bucket too; the unknown user means no password is hashed
+    for _ in range(RATE_LIMITS["login"].burst):
+        response = test_client.post("/auth/login", data={"username": "guess@example.com", "password": "wrong"})
+        assert response.status_code == 401
+
+    response = test_client.post("/auth/login", data={"username": "guess@example.com", "password": "wrong"})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    # Other accounts are not affected
+    response = test_client.post("/auth/login", data={"username": "other@example.com", "password": "wrong"})
+    assert response.status_code == 401
+
+
+@pytest.mark.anyio
+async def test_login_rate_limited_per_forwarded_address(clear_db, monkeypatch):
+    monkeypatch.setitem(RATE_LIMITS, "login_ip", RateLimit(rate=1 / 60, burst=3))
+    # As run behind nginx: the proxy is trusted to pass on the client address
+    proxied_client = TestClient(ProxyHeadersMiddleware(app, trusted_hosts="testclient"))
+    for i in range(3):
+        response = proxied_client.post("/auth/login", data={"username": f"guess{i}@example.com", "password": "wrong"},
+                                       headers={"X-Forwarded-For": "203.0.113.7"})
+        assert response.status_code == 401
+
+    response = proxied_client.post("/auth/login", data={"username": "guess@example.com", "password": "wrong"},
+                                   headers={"X-Forwarded-For": "203.0.113.7"})
+    assert response.status_code == 429
+    # Other clients behind the same proxy are not affected
+    response = proxied_client.post("/auth/login", data={"username": "guess@example.com", "password": "wrong"},
+                                   headers={"X-Forwarded-For": "203.0.113.8"})
+    assert response.status_code == 401
@@ -0,0 +1,53 @@
+import time
+
+import pytest
+
+from app.schemas import UserResponseSchema
+from app.services.auth_cache import PrincipalCache
+
+
+@pytest.fixture
+def principal_cache():
+    return PrincipalCache(max_size=2, ttl_seconds=60)
+
+
+def make_user(email: str) -> UserResponseSchema:
+    return UserResponseSchema(id=email, username=email.split("@")[0], email=email)
+
+
+def test_cache_hit_and_miss(principal_cache):
+    assert principal_cache.get("token1") is None
+    principal_cache.set("token1", make_user("user1@example.com"))
+
+    user = principal_cache.get("token1")
+    assert user.email == "user1@example.com"
+    assert principal_cache.hits == 1
+    assert principal_cache.misses == 1
+    assert principal_cache.hit_ratio == 0.5
+
+
+def test_cache_respects_token_expiry(principal_cache):
+    principal_cache.set("expired", make_user("user1@example.com"), exp=int(time.time()) - 1)
+    assert principal_cache.get("expired") is None
+    assert principal_cache.size == 0
+
+
+def test_cache_evicts_least_recently_used(principal_cache):
+    principal_cache.set("token1", make_user("user1@example.com"))
+    principal_cache.set("token2", make_user("user2@example.com"))
+    principal_cache.get("token1")
+    principal_cache.set("token3", make_user("user3@example.com"))
+
+    assert principal_cache.get("token2") is None
+    assert principal_cache.get("token1") is not None
+    assert principal_cache.get("token3") is not None
+
+
+def test_invalidate_user(principal_cache):
+    principal_cache.set("token1", make_user("user1@example.com"))
+    principal_cache.set("token2", make_user("user1@example.com"))
+    principal_cache.invalidate_user("user1@example.com")
+
+    assert principal_cache.get("token1") is None
+    assert principal_cache.get("token2") is None
+    assert principal_cache.size == 0
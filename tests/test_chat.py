@@ -1,17 +1,25 @@
+import asyncio
 import datetime
+import hashlib
+import io
 import os
+from unittest.mock import AsyncMock
 
 import pytest
+from bson import ObjectId
 from httpx import AsyncClient
+from PIL import Image
 
-from app.schemas import ChatRoomCreateSchema, MessageCreateSchema
+from app.routers import socketio_routes
+from app.schemas import ChatRoomCreateSchema, MessageCreateSchema, MessagePageResponseSchema
+from app.services.connection_manager import connection_manager
 
 
 # Helper function to sign up and log in
-async def sign_up_and_login(async_client: AsyncClient, email: str, password: str):
+async def sign_up_and_login(async_client: AsyncClient, email: str, password: str, username: str = "testuser"):
     # Sign up a new user
     response = await async_client.post("/auth/signup", json={
-        "username": "testuser",
+        "username": username,
         "email": email,
         "password": password
     })
@@ -93,6 +101,38 @@ async def test_get_chat_room(async_client: AsyncClient, clear_db):
     assert response_data["name"] == "Test Room"
 
 
+@pytest.mark.asyncio
+async def test_get_chat_room_summary(async_client: AsyncClient, clear_db):
+    token = await sign_up_and_login(async_client, "testchat@example.com", "password123")
+    chat_room_id = await create_new_chat_room(async_client, token, "Test Room")
+
+    for i in range(3):
+        message_data = MessageCreateSchema(sender="testchat@example.com", content=f"message {i}",
+                                           timestamp="2024-08-13T00:00:00Z")
+        await async_client.post(
+            f"/chat/chat_rooms/{chat_room_id}/messages",
+            json=message_data.model_dump(),
+            headers={"Authorization": f"Bearer {token}"}
+        )
+
+    # The summary only carries the latest messages and the total count
+    response = await async_client.get(
+        f"/chat/chat_rooms/{chat_room_id}?limit=2",
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 200
+    response_data = response.json()
+    assert response_data["message_count"] == 3
+    assert [m["content"] for m in response_data["messages"]] == ["message 1", "message 2"]
+
+    # The full history is opt-in
+    response = await async_client.get(
+        f"/chat/chat_rooms/{chat_room_id}?include=messages",
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert len(response.json()["messages"]) == 3
+
+
 @pytest.mark.asyncio
 async def test_create_message(async_client: AsyncClient, clear_db):
     # Sign up and log in to get the token
@@ -130,6 +170,46 @@ async def test_create_message(async_client: AsyncClient, clear_db):
     assert data["content"] == "Hello, world!"
 
 
+async def connect_socket(token: str, eio_sid: str) -> str:
+    """Open a Socket.IO connection through the connect handler, without a transport."""
+    sid = await connection_manager.sio.manager.connect(eio_sid, '/')
+    await socketio_routes.connect(connection_manager.sio, sid, {"HTTP_AUTHORIZATION": f"Bearer {token}"})
+    return sid
+
+
+@pytest.mark.asyncio
+async def test_connected_members_receive_room_broadcasts(async_client: AsyncClient, clear_db, monkeypatch):
+    sent = []
+
+    async def record_packet(eio_sid, eio_pkt):
+        sent.append((eio_sid, eio_pkt.data))
+
+    monkeypatch.setattr(connection_manager.sio, "_send_eio_packet", record_packet)
+    monkeypatch.setattr(connection_manager.sio, "save_session", AsyncMock())
+    alice_token = await sign_up_and_login(async_client, "alice@example.com", "password123", username="alice")
+    bob_token = await sign_up_and_login(async_client, "bob@example.com", "password123", username="bob")
+    # Bob is connected before the room exists, Alice connects after it was created
+    bob_sid = await connect_socket(bob_token, "eio-bob")
+    response = await async_client.post("/chat/chat_rooms/", json={"name": "Trip", "members": ["bob@example.com"]},
+                                        headers={"Authorization": f"Bearer {alice_token}"})
+    room_id = response.json()["id"]
+    alice_sid = await connect_socket(alice_token, "eio-alice")
+
+    response = await async_client.post(f"/chat/chat_rooms/{room_id}/messages",
+                                       json={"sender": "alice@example.com", "content": "Train at seven",
+                                             "timestamp": ""},
+                                       headers={"Authorization": f"Bearer {alice_token}"})
+    assert response.status_code == 201
+    await connection_manager.flush()
+
+    for eio_sid in ("eio-bob", "eio-alice"):
+        frames = [frame for recipient, frame in sent if recipient == eio_sid]
+        assert any(frame.startswith('2["broadcast_message"') and "Train at seven" in frame for frame in frames)
+    for sid in (bob_sid, alice_sid):
+        await socketio_routes.disconnect(connection_manager.sio, sid)
+        await connection_manager.sio.manager.disconnect(sid, '/')
+
+
 @pytest.mark.asyncio
 async def test_get_all_messages(async_client: AsyncClient, clear_db):
     # Sign up and log in to get the token
@@ -167,8 +247,221 @@ async def test_get_all_messages(async_client: AsyncClient, clear_db):
 
     # Verify the response data
     response_data = response.json()
-    assert len(response_data) > 0
-    assert response_data[0]["content"] == "Hello, world!"
+    assert len(response_data["messages"]) > 0
+    assert response_data["messages"][0]["content"] == "Hello, world!"
+    assert response_data["next_cursor"] is None
+    # The page is encoded without passing through the response model, so check it still matches it
+    assert MessagePageResponseSchema.model_validate(response_data).model_dump() == response_data
+
+
+@pytest.mark.asyncio
+async def test_get_messages_pagination(async_client: AsyncClient, clear_db):
+    # Sign up and log in to get the token
+    token = await sign_up_and_login(async_client, "testchat@example.com", "password123")
+    chat_room_id = await create_new_chat_room(async_client, token, "Test Room")
+
+    # Post five messages
+    for i in range(5):
+        message_data = MessageCreateSchema(sender="testchat@example.com", content=f"message {i}",
+                                           timestamp="2024-08-13T00:00:00Z")
+        await async_client.post(
+            f"/chat/chat_rooms/{chat_room_id}/messages",
+            json=message_data.model_dump(),
+            headers={"Authorization": f"Bearer {token}"}
+        )
+
+    # The first page holds the newest messages, oldest first
+    response = await async_client.get(
+        f"/chat/chat_rooms/{chat_room_id}/messages?limit=2",
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 200
+    page = response.json()
+    assert [m["content"] for m in page["messages"]] == ["message 3", "message 4"]
+    assert page["next_cursor"] == page["messages"][0]["id"]
+
+    # Scroll back with the cursor
+    response = await async_client.get(
+        f"/chat/chat_rooms/{chat_room_id}/messages?limit=2&before={page['next_cursor']}",
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    page = response.json()
+    assert [m["content"] for m in page["messages"]] == ["message 1", "message 2"]
+
+    # Read forward from the oldest message
+    response = await async_client.get(
+        f"/chat/chat_rooms/{chat_room_id}/messages?limit=10&after={page['messages'][0]['id']}",
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    page = response.json()
+    assert [m["content"] for m in page["messages"]] == ["message 2", "message 3", "message 4"]
+    assert page["next_cursor"] is None
+
+
+@pytest.mark.asyncio
+async def test_get_messages_invalid_cursor(async_client: AsyncClient, clear_db):
+    token = await sign_up_and_login(async_client, "testchat@example.com", "password123")
+    chat_room_id = await create_new_chat_room(async_client, token, "Test Room")
+
+    response = await async_client.get(
+        f"/chat/chat_rooms/{chat_room_id}/messages?before=not-a-cursor",
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_inbox(async_client: AsyncClient, clear_db):
+    alice = await sign_up_and_login(async_client, "alice@example.com", "password123", username="alice")
+    bob = await sign_up_and_login(async_client, "bob@example.com", "password123", username="bob")
+    alice_headers = {"Authorization": f"Bearer {alice}"}
+    bob_headers = {"Authorization": f"Bearer {bob}"}
+
+    response = await async_client.post("/chat/chat_rooms/", json={"name": "Alice and Bob",
+                                                                  "members": ["bob@example.com"]},
+                                       headers=alice_headers)
+    private_room_id = response.json()["id"]
+    assert response.json()["is_group_chat"] is False
+    group_room_id = await create_new_chat_room(async_client, alice, "Alice alone")
+
+    # The newest room comes first until a message is posted to the other one
+    response = await async_client.get("/chat/inbox/", headers=alice_headers)
+    assert [entry["room_id"] for entry in response.json()["entries"]] == [group_room_id, private_room_id]
+
+    for content in ("hello bob", "are you there?"):
+        response = await async_client.post(f"/chat/chat_rooms/{private_room_id}/messages", json={
+            "sender": "alice@example.com", "content": content, "timestamp": datetime.datetime.now().isoformat()
+        }, headers=alice_headers)
+        assert response.status_code == 201
+
+    response = await async_client.get("/chat/inbox/", headers=alice_headers)
+    entries = response.json()["entries"]
+    assert [entry["room_id"] for entry in entries] == [private_room_id, group_room_id]
+    assert entries[0]["last_message"]["preview"] == "are you there?"
+    assert entries[0]["unread_count"] == 0  # Alice's own messages
+    assert entries[0]["peer_email"] == "bob@example.com"
+    assert entries[0]["is_online"] is False
+
+    response = await async_client.get("/chat/inbox/", params={"type": "private"}, headers=bob_headers)
+    entries = response.json()["entries"]
+    assert len(entries) == 1
+    assert entries[0]["unread_count"] == 2
+    assert entries[0]["peer_email"] == "alice@example.com"
+
+    # Pages follow the cursor
+    response = await async_client.get("/chat/inbox/", params={"limit": 1}, headers=alice_headers)
+    first_page = response.json()
+    assert first_page["next_cursor"] is not None
+    response = await async_client.get("/chat/inbox/", params={"limit": 1, "before": first_page["next_cursor"]},
+                                      headers=alice_headers)
+    assert [entry["room_id"] for entry in response.json()["entries"]] == [group_room_id]
+
+    response = await async_client.get("/chat/private_chats/", headers=bob_headers)
+    assert response.json() == [{"id": private_room_id, "other_user_email": "alice@example.com", "is_online": False}]
+
+
+@pytest.mark.asyncio
+async def test_mark_read(async_client: AsyncClient, clear_db):
+    from app.services.read_receipts import read_receipt_service
+
+    alice = await sign_up_and_login(async_client, "alice@example.com", "password123", username="alice")
+    bob = await sign_up_and_login(async_client, "bob@example.com", "password123", username="bob")
+    response = await async_client.post("/chat/chat_rooms/", json={"name": "Alice and Bob",
+                                                                  "members": ["bob@example.com"]},
+                                       headers={"Authorization": f"Bearer {alice}"})
+    room_id = response.json()["id"]
+
+    message_ids = []
+    for i in range(3):
+        response = await async_client.post(f"/chat/chat_rooms/{room_id}/messages", json={
+            "sender": "alice@example.com", "content": f"message {i}", "timestamp": datetime.datetime.now().isoformat()
+        }, headers={"Authorization": f"Bearer {alice}"})
+        message_ids.append(response.json()["id"])
+
+    bob_headers = {"Authorization": f"Bearer {bob}"}
+    response = await async_client.post(f"/chat/chat_rooms/{room_id}/read", json={"message_id": message_ids[0]},
+                                       headers=bob_headers)
+    assert response.status_code == 202
+    await read_receipt_service.flush()
+
+    entry = (await async_client.get("/chat/inbox/", headers=bob_headers)).json()["entries"][0]
+    assert entry["last_read_id"] == message_ids[0]
+    assert entry["unread_count"] == 2
+
+    # An older cursor does not move the read position back
+    await async_client.post(f"/chat/chat_rooms/{room_id}/read", json={"message_id": message_ids[2]},
+                            headers=bob_headers)
+    await async_client.post(f"/chat/chat_rooms/{room_id}/read", json={"message_id": message_ids[1]},
+                            headers=bob_headers)
+    await read_receipt_service.flush()
+    entry = (await async_client.get("/chat/inbox/", headers=bob_headers)).json()["entries"][0]
+    assert entry["last_read_id"] == message_ids[2]
+    assert entry["unread_count"] == 0
+
+    response = await async_client.post(f"/chat/chat_rooms/{room_id}/read", json={"message_id": "not-a-cursor"},
+                                       headers=bob_headers)
+    assert response.status_code == 400
+
+    # Only messages of the room move the cursor
+    other_room_id = await create_new_chat_room(async_client, bob, "Bob alone")
+    response = await async_client.post(f"/chat/chat_rooms/{other_room_id}/read", json={"message_id": message_ids[2]},
+                                       headers=bob_headers)
+    assert response.status_code == 404
+    response = await async_client.post(f"/chat/chat_rooms/{room_id}/read", json={"message_id": str(ObjectId())},
+                                       headers=bob_headers)
+    assert response.status_code == 404
+
+    # A timestamp reads up to the latest message at that time
+    response = await async_client.post(f"/chat/chat_rooms/{room_id}/read",
+                                       json={"message_id": datetime.datetime.now(datetime.timezone.utc).isoformat()},
+                                       headers=bob_headers)
+    assert response.json()["message_id"] == message_ids[2]
+
+
+@pytest.mark.asyncio
+async def test_search_messages(async_client: AsyncClient, clear_db):
+    alice = await sign_up_and_login(async_client, "alice@example.com", "password123", username="alice")
+    bob = await sign_up_and_login(async_client, "bob@example.com", "password123", username="bob")
+    alice_headers = {"Authorization": f"Bearer {alice}"}
+    bob_headers = {"Authorization": f"Bearer {bob}"}
+    shared_room_id = (await async_client.post("/chat/chat_rooms/", json={"name": "Alice and Bob",
+                                                                         "members": ["bob@example.com"]},
+                                              headers=alice_headers)).json()["id"]
+    private_room_id = await create_new_chat_room(async_client, alice, "Alice alone")
+
+    messages = [(shared_room_id, "Lunch on Friday?"), (shared_room_id, "Friday lunch works for me"),
+                (shared_room_id, "See you on friday"), (private_room_id, "Buy lunch for Friday")]
+    for room_id, content in messages:
+        response = await async_client.post(f"/chat/chat_rooms/{room_id}/messages", json={
+            "sender": "alice@example.com", "content": content, "timestamp": datetime.datetime.now().isoformat()
+        }, headers=alice_headers)
+        assert response.status_code == 201
+
+    # Messages with both words rank first, newest first; the private room is not visible to Bob
+    response = await async_client.get("/chat/search", params={"q": "friday LUNCH"}, headers=bob_headers)
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [result["content"] for result in results] == ["Friday lunch works for me", "Lunch on Friday?",
+                                                         "See you on friday"]
+    assert [result["score"] for result in results] == [2, 2, 1]
+    assert {result["room_id"] for result in results} == {shared_room_id}
+
+    response = await async_client.get("/chat/search", params={"q": "lunch", "room_id": private_room_id},
+                                      headers=alice_headers)
+    assert [result["content"] for result in response.json()["results"]] == ["Buy lunch for Friday"]
+    response = await async_client.get("/chat/search", params={"q": "lunch", "room_id": private_room_id},
+                                      headers=bob_headers)
+    assert response.status_code == 404
+
+    # Pages follow the cursor
+    response = await async_client.get("/chat/search", params={"q": "friday", "limit": 3}, headers=alice_headers)
+    first_page = response.json()
+    assert len(first_page["results"]) == 3
+    response = await async_client.get("/chat/search", params={"q": "friday", "limit": 3,
+                                                              "cursor": first_page["next_cursor"]},
+                                      headers=alice_headers)
+    assert [result["content"] for result in response.json()["results"]] == ["Lunch on Friday?"]
+    assert response.json()["next_cursor"] is None
 
 
 @pytest.mark.asyncio
@@ -205,4 +498,109 @@ async def test_upload_media(async_client: AsyncClient, clear_db):
     assert response.status_code == 200
     response_data = response.json()
     assert "file_url" in response_data
-    assert response_data["file_url"].endswith("test_media_file.txt")
+    # Files are stored under their content hash
+    assert response_data["file_url"] == f"/chat/media/{hashlib.sha256(test_file_content).hexdigest()}"
+
+    download = await async_client.get(response_data["file_url"], headers={"Authorization": f"Bearer {token}"})
+    assert download.status_code == 200
+    assert download.content == test_file_content
+    assert download.headers["content-type"].startswith("text/plain")
+
+
+@pytest.mark.asyncio
+async def test_upload_media_generates_previews(async_client: AsyncClient, clear_db):
+    token = await sign_up_and_login(async_client, "testchat@example.com", "password123")
+    headers = {"Authorization": f"Bearer {token}"}
+    buffer = io.BytesIO()
+    Image.new("RGB", (640, 480), "blue").save(buffer, "PNG")
+
+    # The client's content type is ignored in favour of the sniffed one
+    response = await async_client.post("/chat/upload_media/",
+                                       files={"file": ("photo.png", buffer.getvalue(), "application/octet-stream")},
+                                       headers=headers)
+    media = response.json()
+    assert media["mime_type"] == "image/png"
+    assert "thumbnail" in media["previews"]
+
+    for _ in range(100):
+        status_response = await async_client.get(media["status_url"], headers=headers)
+        if status_response.json()["status"] != "pending":
+            break
+        await asyncio.sleep(0.05)
+    status_data = status_response.json()
+    assert status_data["status"] == "done"
+    assert (status_data["width"], status_data["height"]) == (640, 480)
+
+    thumbnail = await async_client.get(status_data["previews"]["thumbnail"], headers=headers)
+    assert thumbnail.status_code == 200
+    assert thumbnail.headers["content-type"] == "image/jpeg"
+
+
+@pytest.mark.asyncio
+async def test_upload_media_deduplicates_content(async_client: AsyncClient, clear_db):
+    token = await sign_up_and_login(async_client, "testchat@example.com", "password123")
+    headers = {"Authorization": f"Bearer {token}"}
+
+    urls = set()
+    for filename, content_type in (("first.png", "image/png"), ("second.png", "image/png"),
+                                   ("notes.txt", "text/plain"), ("no_extension", "application/octet-stream")):
+        response = await async_client.post("/chat/upload_media/",
+                                           files={"file": (filename, b"same bytes", content_type)}, headers=headers)
+        assert response.status_code == 200
+        urls.add(response.json()["file_url"])
+    assert len(urls) == 1
+
+
+@pytest.mark.asyncio
+async def test_upload_media_too_large(async_client: AsyncClient, clear_db, monkeypatch, media_directory):
+    from app.services.media_storage import media_storage
+    monkeypatch.setattr(media_storage, "max_upload_bytes", 10)
+    monkeypatch.setattr(media_storage, "chunk_size", 4)
+    token = await sign_up_and_login(async_client, "testchat@example.com", "password123")
+
+    response = await async_client.post("/chat/upload_media/", files={"file": ("big.bin", b"x" * 11)},
+                                       headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 413
+    # Nothing is left behind, not even a temporary file
+    assert [files for _, _, files in os.walk(media_directory) if files] == []
+
+
+@pytest.mark.asyncio
+async def test_upload_media_too_large_rejected_before_parsing(async_client: AsyncClient, clear_db, monkeypatch):
+    from app.services.media_storage import media_storage
+    monkeypatch.setattr(media_storage, "max_upload_bytes", 10)
+    save = AsyncMock()
+    monkeypatch.setattr(media_storage, "save", save)
+    token = await sign_up_and_login(async_client, "testchat@example.com", "password123")
+
+    response = await async_client.post("/chat/upload_media/", files={"file": ("big.bin", b"x" * 100_000)},
+                                       headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 413
+    save.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_download_media_range(async_client: AsyncClient, clear_db):
+    token = await sign_up_and_login(async_client, "testchat@example.com", "password123")
+    headers = {"Authorization": f"Bearer {token}"}
+    content = bytes(range(100))
+    response = await async_client.post("/chat/upload_media/", files={"file": ("data.bin", content)}, headers=headers)
+    file_url = response.json()["file_url"]
+
+    response = await async_client.get(file_url, headers={**headers, "Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.content == content[10:20]
+    assert response.headers["Content-Range"] == "bytes 10-19/100"
+
+    # Resume from an offset, and fetch the last bytes
+    response = await async_client.get(file_url, headers={**headers, "Range": "bytes=90-"})
+    assert response.content == content[90:]
+    response = await async_client.get(file_url, headers={**headers, "Range": "bytes=-5"})
+    assert response.content == content[95:]
+
+    response = await async_client.get(file_url, headers={**headers, "Range": "bytes=100-"})
+    assert response.status_code == 416
+    assert response.headers["Content-Range"] == "bytes */100"
+
+    response = await async_client.get("/chat/media/../../app/main.py", headers=headers)
+    assert response.status_code == 404
@@ -0,0 +1,138 @@
+import asyncio
+from datetime import datetime, timezone
+
+import msgpack
+import pytest
+
+from app.services import socketio_json, socketio_msgpack
+from app.services.connection_manager import ConnectionManager, SocketIOMessage
+from app.services.pubsub_managers import InProcessBus, InProcessPubSubManager
+
+
+async def start_worker(bus: InProcessBus):
+    """Create a connection manager that behaves like a separate worker and records the frames it sends."""
+    worker = ConnectionManager(client_manager=InProcessPubSubManager(bus=bus))
+    worker.sent = []
+
+    async def record_packet(eio_sid, eio_pkt):
+        worker.sent.append((eio_sid, eio_pkt.data))
+
+    worker.sio._send_eio_packet = record_packet
+    worker.sio.manager.initialize()
+    return worker
+
+
+async def connect_socket(worker: ConnectionManager, eio_sid: str) -> str:
+    return await worker.sio.manager.connect(eio_sid, '/')
+
+
+@pytest.fixture
+async def workers():
+    bus = InProcessBus()
+    started = [await start_worker(bus) for _ in range(3)]
+    yield started
+    for worker in started:
+        worker.sio.manager.thread.cancel()
+
+
+@pytest.mark.asyncio
+async def test_broadcast_reaches_sockets_on_other_workers(workers):
+    sender, *receivers = workers
+    sids = []
+    for i, worker in enumerate(receivers):
+        sid = await connect_socket(worker, f"eio{i}")
+        await worker.connect("room1", sid)
+        sids.append(sid)
+
+    message = SocketIOMessage(sender="user1@example.com", content="hello", timestamp=datetime.now(timezone.utc))
+    await sender.broadcast("room1", message)
+    await asyncio.sleep(0.05)
+
+    for worker in receivers:
+        assert len(worker.sent) == 1
+        assert "hello" in worker.sent[0][1]
+    assert sender.sent == []
+
+
+@pytest.mark.asyncio
+async def test_room_membership_across_workers(workers):
+    owner, other, _ = workers
+    sid = await connect_socket(owner, "eio0")
+
+    # Join from a worker that does not hold the socket
+    await other.sio.enter_room(sid, "room1")
+    await asyncio.sleep(0.05)
+    assert sid in dict(owner.sio.manager.get_participants('/', "room1"))
+
+    await other.send(sid, "direct message")
+    await asyncio.sleep(0.05)
+    assert len(owner.sent) == 1
+    assert "direct message" in owner.sent[0][1]
+
+
+@pytest.mark.asyncio
+async def test_broadcast_sends_one_frame_per_recipient(workers):
+    sender, receiver, _ = workers
+    sid = await connect_socket(receiver, "eio0")
+    await receiver.connect("room1", sid)
+
+    message = SocketIOMessage(sender="user1@example.com", content="hello", timestamp=datetime.now(timezone.utc))
+    await sender.broadcast("room1", message)
+    await sender.broadcast("room1", message, legacy_chat_response=True)
+    await asyncio.sleep(0.05)
+
+    frames = [frame for _, frame in receiver.sent]
+    assert len(frames) == 3
+    assert frames[0] == '2["broadcast_message",' + message.model_dump_json() + ']'
+    assert frames[2] == '2["chat_response",{"room_id":"room1","message":' + message.model_dump_json() + '}]'
+
+
+def test_encoded_payload_survives_the_message_queue():
+    message = SocketIOMessage(sender="user1@example.com", content="hello", timestamp=datetime.now(timezone.utc))
+    # Shape of what the pub/sub managers publish to other workers
+    published = socketio_json.dumps({'method': 'emit', 'data': [socketio_json.encode_payload(message)]})
+    assert socketio_json.loads(published)['data'] == [message.model_dump(mode='json')]
+
+
+@pytest.mark.asyncio
+async def test_msgpack_clients_get_compact_binary_frames():
+    bus = InProcessBus()
+    workers = []
+    for _ in range(2):
+        worker = ConnectionManager(client_manager=InProcessPubSubManager(bus=bus), msgpack=True,
+                                   msgpack_client_manager=InProcessPubSubManager(bus=bus, channel="socketio_msgpack"))
+        worker.sent = []
+
+        async def record_packet(eio_sid, eio_pkt, worker=worker):
+            worker.sent.append(eio_pkt.data)
+
+        for server in worker.servers:
+            server._send_eio_packet = record_packet
+            server.manager.initialize()
+        workers.append(worker)
+    sender, receiver = workers
+    json_sid = await receiver.sio.manager.connect("eio0", '/')
+    msgpack_sid = await receiver.msgpack_sio.manager.connect("eio1", '/')
+    await receiver.connect("room1", json_sid)
+    await receiver.connect("room1", msgpack_sid, server=receiver.msgpack_sio)
+
+    timestamp = datetime.now(timezone.utc)
+    await sender.broadcast("room1", SocketIOMessage(sender="user1@example.com", content="hello", timestamp=timestamp))
+    await asyncio.sleep(0.05)
+
+    # One JSON text frame and one MessagePack frame, each relayed once through its own channel
+    assert len(receiver.sent) == 2
+    json_frame, msgpack_frame = sorted(receiver.sent, key=lambda frame: isinstance(frame, bytes))
+    assert '"content":"hello"' in json_frame
+    packet = msgpack.unpackb(msgpack_frame, timestamp=3)
+    assert packet["data"] == ["broadcast_message", {"s": "user1@example.com", "c": "hello", "t": timestamp}]
+    assert len(msgpack_frame) < len(json_frame)
+    for worker in workers:
+        for server in worker.servers:
+            server.manager.thread.cancel()
+
+
+def test_msgpack_packet_expands_compact_keys():
+    encoded = socketio_msgpack.dumps({"type": 2, "nsp": "/", "data": ["mark_read", {"rm": "room1", "mi": "abc"}]})
+    packet = socketio_msgpack.CompactMsgPackPacket(encoded_packet=encoded)
+    assert packet.data == ["mark_read", {"room": "room1", "message_id": "abc"}]
@@ -0,0 +1,83 @@
+import asyncio
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from app.services.media_processor import MediaProcessor, sniff_mime_type, process_media
+
+
+def make_png(width: int, height: int) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), "red").save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def store(directory, media_id: str, content: bytes) -> str:
+    path = os.path.join(directory, media_id[:2], media_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(content)
+    return path
+
+
+@pytest.mark.parametrize("head, mime_type", [
+    (b"\x89PNG\r\n\x1a\n....", "image/png"),
+    (b"\xff\xd8\xff\xe0....", "image/jpeg"),
+    (b"RIFF\x00\x00\x00\x00WEBPVP8 ", "image/webp"),
+    (b"\x00\x00\x00\x18ftypmp42", "video/mp4"),
+    (b"%PDF-1.7", "application/pdf"),
+    (b"hello world", "text/plain"),
+    (b"\xff\xfe\x00\x81", "application/octet-stream"),
+])
+def test_sniff_mime_type(head, mime_type):
+    assert sniff_mime_type(head) == mime_type
+
+
+def test_process_media_writes_thumbnail_and_metadata(tmp_path):
+    media_id = "a" * 64 + ".png"
+    path = store(tmp_path, media_id, make_png(1000, 500))
+
+    result = process_media(path, "image/png", 320)
+
+    assert result["width"] == 1000
+    assert result["height"] == 500
+    assert result["variants"] == {"thumbnail": "a" * 64 + "-thumb.jpg"}
+    with Image.open(os.path.join(os.path.dirname(path), result["variants"]["thumbnail"])) as thumbnail:
+        assert thumbnail.size == (320, 160)
+    assert os.path.exists(f"{path}.meta.json")
+
+
+@pytest.mark.asyncio
+async def test_jobs_run_in_the_pool_and_report_status(tmp_path):
+    processor = MediaProcessor(max_workers=1)
+    media_id = "b" * 64 + ".png"
+    path = store(tmp_path, media_id, make_png(64, 64))
+
+    job = await processor.submit(media_id, path)
+    assert job["status"] == "pending"
+    assert processor.planned_variants(media_id, job["mime_type"]) == {"thumbnail": "b" * 64 + "-thumb.jpg"}
+    await asyncio.gather(*processor._tasks)
+
+    job = await processor.status(media_id, path)
+    assert job["status"] == "done"
+    assert job["width"] == 64
+    assert processor.stats()["completed"] == 1
+    assert processor.stats()["pending"] == 0
+    processor.shutdown()
+
+    # Another worker finds the result on disk
+    assert (await MediaProcessor().status(media_id, path))["status"] == "done"
+
+
+@pytest.mark.asyncio
+async def test_jobs_beyond_the_queue_limit_are_skipped(tmp_path):
+    processor = MediaProcessor(max_pending=0)
+    media_id = "c" * 64 + ".txt"
+    path = store(tmp_path, media_id, b"plain text")
+
+    job = await processor.submit(media_id, path)
+    assert job["status"] == "skipped"
+    assert job["mime_type"] == "text/plain"
+    assert processor.stats()["skipped"] == 1
@@ -0,0 +1,80 @@
+from unittest.mock import AsyncMock
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from app.services.membership_service import MembershipService
+
+
+@pytest.fixture
+def room_id():
+    return str(ObjectId())
+
+
+@pytest.fixture
+def db_chat_rooms():
+    collection = AsyncMock()
+    collection.find_one.return_value = {"members": ["user1@example.com", "user2@example.com"]}
+    return collection
+
+
+@pytest.mark.asyncio
+async def test_members_are_read_once_and_projected(db_chat_rooms, room_id):
+    membership = MembershipService(db_chat_rooms=db_chat_rooms)
+
+    assert await membership.is_member(room_id, "user1@example.com")
+    assert await membership.is_member(room_id, "user2@example.com")
+    assert not await membership.is_member(room_id, "user3@example.com")
+
+    db_chat_rooms.find_one.assert_awaited_once_with({"_id": ObjectId(room_id)}, {"members": 1, "_id": 0})
+    assert membership.hits == 2
+    assert membership.misses == 1
+
+
+@pytest.mark.asyncio
+async def test_ensure_member_rejects_non_members_and_unknown_rooms(db_chat_rooms, room_id):
+    membership = MembershipService(db_chat_rooms=db_chat_rooms)
+
+    with pytest.raises(HTTPException) as exc_info:
+        await membership.ensure_member(room_id, "user3@example.com")
+    assert exc_info.value.status_code == 404
+
+    db_chat_rooms.find_one.return_value = None
+    with pytest.raises(HTTPException):
+        await membership.ensure_member(str(ObjectId()), "user1@example.com")
+    with pytest.raises(HTTPException):
+        await membership.ensure_member("not-a-room-id", "user1@example.com")
+    # Neither the unknown room nor the invalid id is cached
+    assert membership.size == 1
+
+
+@pytest.mark.asyncio
+async def test_membership_changes_replace_cached_members(db_chat_rooms, room_id):
+    membership = MembershipService(db_chat_rooms=db_chat_rooms)
+    await membership.get_members(room_id)
+
+    membership.set_members(room_id, ["user3@example.com"])
+    assert await membership.is_member(room_id, "user3@example.com")
+    assert not await membership.is_member(room_id, "user1@example.com")
+
+    membership.invalidate(room_id)
+    assert await membership.is_member(room_id, "user1@example.com")
+    assert db_chat_rooms.find_one.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_expired_and_evicted_entries_are_reloaded(db_chat_rooms):
+    membership = MembershipService(max_size=1, ttl_seconds=0, db_chat_rooms=db_chat_rooms)
+    room_id = str(ObjectId())
+    await membership.get_members(room_id)
+    await membership.get_members(room_id)
+    assert db_chat_rooms.find_one.await_count == 2
+
+    membership = MembershipService(max_size=1, db_chat_rooms=db_chat_rooms)
+    first, second = str(ObjectId()), str(ObjectId())
+    await membership.get_members(first)
+    await membership.get_members(second)
+    assert membership.size == 1
+    await membership.get_members(first)
+    assert membership.misses == 3
@@ -0,0 +1,122 @@
+import asyncio
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo.errors import BulkWriteError, ConnectionFailure
+
+from app.services.message_writer import MessageWriter
+
+
+def make_document(room_id: ObjectId, content: str) -> dict:
+    return {"_id": ObjectId(), "room_id": room_id, "sender": "user1@example.com", "content": content,
+            "timestamp": datetime.now(timezone.utc)}
+
+
+@pytest.fixture
+def collections():
+    return AsyncMock(), AsyncMock(), AsyncMock(), AsyncMock()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_messages_are_written_in_one_batch(collections):
+    db_messages, db_chat_rooms, db_inbox, db_message_terms = collections
+    writer = MessageWriter(batch_size=10, flush_interval_ms=20, db_messages=db_messages, db_chat_rooms=db_chat_rooms,
+                           db_inbox=db_inbox, db_message_terms=db_message_terms)
+    room_id = ObjectId()
+
+    documents = [make_document(room_id, f"message {i}") for i in range(5)]
+    await asyncio.gather(*(writer.submit(document) for document in documents))
+
+    db_messages.insert_many.assert_awaited_once()
+    assert db_messages.insert_many.await_args.args[0] == documents
+    # The room counter is bumped once for the whole batch
+    db_chat_rooms.bulk_write.assert_awaited_once()
+    update = db_chat_rooms.bulk_write.await_args.args[0][0]
+    assert update._doc == {"$inc": {"message_count": 5}}
+    # One inbox update for the room's latest message and one for its sender's unread counts
+    inbox_updates = db_inbox.bulk_write.await_args.args[0]
+    assert inbox_updates[0]._doc["$set"]["last_message"]["preview"] == "message 4"
+    assert inbox_updates[1]._filter == {"room_id": room_id, "user": {"$ne": "user1@example.com"}}
+    assert inbox_updates[1]._doc == {"$inc": {"unread_count": 5}}
+    # The search index gets every distinct word of each message in one insert
+    postings = db_message_terms.insert_many.await_args.args[0]
+    assert {posting["term"] for posting in postings} == {"message"}
+    assert len(postings) == 5
+    assert writer.messages_written == 5
+    await writer.close()
+
+
+@pytest.mark.asyncio
+async def test_batch_size_triggers_flush(collections):
+    db_messages, db_chat_rooms, db_inbox, db_message_terms = collections
+    writer = MessageWriter(batch_size=2, flush_interval_ms=1000, db_messages=db_messages, db_chat_rooms=db_chat_rooms,
+                           db_inbox=db_inbox, db_message_terms=db_message_terms)
+    room_id = ObjectId()
+
+    await asyncio.wait_for(
+        asyncio.gather(*(writer.submit(make_document(room_id, str(i))) for i in range(4))), timeout=0.5)
+    assert db_messages.insert_many.await_count == 2
+    await writer.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_documents_are_reported_to_their_senders(collections):
+    db_messages, db_chat_rooms, db_inbox, db_message_terms = collections
+    db_messages.insert_many.side_effect = BulkWriteError({"writeErrors": [{"index": 1, "code": 11000}]})
+    writer = MessageWriter(batch_size=2, flush_interval_ms=20, db_messages=db_messages, db_chat_rooms=db_chat_rooms,
+                           db_inbox=db_inbox, db_message_terms=db_message_terms)
+    room_id = ObjectId()
+
+    results = await asyncio.gather(writer.submit(make_document(room_id, "ok")),
+                                   writer.submit(make_document(room_id, "duplicate")), return_exceptions=True)
+    assert isinstance(results[0], dict)
+    assert isinstance(results[1], HTTPException)
+    update = db_chat_rooms.bulk_write.await_args.args[0][0]
+    assert update._doc == {"$inc": {"message_count": 1}}
+    await writer.close()
+
+
+@pytest.mark.asyncio
+async def test_stored_messages_are_acknowledged_when_follow_up_updates_fail(collections):
+    db_messages, db_chat_rooms, db_inbox, db_message_terms = collections
+    db_inbox.bulk_write.side_effect = ConnectionFailure("inbox unavailable")
+    writer = MessageWriter(batch_size=2, flush_interval_ms=20, db_messages=db_messages, db_chat_rooms=db_chat_rooms,
+                           db_inbox=db_inbox, db_message_terms=db_message_terms)
+    room_id = ObjectId()
+
+    documents = [make_document(room_id, "first"), make_document(room_id, "second")]
+    assert await asyncio.gather(*(writer.submit(document) for document in documents)) == documents
+    assert writer.messages_written == 2
+    assert writer.update_failures == 1
+    await writer.close()
+
+
+@pytest.mark.asyncio
+async def test_full_queue_applies_backpressure(collections):
+    db_messages, db_chat_rooms, db_inbox, db_message_terms = collections
+    blocked = asyncio.Event()
+
+    async def slow_insert(*args, **kwargs):
+        await blocked.wait()
+
+    db_messages.insert_many.side_effect = slow_insert
+    writer = MessageWriter(batch_size=1, flush_interval_ms=0, max_queue_size=1, enqueue_timeout_ms=50,
+                           db_messages=db_messages, db_chat_rooms=db_chat_rooms, db_inbox=db_inbox,
+                           db_message_terms=db_message_terms)
+    room_id = ObjectId()
+
+    in_flight = asyncio.ensure_future(writer.submit(make_document(room_id, "being written")))
+    await asyncio.sleep(0.01)
+    queued = asyncio.ensure_future(writer.submit(make_document(room_id, "queued")))
+    await asyncio.sleep(0.01)
+
+    with pytest.raises(HTTPException) as exc_info:
+        await writer.submit(make_document(room_id, "rejected"))
+    assert exc_info.value.status_code == 503
+
+    blocked.set()
+    await asyncio.gather(in_flight, queued)
+    await writer.close()
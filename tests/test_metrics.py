@@ -0,0 +1,76 @@
+import threading
+
+import pytest
+from httpx import AsyncClient
+
+from app.services.metrics import CallbackMetric, Counter, Histogram, Registry, HTTP_REQUESTS
+
+
+def test_render_prometheus_text():
+    registry = Registry()
+    requests = Counter("requests_total", "Requests.", ("route",), registry=registry)
+    latency = Histogram("latency_seconds", "Latency.", buckets=(0.1, 1), registry=registry)
+    CallbackMetric("queue_depth", "Depth.", lambda: 3, registry=registry)
+    requests.labels('/rooms/{room_id}').inc()
+    requests.labels('/rooms/{room_id}').inc(2)
+    for value in (0.05, 0.1, 0.5, 5):
+        latency.observe(value)
+
+    assert registry.render() == "\n".join([
+        "# HELP requests_total Requests.",
+        "# TYPE requests_total counter",
+        'requests_total{route="/rooms/{room_id}"} 3',
+        "# HELP latency_seconds Latency.",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{le="0.1"} 2',
+        'latency_seconds_bucket{le="1"} 3',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        "latency_seconds_sum 5.65",
+        "latency_seconds_count 4",
+        "# HELP queue_depth Depth.",
+        "# TYPE queue_depth gauge",
+        "queue_depth 3",
+    ]) + "\n"
+
+
+def test_observations_from_many_threads_are_not_lost():
+    latency = Histogram("latency_seconds", "Latency.", ("command",), registry=None)
+
+    def observe():
+        for _ in range(10000):
+            latency.labels("find").observe(0.001)
+
+    threads = [threading.Thread(target=observe) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    counts, total = latency.labels("find").snapshot()
+    assert counts[-1] == 80000
+    assert total == pytest.approx(80.0)
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_labels_requests_by_route(async_client: AsyncClient):
+    await async_client.get("/chat/chat_rooms/0123456789abcdef01234567")
+
+    response = await async_client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'chat_http_requests_total{method="GET",route="/chat/chat_rooms/{room_id}",status="401"}' in response.text
+    assert "chat_cache_hit_ratio{cache=\"principal\"}" in response.text
+
+
+@pytest.mark.asyncio
+async def test_unknown_methods_add_no_series(async_client: AsyncClient):
+    await async_client.request("XMETHOD", "/chat/chat_rooms/0123456789abcdef01234567")
+    series = len(HTTP_REQUESTS._values)
+
+    for i in range(5):
+        response = await async_client.request(f"XMETHOD{i}", "/chat/chat_rooms/0123456789abcdef01234567")
+        assert response.status_code == 405
+
+    assert len(HTTP_REQUESTS._values) == series
+    assert HTTP_REQUESTS.labels("other", "unmatched", "405").value >= 6
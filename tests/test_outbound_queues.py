@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+import socketio
+
+from app.services.outbound_queues import QueuedAsyncManager
+
+
+async def start_server(policy: str, max_queue_size: int = 3):
+    """A server with one healthy and one stalled client that records the frames it sends."""
+    server = socketio.AsyncServer(async_mode='asgi',
+                                  client_manager=QueuedAsyncManager(max_queue_size=max_queue_size, policy=policy))
+    server.sent = {"healthy": [], "stalled": []}
+    stalled = asyncio.Event()
+
+    async def record_packet(eio_sid, eio_pkt):
+        server.sent[eio_sid].append(eio_pkt.data)
+        if eio_sid == "stalled":
+            await stalled.wait()  # The client never reads
+
+    server._send_eio_packet = record_packet
+    server.manager.initialize()
+    for eio_sid in server.sent:
+        sid = await server.manager.connect(eio_sid, '/')
+        await server.manager.enter_room(sid, '/', "room1")
+    return server
+
+
+@pytest.mark.asyncio
+async def test_stalled_client_does_not_delay_the_others():
+    server = await start_server("drop_oldest")
+    for i in range(10):
+        await server.emit('broadcast_message', {'content': f"message {i}"}, room="room1")
+        await asyncio.sleep(0)
+    await asyncio.sleep(0.01)
+
+    assert len(server.sent["healthy"]) == 10
+    # The first frame is stuck in the transport and only the newest three wait behind it
+    assert len(server.sent["stalled"]) == 1
+    stats = server.manager.stats()
+    assert stats["max_depth"] == 3
+    assert stats["dropped"] == 6
+    queued = [frame for _, (frame,) in server.manager.queues["stalled"].frames]
+    assert [frame.data for frame in queued] == [f'2["broadcast_message",{{"content":"message {i}"}}]'
+                                               for i in (7, 8, 9)]
+
+
+@pytest.mark.asyncio
+async def test_coalesce_drops_stale_frames_of_the_same_event():
+    server = await start_server("coalesce")
+    await server.emit('broadcast_message', {'content': "first"}, room="room1")
+    await asyncio.sleep(0)  # The stalled client's transport takes this one
+    await server.emit('broadcast_message', {'content': "second"}, room="room1")
+    for i in range(5):
+        await server.emit('online_users', [f"user{i}"], room="room1")
+    await asyncio.sleep(0.01)
+
+    queued = [frame.data for _, (frame,) in server.manager.queues["stalled"].frames]
+    assert queued == ['2["broadcast_message",{"content":"second"}]', '2["online_users",["user3"]]',
+                      '2["online_users",["user4"]]']
+    # The emits do not yield, so the healthy client's queue was coalesced the same way
+    assert server.sent["healthy"][-2:] == ['2["online_users",["user3"]]', '2["online_users",["user4"]]']
+    assert server.manager.stats()["coalesced"] == 6
+    assert server.manager.stats()["dropped"] == 0
+
+
+@pytest.mark.asyncio
+async def test_disconnect_policy_drops_the_slow_client():
+    server = await start_server("disconnect")
+    stalled_sid = server.manager.sid_from_eio_sid("stalled", '/')
+    for i in range(5):
+        await server.emit('broadcast_message', {'content': f"message {i}"}, room="room1")
+        await asyncio.sleep(0)
+    await asyncio.sleep(0.01)
+
+    assert not server.manager.is_connected(stalled_sid, '/')
+    assert "stalled" not in server.manager.queues
+    assert server.manager.stats()["disconnected"] == 1
+    assert len(server.sent["healthy"]) == 5
@@ -0,0 +1,34 @@
+import pytest
+from passlib.context import CryptContext
+
+from app.services.password_hasher import PasswordHasher
+
+
+@pytest.fixture
+def password_hasher():
+    hasher = PasswordHasher(max_workers=2, max_concurrent_logins=2)
+    yield hasher
+    hasher.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_hash_and_verify(password_hasher):
+    hashed_password = await password_hasher.hash("password123")
+
+    valid, new_hash = await password_hasher.verify_and_update("password123", hashed_password)
+    assert valid
+    assert new_hash is None
+
+    valid, _ = await password_hasher.verify_and_update("wrong-password", hashed_password)
+    assert not valid
+
+
+@pytest.mark.asyncio
+async def test_verify_rehashes_outdated_hash(password_hasher):
+    # A hash made with fewer rounds than configured is upgraded on successful login
+    outdated_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("password123")
+
+    valid, new_hash = await password_hasher.verify_and_update("password123", outdated_hash)
+    assert valid
+    assert new_hash is not None
+    assert new_hash != outdated_hash
@@ -0,0 +1,99 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from app.routers import socketio_routes
+from app.services.membership_service import MembershipService
+from app.services.presence_subscriptions import PresenceSubscriptionService, presence_room
+from app.services.user_status_service import UserStatusService
+
+
+class Cursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for document in self.documents:
+            yield document
+
+
+ROOM1, ROOM2 = str(ObjectId()), str(ObjectId())
+INBOX = [
+    {"user": "alice@example.com", "room_id": ObjectId(ROOM1)},
+    {"user": "alice@example.com", "room_id": ObjectId(ROOM2)},
+    {"user": "bob@example.com", "room_id": ObjectId(ROOM1)},
+    {"user": "carol@example.com", "room_id": ObjectId(ROOM2)},
+]
+
+
+@pytest.fixture
+def presence():
+    db_inbox = MagicMock()
+    db_inbox.find.side_effect = lambda query, projection: Cursor(
+        [entry for entry in INBOX if entry["user"] in query["user"]["$in"]] if "$in" in query["user"]
+        else [entry for entry in INBOX if entry["user"] == query["user"]])
+    membership_service = MembershipService(db_chat_rooms=AsyncMock())
+    membership_service.set_members(ROOM1, ["alice@example.com", "bob@example.com"])
+    membership_service.set_members(ROOM2, ["alice@example.com", "carol@example.com"])
+    return PresenceSubscriptionService(flush_interval_ms=20, connection_manager=AsyncMock(),
+                                       user_status_service=UserStatusService(), membership_service=membership_service,
+                                       db_inbox=db_inbox)
+
+
+@pytest.mark.asyncio
+async def test_subscribe_returns_snapshot_of_members_only(presence):
+    presence.user_status_service.set_user_online("bob@example.com", "sid_bob")
+    presence.user_status_service.set_user_online("carol@example.com", "sid_carol")
+    server = AsyncMock()
+
+    snapshots = await presence.subscribe(server, "sid_alice", "alice@example.com", [ROOM1])
+
+    assert snapshots == [{'room_id': ROOM1, 'online': ["bob@example.com"]}]
+    server.enter_room.assert_awaited_once_with("sid_alice", presence_room(ROOM1))
+    with pytest.raises(HTTPException):
+        await presence.subscribe(server, "sid_bob", "bob@example.com", [ROOM2])
+    # Without a room, only users sharing a room with the caller
+    assert await presence.get_online_users("bob@example.com") == {"bob@example.com"}
+
+
+@pytest.mark.asyncio
+async def test_changes_are_coalesced_per_window(presence):
+    status = presence.user_status_service
+    status.set_user_online("alice@example.com", "sid1")
+    status.set_user_online("bob@example.com", "sid2")
+    # Bob flaps: the reconnect within the window cancels out
+    status.set_sid_offline("sid2")
+    status.set_user_online("bob@example.com", "sid3")
+    status.set_sid_offline("sid3")
+    status.set_user_online("bob@example.com", "sid4")
+
+    await asyncio.sleep(0.1)
+
+    calls = presence.connection_manager.broadcast_event.await_args_list
+    assert sorted(call.args for call in calls) == sorted([
+        (presence_room(ROOM1), 'presence', {'room_id': ROOM1, 'online': ["alice@example.com", "bob@example.com"],
+                                            'offline': []}),
+        (presence_room(ROOM2), 'presence', {'room_id': ROOM2, 'online': ["alice@example.com"], 'offline': []}),
+    ])
+    assert presence.stats() == {"pending": 0, "changes": 6, "coalesced": 4, "events": 2}
+
+    presence.connection_manager.broadcast_event.reset_mock()
+    status.set_sid_offline("sid4")
+    await asyncio.sleep(0.1)
+    presence.connection_manager.broadcast_event.assert_awaited_once_with(
+        presence_room(ROOM1), 'presence', {'room_id': ROOM1, 'online': [], 'offline': ["bob@example.com"]})
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("handler", [socketio_routes.subscribe_presence, socketio_routes.unsubscribe_presence])
+@pytest.mark.parametrize("data", ["rooms", {"rooms": ROOM1}, {"rooms": [{}]}, {"rooms": [ROOM1, 123]}])
+async def test_presence_requests_need_a_list_of_room_ids(handler, data):
+    sio = AsyncMock()
+    await handler(sio, "sid1", data)
+    sio.emit.assert_awaited_once_with('error', {'message': 'Invalid data'}, room="sid1")
@@ -0,0 +1,54 @@
+import pytest
+
+from app.services.rate_limiter import InMemoryRateLimitBackend, RateLimit, RateLimiter
+
+
+@pytest.mark.asyncio
+async def test_bucket_allows_burst_then_refills():
+    backend = InMemoryRateLimitBackend()
+    limit = RateLimit(rate=2, burst=3)
+
+    assert [await backend.take("key", limit, now=100) for _ in range(3)] == [0, 0, 0]
+    assert await backend.take("key", limit, now=100) == pytest.approx(0.5)
+    # One token comes back every half second
+    assert await backend.take("key", limit, now=100.5) == 0
+    assert await backend.take("key", limit, now=100.5) > 0
+    # A full bucket holds no more than the burst
+    assert [await backend.take("key", limit, now=200) for _ in range(4)][-1] > 0
+
+
+@pytest.mark.asyncio
+async def test_memory_is_bounded():
+    backend = InMemoryRateLimitBackend(max_keys=2)
+    limit = RateLimit(rate=1, burst=1)
+    for key in ("a", "b", "c"):
+        await backend.take(key, limit, now=100)
+
+    assert backend.size == 2
+    # The least recently used key was evicted, so its bucket starts full again
+    assert await backend.take("a", limit, now=100) == 0
+    assert await backend.take("c", limit, now=100) > 0
+
+
+@pytest.mark.asyncio
+async def test_rejections_are_counted_per_limit():
+    limiter = RateLimiter(limits={"message": RateLimit(rate=1, burst=2), "off": RateLimit(rate=0, burst=0)})
+    results = [await limiter.hit("message", "user@example.com") for _ in range(3)]
+    assert [result > 0 for result in results] == [False, False, True]
+    assert await limiter.hit("message", "other@example.com") == 0
+    assert await limiter.hit_all([("off", "user@example.com")]) == 0
+
+    assert limiter.stats() == {"message": {"allowed": 3, "rejected": 1}, "off": {"allowed": 0, "rejected": 0}}
+
+
+@pytest.mark.asyncio
+async def test_rejected_checks_take_no_tokens():
+    limiter = RateLimiter(limits={"login_ip": RateLimit(rate=1, burst=3), "login": RateLimit(rate=1, burst=1)})
+    checks = [("login_ip", "10.0.0.1"), ("login", "user@example.com")]
+    assert await limiter.hit_all(checks) == 0
+    assert await limiter.hit_all(checks) > 0
+
+    # The rejected attempt gave its token back to the address
+    results = [await limiter.hit("login_ip", "10.0.0.1") for _ in range(3)]
+    assert [result > 0 for result in results] == [False, False, True]
+    assert limiter.stats()["login_ip"] == {"allowed": 3, "rejected": 1}
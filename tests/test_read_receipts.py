@@ -0,0 +1,106 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from bson import ObjectId
+
+from app.crud import insert_message_batch
+from app.routers import socketio_routes
+from app.services.read_receipts import ReadReceiptService
+
+
+@pytest.fixture
+def read_receipts():
+    db_messages = AsyncMock()
+    db_messages.count_documents.return_value = 3
+    db_inbox = AsyncMock()
+    db_inbox.find_one.return_value = {"last_read_id": ObjectId()}
+    db_inbox.bulk_write.side_effect = lambda updates, ordered: MagicMock(matched_count=len(updates))
+    return ReadReceiptService(flush_interval_ms=20, connection_manager=AsyncMock(), db_inbox=db_inbox,
+                              db_messages=db_messages)
+
+
+@pytest.mark.asyncio
+async def test_marks_are_coalesced_into_one_write(read_receipts):
+    room_id = str(ObjectId())
+    message_ids = sorted(ObjectId() for _ in range(50))
+    # Acknowledgements may arrive out of order while a client scrolls
+    for message_id in reversed(message_ids):
+        read_receipts.mark_read("user1@example.com", room_id, message_id)
+    read_receipts.mark_read("user2@example.com", room_id, message_ids[0])
+    read_receipts.db_inbox.bulk_write.assert_not_awaited()
+
+    await asyncio.sleep(0.1)
+
+    read_receipts.db_inbox.bulk_write.assert_awaited_once()
+    updates = read_receipts.db_inbox.bulk_write.await_args.args[0]
+    assert len(updates) == 2
+    assert updates[0]._doc == {"$set": {"last_read_id": message_ids[-1]}, "$inc": {"unread_count": -3}}
+    assert (read_receipts.marks, read_receipts.writes, read_receipts.flushes) == (51, 2, 1)
+    read_receipts.connection_manager.broadcast_event.assert_any_await(room_id, 'read_receipt', {
+        'room_id': room_id, 'user': "user1@example.com", 'message_id': str(message_ids[-1])
+    })
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_keeps_cursors(read_receipts):
+    room_id = str(ObjectId())
+    message_id = ObjectId()
+    read_receipts.db_inbox.bulk_write.side_effect = [RuntimeError("database unavailable"), MagicMock(matched_count=1)]
+    read_receipts.mark_read("user1@example.com", room_id, message_id)
+
+    with pytest.raises(RuntimeError):
+        await read_receipts.flush()
+    assert read_receipts.pending == {("user1@example.com", room_id): message_id}
+
+    await read_receipts.close()
+    assert read_receipts.pending == {}
+    assert read_receipts.db_inbox.bulk_write.await_count == 2
+
+
+class ConcurrentMessages:
+    """The messages collection, with another message stored by the message writer while unread ones are counted."""
+
+    def __init__(self, db, room_id: ObjectId):
+        self.db = db
+        self.room_id = room_id
+
+    async def count_documents(self, query):
+        count = await self.db["messages"].count_documents(query)
+        document = {"_id": ObjectId(), "room_id": self.room_id, "sender": "alice@example.com", "content": "late",
+                    "timestamp": None}
+        await insert_message_batch(self.db["messages"], self.db["chat_rooms"], [document], db_inbox=self.db["inbox"])
+        return count
+
+
+@pytest.mark.asyncio
+async def test_message_stored_during_flush_stays_unread(setup_db):
+    room_id = ObjectId()
+    for collection_name in ("messages", "inbox"):
+        await setup_db[collection_name].delete_many({"room_id": room_id})
+    message_ids = [ObjectId() for _ in range(3)]
+    await setup_db["messages"].insert_many([
+        {"_id": message_id, "room_id": room_id, "sender": "alice@example.com", "content": "hi", "timestamp": None}
+        for message_id in message_ids
+    ])
+    await setup_db["inbox"].insert_one({"user": "bob@example.com", "room_id": room_id, "last_read_id": room_id,
+                                        "unread_count": 3})
+    read_receipts = ReadReceiptService(connection_manager=AsyncMock(), db_inbox=setup_db["inbox"],
+                                       db_messages=ConcurrentMessages(setup_db, room_id))
+
+    read_receipts.mark_read("bob@example.com", str(room_id), message_ids[1])
+    await read_receipts.close()
+
+    entry = await setup_db["inbox"].find_one({"user": "bob@example.com", "room_id": room_id})
+    assert entry["last_read_id"] == message_ids[1]
+    # The third message and the one stored during the flush
+    assert entry["unread_count"] == 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("data", ["room1", ["room1", "message1"], {"room": "room1"},
+                                  {"room": "room1", "message_id": {"$gt": ""}}])
+async def test_mark_read_event_needs_a_room_and_message_id(data):
+    sio = AsyncMock()
+    await socketio_routes.mark_read(sio, "sid1", data)
+    sio.emit.assert_awaited_once_with('error', {'message': 'Invalid data'}, room="sid1")
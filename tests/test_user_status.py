@@ -1,9 +1,12 @@
 from unittest.mock import AsyncMock, MagicMock
 
 import pytest
+from pymongo.errors import ConnectionFailure
 
 from app.models import UserInDB
 from app.services.chat_service import ChatService
+from app.services.membership_service import MembershipService
+from app.services.presence_backends import InMemoryPresenceBackend, MongoPresenceBackend
 from app.services.user_status_service import UserStatusService
 
 
@@ -29,8 +32,16 @@ def chat_service(user_status_service):
 
     return ChatService(
         db_chat_rooms=db_chat_rooms_mock,
+        db_messages=AsyncMock(),
+        db_inbox=AsyncMock(),
+        db_message_terms=AsyncMock(),
         connection_manager=AsyncMock(),
-        user_status_service=user_status_service
+        user_status_service=user_status_service,
+        message_writer=AsyncMock(),
+        membership_service=MembershipService(db_chat_rooms=db_chat_rooms_mock),
+        media_storage=AsyncMock(),
+        media_processor=AsyncMock(),
+        read_receipt_service=AsyncMock()
     )
 
 
@@ -79,3 +90,68 @@ async def test_get_room_online_users(user_status_service):
     room2_users = user_status_service.get_room_online_users("room2")
     assert len(room2_users) == 1
     assert "sid3" in room2_users
+
+
+@pytest.mark.asyncio
+async def test_set_sid_offline(user_status_service):
+    user_status_service.set_user_online("user1", "sid1")
+    user_status_service.set_user_online("user1", "sid2")
+
+    assert user_status_service.set_sid_offline("sid1") == "user1"
+    assert user_status_service.is_user_online("user1")
+    assert user_status_service.set_sid_offline("sid2") == "user1"
+    assert not user_status_service.is_user_online("user1")
+    assert user_status_service.set_sid_offline("unknown_sid") is None
+
+
+@pytest.mark.asyncio
+async def test_presence_shared_between_workers():
+    backend = InMemoryPresenceBackend()
+    worker1 = UserStatusService(backend=backend, worker_id="worker1")
+    worker2 = UserStatusService(backend=backend, worker_id="worker2")
+
+    worker1.set_user_online("user1", "sid1")
+    await worker1.heartbeat()
+    await worker2.heartbeat()
+    assert worker2.is_user_online("user1")
+
+    worker1.set_sid_offline("sid1")
+    await worker1.heartbeat()
+    await worker2.heartbeat()
+    assert not worker2.is_user_online("user1")
+
+
+@pytest.mark.asyncio
+async def test_presence_expires_for_crashed_worker():
+    backend = InMemoryPresenceBackend()
+    crashed = UserStatusService(backend=backend, worker_id="crashed", ttl_seconds=0)
+    alive = UserStatusService(backend=backend, worker_id="alive")
+
+    crashed.set_user_online("user1", "sid1")
+    await crashed.heartbeat()
+
+    # The crashed worker never refreshes its connections, so they expire
+    await alive.heartbeat()
+    assert not alive.is_user_online("user1")
+
+
+@pytest.mark.asyncio
+async def test_heartbeat_recovers_after_a_failed_touch(setup_db):
+    collection = setup_db["presence"]
+    await collection.delete_many({})
+    backend = MongoPresenceBackend(collection=collection)
+    worker1 = UserStatusService(backend=backend, worker_id="worker1")
+    worker2 = UserStatusService(backend=backend, worker_id="worker2")
+
+    worker1.set_user_online("user1", "sid1")
+    touch = backend.touch
+    backend.touch = AsyncMock(side_effect=ConnectionFailure("connection reset"))
+    with pytest.raises(ConnectionFailure):
+        await worker1.heartbeat()
+
+    # The connection was stored before the failure and is added again on the next heartbeat
+    backend.touch = touch
+    await worker1.heartbeat()
+    await worker2.heartbeat()
+    assert worker2.is_user_online("user1")
+    assert await collection.count_documents({"_id": "sid1"}) == 1